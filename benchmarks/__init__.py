@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 16:05:40
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 16:05:40
+
+# Benchmarks for PgPy, not installed with the package
+# python -m benchmarks.suite --help
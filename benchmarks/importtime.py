@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:48:05
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:48:05
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.synthetic import make_dataset
+
+# Startup time of short scripts, each run is a new python process
+# Results are written as json lines, one object per case :
+#   time : median wall time of the runs (seconds), including the interpreter startup
+#   modules : heavy modules loaded at the end of the script
+
+HEAVY = ("numpy", "pandas", "Bio", "pysam", "pgpy.recipes.maf", "pgpy.core.processing")
+
+REPORT = """
+import sys, json
+print(json.dumps([name for name in %r if name in sys.modules]))
+""" %(HEAVY,)
+
+CASES = {
+    "python" : "",
+    "import" : "import pgpy",
+    # everything import pgpy loaded before recipes were lazy
+    "import_eager" : "import pgpy, pgpy.recipes.maf, pgpy.recipes.divergence, pgpy.recipes.popstats",
+    "fetch" : "from pgpy import VCFIterator\nfor site in VCFIterator(%(vcf)r).fetch() : pass",
+    "fetch_matrix" : "from pgpy import VCFIterator\nfor chunk in VCFIterator(%(vcf)r).fetch_matrix() : pass",
+    "recipe" : "from pgpy import maf\nmaf(%(vcf)r)",
+}
+
+def run_case(name, vcf, repeats=5) :
+    code = CASES[name] %{"vcf" : vcf} + "\n" + REPORT
+    times, modules = [], None
+
+    for _ in range(repeats) :
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+
+        if output.returncode : return {"case" : name, "error" : output.stderr.strip().splitlines()[-1]}
+        modules = json.loads(output.stdout.strip().splitlines()[-1])
+
+    return {"case" : name, "time" : statistics.median(times), "min" : min(times), "repeats" : repeats, "modules" : modules, "error" : None}
+
+def run(cases, outdir, repeats=5, nsamples=10, nsites=200, stream=sys.stdout) :
+    vcf, fasta = make_dataset(outdir, nsamples=nsamples, nsites=nsites)
+    results = []
+
+    for name in cases :
+        result = run_case(name, vcf, repeats)
+        stream.write(json.dumps(result) + "\n")
+        stream.flush()
+        results.append(result)
+
+    return results
+
+def main(argv=None) :
+    parser = argparse.ArgumentParser(description="PgPy startup benchmarks, results are written as json lines")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma separated cases")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of processes per case")
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--output", help="Output file (default : stdout)")
+    args = parser.parse_args(argv)
+
+    cases = args.cases.split(",")
+    for name in cases :
+        if name not in CASES : parser.error("Unknown case : %s" %(name))
+
+    stream = open(args.output, "w") if args.output else sys.stdout
+
+    try :
+        with tempfile.TemporaryDirectory() as outdir :
+            run(cases, outdir, args.repeats, args.samples, args.sites, stream)
+
+    finally :
+        if args.output : stream.close()
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 16:42:18
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 16:42:18
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from queue import Empty
+
+from benchmarks.synthetic import make_dataset
+
+# Time PgPy functions on synthetic datasets
+# Each case runs in its own process to get a clean peak RSS
+# Results are written as json lines, one object per case
+
+SCALES = {
+    "small" : {"nsamples" : 10, "nsites" : 2000},
+    "medium" : {"nsamples" : 100, "nsites" : 20000},
+    "large" : {"nsamples" : 1000, "nsites" : 100000},
+}
+
+def case_fetch(vcf, fasta, ncore) :
+    from pgpy import VCFIterator
+    for site in VCFIterator(vcf).fetch() : pass
+
+def case_fetch_sites(vcf, fasta, ncore) :
+    from pgpy import VCFIterator
+    for site in VCFIterator(vcf).fetch_sites() : site.allele_counts()
+
+def case_fetch_matrix(vcf, fasta, ncore) :
+    from pgpy import VCFIterator
+    for chunk in VCFIterator(vcf).fetch_matrix() : pass
+
+def case_search_positions(vcf, fasta, ncore) :
+    # known positions panel, one query every two sites
+    from pgpy import VCFIterator
+    vcf = VCFIterator(vcf)
+    queries = [(site.contig, site.pos) for site in vcf.fetch_raw()][::2]
+    for contig, position, record in vcf.search_positions(queries) : pass
+
+def case_aln_snps(vcf, fasta, ncore) :
+    from pgpy import VCFIterator
+    from pgpy.core.aln import aln_maker
+    for contig in VCFIterator(vcf).contigs : aln_maker(vcf, fasta, contig)
+
+def case_aln_indels(vcf, fasta, ncore) :
+    from pgpy import VCFIterator
+    from pgpy.core.aln import aln_maker
+    for contig in VCFIterator(vcf).contigs : aln_maker(vcf, fasta, contig, indels=True, check=False)
+
+def case_pairwise_divergence(vcf, fasta, ncore) :
+    from pgpy.recipes.divergence import pairwise_divergence
+    pairwise_divergence(vcf)
+
+def case_pairwise_divergence_matrix(vcf, fasta, ncore) :
+    from pgpy.recipes.divergence import pairwise_divergence
+    pairwise_divergence(vcf, matrix=True)
+
+def case_ref_divergence_wg(vcf, fasta, ncore) :
+    from pgpy.recipes.divergence import ref_divergence_wg
+    ref_divergence_wg(vcf, ncore=ncore)
+
+def case_maf(vcf, fasta, ncore) :
+    from pgpy.recipes.maf import maf
+    maf(vcf, ncore=ncore)
+
+def case_ld_decay(vcf, fasta, ncore) :
+    from pgpy.recipes.ld import ld_decay
+    ld_decay(vcf, maxdist=5000, ncore=ncore)
+
+def case_homhet_window(vcf, fasta, ncore) :
+    from pgpy.recipes.heterozygosity import homhet_window
+    homhet_window(vcf, ncore=ncore)
+
+# name -> (function, uses ncore)
+CASES = {
+    "fetch" : (case_fetch, False),
+    "fetch_sites" : (case_fetch_sites, False),
+    "fetch_matrix" : (case_fetch_matrix, False),
+    "search_positions" : (case_search_positions, False),
+    "aln_snps" : (case_aln_snps, False),
+    "aln_indels" : (case_aln_indels, False),
+    "pairwise_divergence" : (case_pairwise_divergence, False),
+    "pairwise_divergence_matrix" : (case_pairwise_divergence_matrix, False),
+    "ref_divergence_wg" : (case_ref_divergence_wg, True),
+    "maf" : (case_maf, True),
+    "ld_decay" : (case_ld_decay, True),
+    "homhet_window" : (case_homhet_window, True),
+}
+
+def run_child(fun, args, queue) :
+    try :
+        # import time is not part of the measures
+        import pgpy, pgpy.recipes.heterozygosity, pgpy.core.aln
+
+        start = time.perf_counter()
+        fun(* args)
+        elapsed = time.perf_counter() - start
+        
+        # ru_maxrss is in kilobytes on linux and bytes on macos
+        scale = 1 if sys.platform == "darwin" else 1024
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        crss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        queue.put({"time" : elapsed, "peak_rss" : rss, "peak_rss_children" : crss, "error" : None})
+
+    except Exception as e :
+        queue.put({"error" : "%s : %s" %(e.__class__.__name__, e)})
+
+def run_case(name, vcf, fasta, ncore, timeout=None) :
+
+    # timeout : seconds before the case is stopped, no limit when None
+    # a child process killed before sending its result (e.g. out of memory) is reported as an error
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_child, args=(CASES[name][0], (vcf, fasta, ncore), queue))
+    process.start()
+    start, result = time.time(), None
+
+    while result is None :
+        try : result = queue.get(timeout=1)
+        except Empty :
+            if process.exitcode is not None :
+                # last chance for a result sent just before exiting
+                try : result = queue.get(timeout=1)
+                except Empty : result = {"error" : "Child process exited with code %i" %(process.exitcode)}
+
+            elif timeout is not None and time.time() - start > timeout :
+                process.terminate()
+                result = {"error" : "Timeout after %is" %(timeout)}
+
+    process.join()
+    return result
+
+def run(scales, cases, ncores, outdir, ploidy=2, indel_rate=0.05, missing_rate=0.01, stream=sys.stdout, timeout=None) :
+
+    results = []
+
+    for scale in scales :
+        params = dict(SCALES[scale]) if isinstance(scale, str) else dict(scale)
+        sname = scale if isinstance(scale, str) else "custom"
+        vcf, fasta = make_dataset(os.path.join(outdir, sname), ploidy=ploidy, indel_rate=indel_rate,
+            missing_rate=missing_rate, ** params)
+
+        for name in cases :
+            for ncore in (ncores if CASES[name][1] else [1]) :
+                result = {"case" : name, "scale" : sname, "ncore" : ncore, "ploidy" : ploidy, ** params}
+                result.update(run_case(name, vcf, fasta, ncore, timeout))
+                
+                if result["error"] is None :
+                    result["sites_per_sec"] = params["nsites"] / result["time"]
+
+                stream.write(json.dumps(result) + "\n")
+                stream.flush()
+                results.append(result)
+
+    return results
+
+def main(argv=None) :
+    parser = argparse.ArgumentParser(description="PgPy benchmarks, results are written as json lines")
+    parser.add_argument("--scales", default="small", help="Comma separated scales : %s" %(", ".join(SCALES)))
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma separated cases")
+    parser.add_argument("--ncore", default="1,4", help="Comma separated ncore values")
+    parser.add_argument("--samples", type=int, help="Custom scale : number of samples")
+    parser.add_argument("--sites", type=int, help="Custom scale : number of sites")
+    parser.add_argument("--ploidy", type=int, default=2)
+    parser.add_argument("--indel-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.01)
+    parser.add_argument("--outdir", help="Directory for the synthetic datasets (default : temporary)")
+    parser.add_argument("--output", help="Output file (default : stdout)")
+    parser.add_argument("--timeout", type=float, help="Maximum time of each case in seconds (default : no limit)")
+    args = parser.parse_args(argv)
+
+    scales = args.scales.split(",") if args.scales else []
+    if args.samples and args.sites : scales = [{"nsamples" : args.samples, "nsites" : args.sites}]
+
+    cases = args.cases.split(",")
+    for name in cases :
+        if name not in CASES : parser.error("Unknown case : %s" %(name))
+
+    ncores = [int(value) for value in args.ncore.split(",")]
+    stream = open(args.output, "w") if args.output else sys.stdout
+
+    try :
+        if args.outdir : run(scales, cases, ncores, args.outdir, args.ploidy, args.indel_rate, args.missing_rate, stream, args.timeout)
+        else :
+            with tempfile.TemporaryDirectory() as outdir :
+                run(scales, cases, ncores, outdir, args.ploidy, args.indel_rate, args.missing_rate, stream, args.timeout)
+
+    finally :
+        if args.output : stream.close()
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 16:05:40
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 16:05:40
+
+import os
+from itertools import product
+
+import numpy as np
+import pysam
+
+# Synthetic bgzipped / tabix indexed vcf with the matching reference fasta
+
+BASES = np.array(list("ACGT"))
+
+def gt_strings(nalleles, ploidy, phased=False) :
+    # genotype string of each allele combination, index -1 (last value) is missing
+    values = [str(idx) for idx in range(nalleles)] + ["."]
+    sep = "|" if phased else "/"
+    return np.array([sep.join(combination) for combination in product(values, repeat=ploidy)], dtype=object)
+
+def make_dataset(outdir, nsamples=10, ploidy=2, nsites=1000, ncontigs=2, indel_rate=0.05, 
+    missing_rate=0.01, multiallelic_rate=0.05, spacing=50, seed=0, name="synthetic") :
+
+    # Return the vcf and fasta paths, sites are split evenly between contigs
+    # spacing : mean distance between two sites
+
+    os.makedirs(outdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    vcfname = os.path.join(outdir, name + ".vcf")
+    fasta = os.path.join(outdir, name + ".fa")
+
+    csites = [nsites // ncontigs + (idx < nsites % ncontigs) for idx in range(ncontigs)]
+    contigs = {"contig%i" %(idx + 1) : count for idx, count in enumerate(csites)}
+    samples = ["sample%i" %(idx + 1) for idx in range(nsamples)]
+
+    gtstrings = {nalleles : gt_strings(nalleles, ploidy) for nalleles in (2, 3)}
+
+    with open(fasta, "w") as ffasta, open(vcfname, "w") as fvcf :
+
+        fvcf.write("##fileformat=VCFv4.2\n")
+        fvcf.write("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n")
+        fvcf.write("##FORMAT=<ID=DP,Number=1,Type=Integer,Description=\"Read depth\">\n")
+        fvcf.write("##FORMAT=<ID=GQ,Number=1,Type=Integer,Description=\"Genotype quality\">\n")
+
+        positions = {}
+        for contig, count in contigs.items() :
+            gaps = rng.integers(spacing // 2 + 4, spacing + spacing // 2 + 5, size=count)
+            positions[contig] = np.cumsum(gaps)
+            length = int(positions[contig][-1] + spacing) if count else spacing
+            fvcf.write("##contig=<ID=%s,length=%i>\n" %(contig, length))
+
+            sequence = "".join(BASES[rng.integers(0, 4, size=length)])
+            ffasta.write(">%s\n" %(contig))
+            ffasta.write("\n".join(sequence[idx:idx+60] for idx in range(0, length, 60)) + "\n")
+            positions[contig] = (positions[contig], sequence)
+
+        fvcf.write("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + samples) + "\n")
+
+        for contig, (cpositions, sequence) in positions.items() :
+            for position in cpositions :
+                ref = sequence[position - 1]
+                others = [base for base in "ACGT" if base != ref]
+                draw = rng.random()
+
+                if draw < indel_rate / 2 :
+                    alts = [ref + "".join(rng.choice(BASES, size=rng.integers(1, 4)))]
+                elif draw < indel_rate :
+                    ref = sequence[position - 1 : position + 2]
+                    alts = [ref[0]]
+                elif draw < indel_rate + multiallelic_rate :
+                    alts = list(rng.choice(others, size=2, replace=False))
+                else :
+                    alts = [rng.choice(others)]
+
+                nalleles = len(alts) + 1
+                freqs = rng.dirichlet(np.ones(nalleles) * .5)
+                gts = rng.choice(nalleles, size=(nsamples, ploidy), p=freqs)
+                gts[rng.random((nsamples, ploidy)) < missing_rate] = nalleles
+
+                codes = (gts * (nalleles + 1) ** np.arange(ploidy)[::-1]).sum(axis=1)
+                depths = rng.integers(1, 60, size=nsamples)
+                quals = rng.integers(1, 99, size=nsamples)
+                calls = ["%s:%i:%i" %(gt, dp, gq) for gt, dp, gq in zip(gtstrings[min(nalleles, 3)][codes], depths, quals)]
+
+                fvcf.write("\t".join([contig, str(position), ".", ref, ",".join(alts), "%i" %(rng.integers(10, 100)),
+                    "PASS", ".", "GT:DP:GQ"] + calls) + "\n")
+
+    pysam.tabix_compress(vcfname, vcfname + ".gz", force=True)
+    pysam.tabix_index(vcfname + ".gz", preset="vcf", force=True)
+    os.remove(vcfname)
+    pysam.faidx(fasta)
+
+    return vcfname + ".gz", fasta
@@ -2,8 +2,20 @@
 # @Author: jsgounot
 # @Date:   2018-11-21 11:11:24
 # @Last modified by:   jsgounot
-# @Last Modified time: 2018-11-28 11:30:05
+# @Last Modified time: 2026-10-18 21:48:05
 
 from pgpy.core.vcf import VCFIterator, PyVCFError
 from pgpy.core import *
-from pgpy.recipes import *
\ No newline at end of file
+from pgpy import recipes
+
+# recipes names are available here but only loaded on first access
+__all__ = ["VCFIterator", "PyVCFError"] + recipes.__all__
+
+def __getattr__(name) :
+    try : value = recipes.__getattr__(name)
+    except AttributeError : raise AttributeError("module 'pgpy' has no attribute '%s'" %(name)) from None
+    globals()[name] = value
+    return value
+
+def __dir__() :
+    return sorted(set(globals()) | set(recipes.__all__))
@@ -4,43 +4,95 @@
 # @Last modified by:   jsgounot
 # @Last Modified time: 2019-05-24 16:29:00
 
+import os
+import gzip
+
+from pysam import FastaFile
+
 from Bio import SeqIO
 from Bio.Seq import Seq, MutableSeq
 from Bio.SeqRecord import SeqRecord
 from Bio.Align import MultipleSeqAlignment
 from Bio.Alphabet.IUPAC import unambiguous_dna
 
-from pgpy import VCFIterator as VI
+from pgpy.core.vcf import as_iterator
 
 DEBUG = False
 
+# reference bases read at once by snpmatrix_maker to count invariant sites
+REFERENCE_BLOCK = 1000000
+
+# (pid, path) -> reference handle, see get_reference
+REFERENCES = {}
+
 class AlnException(Exception) :
 
     pass
 
+class SeqIOReference() :
+
+    # Fallback for fasta files pysam cannot index (e.g. gzip instead of bgzip)
+    # Mimics the FastaFile interface used here
+
+    def __init__(self, fname) :
+        opener = gzip.open if fname.endswith(".gz") else open
+        with opener(fname, "rt") as f :
+            self.data = {res.id : res.seq for res in SeqIO.parse(f, 'fasta')}
+
+    @property
+    def references(self):
+        return list(self.data)
+
+    @property
+    def lengths(self):
+        return [len(sequence) for sequence in self.data.values()]
+
+    def get_reference_length(self, reference) :
+        return len(self.data[reference])
+
+    def fetch(self, reference, start=None, end=None) :
+        return str(self.data[reference][start:end])
+
+def get_reference(reference) :
+
+    # Return a handle with random access to the reference
+    # Handles are opened once per process, reference can also be an already open handle
+
+    if not isinstance(reference, str) : return reference
+
+    key = (os.getpid(), os.path.abspath(reference))
+    if key not in REFERENCES :
+        try : REFERENCES[key] = FastaFile(reference)
+        except (OSError, ValueError) : REFERENCES[key] = SeqIOReference(reference)
+
+    return REFERENCES[key]
+
 def aln_maker(vcf, reference, contig, start=None, stop=None, vcf_modifier=None, add_ref=False, check=True, alphabet=None,
-    gatkwc2ref=True, wosamples=[], indels=False) :
+    gatkwc2ref=True, wosamples=[], indels=False, end=None) :
 
-    if isinstance(vcf, str) :
-        vcf = VI(vcf, vcf_modifier)
+    # end : alias of stop, as used by fetch kwargs in core.processing
+    stop = end if stop is None else stop
+
+    vcf = as_iterator(vcf, vcf_modifier)
     
     if vcf_modifier :
         vcf.modifier = vcf_modifier
 
-    with open(reference) as f :
-        fdata = SeqIO.parse(f, 'fasta')
-        fdata = {res.id : res.seq for res in fdata}
+    # excluded samples are not decoded
+    if wosamples : vcf = vcf.subset(exclude=wosamples)
+
+    fasta = get_reference(reference)
 
     samples = vcf.samples
     if add_ref and "Reference" in samples : raise AlnException("Cannot add reference : A sample has already this name")
     if add_ref : samples.append("Reference")
 
-    if contig not in fdata :
+    if contig not in fasta.references :
         raise AlnException("Contig not found in the reference sequence : %s" %(contig))
 
     # sequence
     start = start or 0
-    sequence = str(fdata[contig][start:stop])
+    sequence = fasta.fetch(contig, start, stop)
     data = {sample : [MutableSeq(sequence) for i in range(ploidy)] for sample, ploidy in vcf.ploidies.items()}
     if add_ref : data["Reference"] = [sequence]
 
@@ -83,6 +135,11 @@ def _infer_snps(data, vcf, sequence, contig, start, stop, gatkwc2ref, check) :
 
 def _infer_indels(data, vcf, sequence, contig, start, stop, check) :
 
+    # Edits are recorded per reference column and each haplotype is built once at the end
+    # The last column of an insertion holds several characters, all haplotypes
+    # are padded with gaps to the widest value of each column
+    # Later events on a column holding several characters keep the inserted bases (see merge_cell)
+
     def lst_get(lst, index, default) :
         # similar to dict get but for list
         try : return lst[index] or default
@@ -91,11 +148,32 @@ def _infer_indels(data, vcf, sequence, contig, start, stop, check) :
     def add_gap(string, size) :
         return string + (size - len(string)) * "-"
 
-    offset = 0
+    def merge_cell(existing, cell, base) :
+        # event on a column already holding an insertion, base is the reference base of the column
+        # a second insertion is appended, other alleles replace the reference base within existing
+        # (first character of anchored insertions such as G>GGG, last one for TT>TAT)
+        if cell == base : return existing
+        if len(cell) > 1 and cell[0] == base : return existing + cell[1:]
+
+        bidx = len(existing) - 1 if existing[0] != base and existing[-1] == base else 0
+        return existing[:bidx] + cell.strip("-") + existing[bidx+1:]
+
+    def set_cell(hedit, column, cell) :
+        cell = cell.rstrip("-") or "-"
+        base = sequence[column:column+1]
+
+        existing = hedit.get(column)
+        if existing is not None and len(existing) > 1 : cell = merge_cell(existing, cell, base)
+
+        if cell == base : hedit.pop(column, None)
+        else : hedit[column] = cell
+
+    edits = {sample : [{} for mseq in mseqs] for sample, mseqs in data.items()}
+    widths = {}
 
     for contig, position, ref, variants in vcf.fetch(contig=contig, start=start, stop=stop) :
 
-        nposition = position - start - 1 + offset
+        nposition = position - start - 1
 
         if nposition < 0 :
             # Occurs when you have a deletion which start before
@@ -112,10 +190,6 @@ def _infer_indels(data, vcf, sequence, contig, start, stop, check) :
 
         subrefseq = sequence[nposition : nposition + len(ref)]
 
-        # print (ref, subrefseq, position, nposition, offset)
-        # print (sequence)
-        # print (variants)
-
         if check and ref != subrefseq :
             if DEBUG : print (contig, position, nposition, ref, variants)
             raise AlnException("Not the same nucleotide found : Contig : %s - Position : %i - Fasta : %s - VCF : %s" %(
@@ -124,22 +198,123 @@ def _infer_indels(data, vcf, sequence, contig, start, stop, check) :
         maxlen = max(len(alt) for sample, alts in variants.items() for alt in alts if alt)
         if len(ref) > maxlen : maxlen = len(ref)
 
-        # print (position, nposition, len(ref), maxlen)
+        last = nposition + len(ref) - 1
+        if maxlen > len(ref) : widths[last] = max(widths.get(last, 1), maxlen - len(ref) + 1)
 
-        for sample, mseqs in data.items() :
-            for idx in range(len(mseqs)) :
+        for sample, hedits in edits.items() :
+            for idx, hedit in enumerate(hedits) :
                 
                 alt = lst_get(variants.get(sample, []), idx, ref)
                 if alt == "*" : alt = ref # indels info from GATK
                 alt = add_gap(alt, maxlen)
 
-                if maxlen == 1 and alt != ref : data[sample][idx][nposition] = alt 
-                elif maxlen > 1 : data[sample][idx] = data[sample][idx][:nposition] + alt + data[sample][idx][nposition+len(ref):]
+                if maxlen == 1 :
+                    if alt != ref : set_cell(hedit, nposition, alt)
+                    continue
+
+                # multi bases event, overwrite previous single base edits on the columns
+                cells = list(alt[:len(ref) - 1]) + [alt[len(ref) - 1:]]
+                for column, cell in enumerate(cells, start=nposition) :
+                    set_cell(hedit, column, cell)
+
+    # merged insertions can be wider than a single event
+    for hedits in edits.values() :
+        for hedit in hedits :
+            for column, cell in hedit.items() :
+                if len(cell) > widths.get(column, 1) : widths[column] = len(cell)
+
+    for sample, hedits in edits.items() :
+        for idx, hedit in enumerate(hedits) :
+            
+            pieces, previous = [], 0
+            for column in sorted(hedit.keys() | widths.keys()) :
+                pieces.append(sequence[previous:column])
+                pieces.append(add_gap(hedit.get(column, sequence[column:column+1]), widths.get(column, 1)))
+                previous = column + 1
+
+            pieces.append(sequence[previous:])
+            data[sample][idx] = "".join(pieces)
+
+def snpmatrix_maker(vcf, contig=None, start=None, stop=None, reference=None, vcf_modifier=None, add_ref=False,
+    alphabet=None, gatkwc2ref=True, wosamples=[], index=False, end=None) :
+
+    # Alignment made only of the variable columns, built directly from the fetched sites
+    # Alleles are inferred as with aln_maker without indels (first base, missing as reference)
+    # index : also return the (contig, position) of each column and, if reference is given,
+    # the invariant sites base counts of the region, used for ascertainment bias correction
+
+    stop = end if stop is None else stop
+
+    vcf = as_iterator(vcf, vcf_modifier)
+    
+    if vcf_modifier :
+        vcf.modifier = vcf_modifier
+
+    # excluded samples are not decoded
+    if wosamples : vcf = vcf.subset(exclude=wosamples)
+
+    haplotypes = [(sample, idx) for sample, ploidy in vcf.ploidies.items() 
+                  for idx in range(ploidy) if sample not in wosamples]
+    if add_ref and "Reference" in vcf.samples : raise AlnException("Cannot add reference : A sample has already this name")
+
+    columns, positions = [], []
+    lastsite, column = None, None
+
+    def add_column(site, column) :
+        if len(set(column)) > 1 :
+            columns.append(column)
+            positions.append(site)
+
+    for contig_, position, ref, variants in vcf.fetch(contig=contig, start=start, stop=stop) :
+        
+        if start and position - 1 < start : continue # indels outside bounds
+
+        if (contig_, position) != lastsite :
+            if column : add_column(lastsite, column)
+            lastsite = (contig_, position)
+            column = [ref[0]] * len(haplotypes) + ([ref[0]] if add_ref else [])
+
+        for hidx, (sample, idx) in enumerate(haplotypes) :
+            alts = variants.get(sample, ())
+            alt = alts[idx] if idx < len(alts) else None
+            if not alt : continue
+
+            if alt == "*" and gatkwc2ref : continue # indels info from GATK
+            if alt != ref : column[hidx] = alt[0]
+
+    if column : add_column(lastsite, column)
+
+    if add_ref : haplotypes.append(("Reference", 0))
+    sequences = ["".join(values) for values in zip(* columns)] or [""] * len(haplotypes)
+
+    alphabet = alphabet or unambiguous_dna
+    data = {"%s_%i" %(sample, idx + 1) : Seq(sequence, alphabet) for (sample, idx), sequence 
+            in zip(haplotypes, sequences)}
+
+    desc = "%s - %s - %s - variable sites" %(contig, start, stop)
+    aln = MultipleSeqAlignment(SeqRecord(data[sid], id=sid, name=sid, description=desc)
+        for sid in sorted(data))
+
+    if not index : return aln
+
+    counts = None
+    if reference :
+        fasta = get_reference(reference)
+        contigs = [contig] if contig else vcf.contigs
+        counts = {base : 0 for base in "ACGT"}
+
+        # counted by blocks, memory does not depend on the region length
+        for name in contigs :
+            end = fasta.get_reference_length(name) if stop is None else min(stop, fasta.get_reference_length(name))
+            for bstart in range(start or 0, end, REFERENCE_BLOCK) :
+                block = fasta.fetch(name, bstart, min(bstart + REFERENCE_BLOCK, end)).upper()
+                for base in counts : counts[base] += block.count(base)
 
-        refalt = add_gap(ref, maxlen)
-        sequence = sequence[:nposition] + refalt + sequence[nposition+len(ref):]
+        for site in positions :
+            refbase = fasta.fetch(site[0], site[1] - 1, site[1]).upper()
+            if refbase in counts : counts[refbase] -= 1
 
-        offset += maxlen - len(ref)
+    return aln, positions, counts
 
 def snps_aln(* args, ** kwargs) :
     # for compatibility purpose
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 14:02:47
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 14:02:47
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+from urllib.parse import quote
+
+import numpy as np
+
+from pgpy.core.vcf import GTChunk
+
+# On disk cache of decoded genotype matrices (see VCFIterator.fetch_matrix)
+# One directory per key (vcf file, samples, modifier) and one set of raw column files
+# per contig, read back with memory mapping :
+#   positions.bin - int64 (sites, )
+#   ends.bin - int64 (sites, ) - 0-based end of the records, before any modifier
+#   gts.bin - int8 (sites, samples, ploidy)
+#   alleles.txt - one line per site : ref \t alt1,alt2
+#   lines.bin - int64 (sites + 1, ) - offset of each line of alleles.txt, only the selected sites are decoded
+#   meta.json - shape of the arrays
+
+# version of the files layout, part of the keys
+GTCACHE_FORMAT = 2
+
+def modifier_id(modifier) :
+    # Stable identity of a modifier, None when it cannot be identified (lambda, closure)
+    if modifier is None : return ""
+
+    identity = getattr(modifier, "identity", None)
+    if identity is not None : return identity
+
+    name = getattr(modifier, "__qualname__", None)
+    if name is None or "<lambda>" in name or "<locals>" in name : return None
+    return "%s.%s" %(modifier.__module__, name)
+
+def vcf_files(fname, stats=False) :
+    # absolute path of a vcf, with its modification time and size when stats is True
+    # values are tuples (one item per file) for a list of vcf files (see core.multivcf)
+
+    if not isinstance(fname, str) :
+        values = [vcf_files(value, stats) for value in fname]
+        return tuple(zip(* values)) if stats else tuple(values)
+
+    if not stats : return os.path.abspath(fname)
+
+    stat = os.stat(fname)
+    return os.path.abspath(fname), stat.st_mtime_ns, stat.st_size
+
+class DiskCache() :
+
+    # One entry (file or directory) per key in directory
+
+    def __init__(self, directory, maxsize=None) :
+        # maxsize : maximum size of the cache in bytes, least recently used entries are removed first
+
+        self.directory = directory
+        self.maxsize = maxsize
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key) :
+        return os.path.join(self.directory, key)
+
+    def size(self, path) :
+        if os.path.isfile(path) : return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(root, fname))
+            for root, dirs, fnames in os.walk(path) for fname in fnames)
+
+    def evict(self, keep=None) :
+        if self.maxsize is None : return
+
+        entries = [os.path.join(self.directory, key) for key in os.listdir(self.directory)]
+        entries = sorted((os.path.getmtime(entry), self.size(entry), entry) for entry in entries)
+        total = sum(size for mtime, size, entry in entries)
+
+        for mtime, size, entry in entries :
+            if total <= self.maxsize : break
+            if keep and entry == self.path(keep) : continue
+            if os.path.isdir(entry) : shutil.rmtree(entry, ignore_errors=True)
+            else : os.remove(entry)
+            total -= size
+
+    def clear(self) :
+        for key in os.listdir(self.directory) :
+            path = os.path.join(self.directory, key)
+            if os.path.isdir(path) : shutil.rmtree(path, ignore_errors=True)
+            else : os.remove(path)
+
+class AlleleColumns() :
+
+    # refs and alts of the sites of a cached contig, read from alleles.txt when a selection is decoded
+
+    def __init__(self, path, nsites) :
+        self.fname = os.path.join(path, "alleles.txt")
+        self.lines = np.memmap(os.path.join(path, "lines.bin"), dtype=np.int64, mode="r", shape=(nsites + 1, )) if nsites else np.zeros(1, dtype=np.int64)
+
+    def read(self, f, first, last) :
+        # alleles lines of sites first to last (excluded)
+        f.seek(int(self.lines[first]))
+        return f.read(int(self.lines[last] - self.lines[first])).decode().split("\n")[:-1]
+
+    def __getitem__(self, sub) :
+
+        # (refs, alts table) of the sites of sub, a slice or sorted indices
+        # sites are read by runs of consecutive indices
+
+        if isinstance(sub, slice) : runs = [(sub.start, sub.stop)]
+        else :
+            breaks = np.flatnonzero(np.diff(sub) != 1) + 1
+            runs = [(int(run[0]), int(run[-1]) + 1) for run in np.split(sub, breaks)]
+
+        with open(self.fname, "rb") as f :
+            lines = [line for first, last in runs for line in self.read(f, first, last)]
+
+        refs, alts = np.empty(len(lines), dtype=object), []
+        for idx, line in enumerate(lines) :
+            refs[idx], alleles = line.split("\t")
+            alts.append(alleles.split(",") if alleles else [])
+
+        alts_table = np.full((len(alts), max((len(alleles) for alleles in alts), default=0)), None, dtype=object)
+        for idx, alleles in enumerate(alts) :
+            alts_table[idx, :len(alleles)] = alleles
+
+        return refs, alts_table
+
+class GTCache(DiskCache) :
+
+    def key(self, vcf, modifier=None, ploidy=None) :
+        modid = modifier_id(modifier)
+        if modid is None : return None
+
+        values = vcf_files(vcf.fname, stats=True) + (tuple(vcf.samples), modid, ploidy, GTCACHE_FORMAT)
+        # genotypes filter (core.gtfilter) is part of the decoded genotypes, only in keys when set
+        if vcf.gtfilter is not None : values += (modifier_id(vcf.gtfilter), )
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    def path(self, key, contig=None) :
+        path = os.path.join(self.directory, key)
+        return path if contig is None else os.path.join(path, quote(contig, safe=""))
+
+    def load(self, key, contig) :
+        path = self.path(key, contig)
+        if not os.path.isdir(path) : return None
+
+        with open(os.path.join(path, "meta.json")) as f :
+            meta = json.load(f)
+
+        nsites, shape = meta["nsites"], tuple(meta["shape"])
+        if nsites :
+            positions = np.memmap(os.path.join(path, "positions.bin"), dtype=np.int64, mode="r", shape=(nsites, ))
+            ends = np.memmap(os.path.join(path, "ends.bin"), dtype=np.int64, mode="r", shape=(nsites, ))
+            gts = np.memmap(os.path.join(path, "gts.bin"), dtype=np.int8, mode="r", shape=(nsites, ) + shape)
+        else :
+            positions = ends = np.zeros(0, dtype=np.int64)
+            gts = np.zeros((0, ) + shape, dtype=np.int8)
+
+        os.utime(self.path(key))
+        return positions, ends, AlleleColumns(path, nsites), gts
+
+    def store(self, key, contig, chunks, nsamples, modifier=None) :
+        os.makedirs(self.path(key), exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=self.path(key))
+        nsites, ploidy = 0, None
+
+        with open(os.path.join(tmpdir, "positions.bin"), "wb") as fpos, \
+            open(os.path.join(tmpdir, "ends.bin"), "wb") as fends, \
+            open(os.path.join(tmpdir, "gts.bin"), "wb") as fgts, \
+            open(os.path.join(tmpdir, "alleles.txt"), "wb") as falleles, \
+            open(os.path.join(tmpdir, "lines.bin"), "wb") as flines :
+
+            offset = 0
+            flines.write(np.zeros(1, dtype=np.int64).tobytes())
+
+            for chunk in chunks :
+                ends = chunk.positions - 1 + np.fromiter(map(len, chunk.refs), dtype=np.int64, count=chunk.nsites)
+                fends.write(ends.tobytes())
+
+                if modifier : chunk = modifier(chunk)
+                ploidy = chunk.gts.shape[2]
+                fpos.write(chunk.positions.tobytes())
+                fgts.write(np.ascontiguousarray(chunk.gts).tobytes())
+
+                lines = [("%s\t%s\n" %(ref, ",".join(alt for alt in alts if alt is not None))).encode() for ref, alts in zip(chunk.refs, chunk.alts)]
+                falleles.write(b"".join(lines))
+
+                offsets = offset + np.cumsum(np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)))
+                flines.write(offsets.tobytes())
+                if len(offsets) : offset = int(offsets[-1])
+
+                nsites += chunk.nsites
+
+        with open(os.path.join(tmpdir, "meta.json"), "w") as f :
+            json.dump({"nsites" : nsites, "shape" : [nsamples, ploidy or 1]}, f)
+
+        # another process might have stored the same contig in the meantime
+        try : os.rename(tmpdir, self.path(key, contig))
+        except OSError : shutil.rmtree(tmpdir)
+
+        self.evict(keep=key)
+        return self.load(key, contig)
+
+    def fetch_matrix(self, vcf, contig=None, start=None, stop=None, chunk_size=10000, ploidy=None, modifier=None) :
+
+        # Cached data are stored after the modifier
+
+        key = self.key(vcf, modifier, ploidy)
+        if key is None :
+            for chunk in vcf.decode_matrix(contig, start, stop, chunk_size, ploidy) :
+                yield modifier(chunk) if modifier else chunk
+            return
+
+        for name in ([contig] if contig else vcf.contigs) :
+            data = self.load(key, name)
+
+            if data is None :
+                # whole contig, the caller might be restricted to a shard
+                builder = vcf.copy()
+                builder.shard, builder.cache = None, None
+                chunks = builder.decode_matrix(name, chunk_size=chunk_size, ploidy=ploidy)
+                data = self.store(key, name, chunks, len(vcf.samples), modifier)
+
+            positions, ends, alleles, gts = data
+
+            # same selection as a tabix query : records overlapping [start, stop)
+            selection = np.ones(len(positions), dtype=bool)
+            if start is not None or stop is not None :
+                if start is not None : selection &= ends > start
+                if stop is not None : selection &= positions - 1 < stop
+
+            if vcf.shard is not None and vcf.shard.start :
+                selection &= positions - 1 >= vcf.shard.start
+
+            indices = np.flatnonzero(selection)
+            for idx in range(0, len(indices), chunk_size) :
+                sub = indices[idx:idx+chunk_size]
+                sub = slice(int(sub[0]), int(sub[-1]) + 1) if sub[-1] - sub[0] + 1 == len(sub) else sub
+                refs, alts = alleles[sub]
+                yield GTChunk(name, positions[sub], refs, alts, gts[sub])
+
+class ResultCache(DiskCache) :
+
+    # On disk cache of apply_mp results, one pickle file per function, arguments and region
+    # Regions are identified by the compressed data of their contig (see core.index.contig_fingerprint)
+    # instead of the file modification time, a region is computed again only if its contig changed
+    # fingerprint : VCFIterator.fingerprints value of the region contig, of all contigs without contig
+
+    def key(self, vcf, fun, args, kwargs, region, fingerprint) :
+        funid = modifier_id(fun)
+        modids = (modifier_id(vcf.modifier), modifier_id(vcf.chunk_modifier))
+        if vcf.gtfilter is not None : modids += (modifier_id(vcf.gtfilter), )
+        if funid is None or None in modids : return None
+
+        try : arguments = pickle.dumps((args, sorted(kwargs.items())), protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError) : return None
+
+        code = getattr(fun, "__code__", None)
+        values = (vcf_files(vcf.fname), funid, code.co_code if code else None, arguments,
+            tuple(vcf.samples), modids, tuple(region), fingerprint)
+
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    def path(self, key) :
+        return os.path.join(self.directory, key + ".pkl")
+
+    def load(self, key) :
+        # return (found, result)
+        path = self.path(key)
+        if not os.path.isfile(path) : return False, None
+
+        with open(path, "rb") as f :
+            result = pickle.load(f)
+
+        os.utime(path)
+        return True, result
+
+    def store(self, key, result) :
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f :
+            pickle.dump(result, f, protocol=4)
+
+        try : os.replace(tmp, self.path(key))
+        except OSError : return
+
+        self.evict(keep=key)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:02:18
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:02:18
+
+import abc
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from pgpy import PyVCFError
+
+# Executors used by core.processing to run tasks, imap(fun, args) yields
+# fun(* arg) results as soon as they are completed (in any order) and
+# raises the first exception found in a task
+#   SerialExecutor : in the current process
+#   ThreadExecutor : thread pool, for functions releasing the GIL
+#   ProcessExecutor : new process pool for each imap call, tasks are inherited
+#       with fork and never pickled (lambda modifiers can be used)
+#   PoolExecutor : persistent process pool reused between calls, tasks are pickled
+# With process pools, large numpy arrays found in results (directly or in tuples,
+# lists and dicts) are sent back with shared memory instead of being pickled
+
+# minimum size of the arrays sent with shared memory
+SHARED_MIN_BYTES = 1 << 20
+
+# ---------------------------------------------------
+# Shared memory
+
+class SharedArray() :
+
+    # Copy of an array in a shared memory block, created in the child process
+    # The block is released by the parent process in load
+
+    def __init__(self, array) :
+        shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        self.name, self.shape, self.dtype = shm.name, array.shape, array.dtype.str
+        shm.close()
+
+        # otherwise the resource tracker of the child removes the block when the child stops
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    def load(self) :
+        shm = shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf).copy()
+        shm.close()
+        shm.unlink()
+        return array
+
+def transform(value, fun) :
+    # apply fun on value and recursively on the content of tuples, lists and dicts
+    value = fun(value)
+    if type(value) is dict : return {key : transform(item, fun) for key, item in value.items()}
+    if type(value) is list : return [transform(item, fun) for item in value]
+    if isinstance(value, tuple) :
+        items = [transform(item, fun) for item in value]
+        return type(value)(* items) if hasattr(value, "_fields") else type(value)(items)
+    return value
+
+def share(value) :
+    def fun(value) :
+        if isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= SHARED_MIN_BYTES :
+            return SharedArray(value)
+        return value
+    return transform(value, fun)
+
+def unshare(value) :
+    return transform(value, lambda value : value.load() if isinstance(value, SharedArray) else value)
+
+# ---------------------------------------------------
+# Tasks
+
+# token -> (fun, args), read by forked children
+TASKS = {}
+TASKS_LOCK = threading.Lock()
+TOKENS = itertools.count()
+
+def run_inherited(task) :
+    token, idx = task
+    fun, args = TASKS[token]
+    return share(fun(* args[idx]))
+
+def run_pickled(task) :
+    fun, arg = task
+    return share(fun(* arg))
+
+# ---------------------------------------------------
+# Executors
+
+class Executor(abc.ABC) :
+
+    @abc.abstractmethod
+    def imap(self, fun, args) :
+        pass
+
+    def close(self) :
+        pass
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, * args) :
+        self.close()
+
+class SerialExecutor(Executor) :
+
+    def imap(self, fun, args) :
+        for arg in args :
+            yield fun(* arg)
+
+class ThreadExecutor(Executor) :
+
+    def __init__(self, ncore=4) :
+        self.ncore = ncore
+
+    def imap(self, fun, args) :
+        with ThreadPoolExecutor(max_workers=self.ncore) as pool :
+            futures = [pool.submit(fun, * arg) for arg in args]
+
+            try :
+                for future in as_completed(futures) :
+                    yield future.result()
+
+            finally :
+                for future in futures : future.cancel()
+
+class ProcessExecutor(Executor) :
+
+    def __init__(self, ncore=4) :
+        self.ncore = ncore
+
+    def imap(self, fun, args) :
+        args = list(args)
+        if not args : return
+
+        if "fork" not in multiprocessing.get_all_start_methods() :
+            with multiprocessing.Pool(processes=self.ncore) as pool :
+                for result in pool.imap_unordered(run_pickled, [(fun, arg) for arg in args]) :
+                    yield unshare(result)
+            return
+
+        # children are created with the tasks in memory
+        with TASKS_LOCK :
+            token = next(TOKENS)
+            TASKS[token] = fun, args
+            try : pool = multiprocessing.get_context("fork").Pool(processes=min(self.ncore, len(args)))
+            finally : del TASKS[token]
+
+        with pool :
+            for result in pool.imap_unordered(run_inherited, [(token, idx) for idx in range(len(args))]) :
+                yield unshare(result)
+
+class PoolExecutor(Executor) :
+
+    # Persistent pool, to use with a with statement or closed with close
+
+    def __init__(self, ncore=4) :
+        self.ncore = ncore
+        self.pool = None
+
+    def imap(self, fun, args) :
+        if self.pool is None : self.pool = multiprocessing.Pool(processes=self.ncore)
+        for result in self.pool.imap_unordered(run_pickled, [(fun, arg) for arg in args]) :
+            yield unshare(result)
+
+    def close(self) :
+        if self.pool is None : return
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+
+EXECUTORS = {"serial" : SerialExecutor, "thread" : ThreadExecutor, "process" : ProcessExecutor}
+
+def get_executor(executor=None, ncore=4) :
+
+    # executor : Executor instance, name in EXECUTORS or None (processes if ncore > 1)
+
+    if isinstance(executor, Executor) : return executor
+    if executor is None : executor = "process" if ncore > 1 else "serial"
+    if executor not in EXECUTORS : raise PyVCFError("Unknown executor : %s" %(executor))
+    return SerialExecutor() if executor == "serial" else EXECUTORS[executor](ncore)
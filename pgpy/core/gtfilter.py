@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 23:48:21
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 23:48:21
+
+import re
+import operator
+from collections import namedtuple
+
+import numpy as np
+
+from pgpy.core.vcf import PyVCFError, GT_MISSING, GT_PADDING
+
+# Declarative genotype filters, set with VCFIterator(gtfilter=...)
+# Genotypes failing one of the conditions are set as missing when the vcf is decoded,
+# before modifiers and recipes see them (fetch, fetch_sites and fetch_matrix)
+# Conditions are written FIELD OP VALUE, with OP in >=, <=, >, <, ==, != (= is ==) :
+#   DP>=10, GQ>=20, FMT/AD[1]>=3 : FORMAT fields, [i] selects a value of multi values fields
+#   QUAL>=30, INFO/MQ>=40 : site values, all the genotypes of a failing site are masked
+#   FILTER=PASS, FILTER!=LowQual : FILTER column, only = and != are allowed
+# Missing values fail their condition unless missing=True
+
+CONDITION = re.compile(r"^\s*(FMT/|FORMAT/|INFO/)?([A-Za-z_][\w.]*)(?:\[(\d+)\])?\s*(>=|<=|==|!=|>|<|=)\s*(\S+?)\s*$")
+
+OPERATORS = {">=" : operator.ge, "<=" : operator.le, ">" : operator.gt, "<" : operator.lt, "==" : operator.eq, "!=" : operator.ne}
+
+# scope : FORMAT, INFO, QUAL or FILTER, index : value index for multi values fields or None
+Condition = namedtuple("Condition", ["scope", "key", "index", "op", "value"])
+
+def parse_condition(text) :
+    match = CONDITION.match(text)
+    if not match : raise PyVCFError("Invalid genotype filter condition : %s" %(text))
+
+    prefix, key, index, op, value = match.groups()
+    op = "==" if op == "=" else op
+
+    if prefix == "INFO/" : scope = "INFO"
+    elif prefix is None and key in ("QUAL", "FILTER") : scope = key
+    else : scope = "FORMAT"
+
+    if scope == "FILTER" and op not in ("==", "!=") : raise PyVCFError("FILTER conditions only accept = and != : %s" %(text))
+
+    if scope != "FILTER" :
+        try : value = float(value)
+        except ValueError :
+            if op not in ("==", "!=") : raise PyVCFError("Non numeric values only accept = and != : %s" %(text))
+
+    return Condition(scope, key, None if index is None else int(index), op, value)
+
+def field_value(values, index) :
+    if index is None :
+        if not isinstance(values, tuple) : return values
+        if len(values) == 1 : return values[0]
+        raise PyVCFError("An index is required for multi values fields (e.g. AD[1])")
+
+    if values is None or not isinstance(values, tuple) or index >= len(values) : return None
+    return values[index]
+
+class GenotypeFilter() :
+
+    # conditions : condition strings, all must be true for a genotype to be kept
+    # a single string can hold several conditions separated by &
+
+    def __init__(self, * conditions, missing=False) :
+        texts = [text for condition in conditions for text in re.split(r"&+", condition) if text.strip()]
+        if not texts : raise PyVCFError("At least one genotype filter condition is required")
+
+        self.conditions = [parse_condition(text) for text in texts]
+        self.missing = missing
+
+        self.site_conditions = [condition for condition in self.conditions if condition.scope != "FORMAT"]
+        self.format_conditions = [condition for condition in self.conditions if condition.scope == "FORMAT"]
+
+    def __repr__(self) :
+        return self.identity
+
+    @property
+    def identity(self) :
+        # used by cache keys (see core.cache.modifier_id)
+        texts = ["%s%s%s%s%s" %("INFO/" if condition.scope == "INFO" else "", condition.key,
+            "" if condition.index is None else "[%i]" %(condition.index), condition.op, condition.value)
+            for condition in self.conditions]
+        return "GenotypeFilter(%s, missing=%s)" %(" & ".join(texts), self.missing)
+
+    def check(self, header) :
+        # unknown FORMAT and INFO keys would silently mask all the genotypes
+        for condition in self.conditions :
+            fields = {"FORMAT" : header.formats, "INFO" : header.info}.get(condition.scope)
+            if fields is not None and condition.key not in fields :
+                raise PyVCFError("Genotype filter %s field not found in the vcf header : %s" %(condition.scope, condition.key))
+
+    def site_pass(self, record) :
+        for condition in self.site_conditions :
+            if condition.scope == "FILTER" :
+                filters = list(record.filter.keys())
+                found = condition.value in filters or (condition.value == "PASS" and not filters)
+                if found != (condition.op == "==") : return False
+                continue
+
+            value = record.qual if condition.scope == "QUAL" else field_value(record.info.get(condition.key), condition.index)
+            if value is None :
+                if not self.missing : return False
+            elif not OPERATORS[condition.op](value, condition.value) : return False
+
+        return True
+
+    def record_values(self, record) :
+        # (site pass, FORMAT values of each condition for each sample)
+        if not self.format_conditions : return self.site_pass(record), []
+
+        values = [[] for condition in self.format_conditions]
+        for sample in record.samples.values() :
+            for cvalues, condition in zip(values, self.format_conditions) :
+                cvalues.append(field_value(sample.get(condition.key), condition.index))
+
+        return self.site_pass(record), values
+
+    def evaluate(self, records_values, nsamples) :
+
+        # bool (sites, samples), True for genotypes passing all conditions
+        # records_values : list of record_values results
+
+        passed = np.array([site for site, values in records_values], dtype=bool)
+        mask = np.repeat(passed[:, None], nsamples, axis=1)
+
+        for cidx, condition in enumerate(self.format_conditions) :
+            values = [values[cidx] for site, values in records_values]
+
+            if isinstance(condition.value, float) :
+                array = np.array(values, dtype=np.float64).reshape(len(values), nsamples)
+                with np.errstate(invalid="ignore") :
+                    result = OPERATORS[condition.op](array, condition.value)
+                result[np.isnan(array)] = self.missing
+
+            else :
+                array = np.array(values, dtype=object).reshape(len(values), nsamples)
+                result = OPERATORS[condition.op](array, condition.value).astype(bool)
+                result[np.equal(array, None)] = self.missing
+
+            mask &= result
+
+        return mask
+
+    def record_mask(self, record) :
+        return self.evaluate([self.record_values(record)], len(record.samples))[0]
+
+    def sample_pass(self, record, idx) :
+        sample = record.samples[idx]
+        values = [[field_value(sample.get(condition.key), condition.index)] for condition in self.format_conditions]
+        return bool(self.evaluate([(self.site_pass(record), values)], 1)[0, 0])
+
+    def failing(self, record) :
+        # set of the samples indices of record whose genotype fails
+        return set(np.flatnonzero(~ self.record_mask(record)).tolist())
+
+    def mask_chunk(self, chunk, mask) :
+        # GTChunk with genotypes failing (mask False) set as missing, padding slots are kept
+        gts = np.where(~ mask[:, :, None] & (chunk.gts != GT_PADDING), GT_MISSING, chunk.gts).astype(np.int8)
+        return chunk._replace(gts=gts)
+
+def make_gtfilter(gtfilter) :
+    # GenotypeFilter from a GenotypeFilter, a condition string or a list of condition strings
+    if gtfilter is None or isinstance(gtfilter, GenotypeFilter) : return gtfilter
+    if isinstance(gtfilter, str) : return GenotypeFilter(gtfilter)
+    return GenotypeFilter(* gtfilter)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 10:12:31
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 10:12:31
+
+import os
+import gzip
+import struct
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from pgpy import PyVCFError
+
+# Minimal reader for tabix (.tbi) and CSI (.csi) indexes
+# Only what is needed to estimate how records are distributed along contigs
+# See htslib specifications : https://samtools.github.io/hts-specs/tabix.pdf and CSIv1.pdf
+
+# Index entry for one contig
+# nrecords : number of records (from the pseudo-bin, None if not available)
+# start, end : compressed file offsets of the first and last records
+# points : int64 array (k, 2) of (position, compressed offset) pairs, sorted by position
+# vend : virtual offset following the last record (from the pseudo-bin, None if not available)
+ICNT = namedtuple("IndexContig", ["name", "nrecords", "start", "end", "points", "vend"], defaults=(None, ))
+
+TBI_SHIFT = 14
+
+class IndexReader() :
+
+    def __init__(self, data) :
+        self.data = data
+        self.offset = 0
+
+    def read(self, fmt) :
+        values = struct.unpack_from("<" + fmt, self.data, self.offset)
+        self.offset += struct.calcsize("<" + fmt)
+        return values if len(values) > 1 else values[0]
+
+    def read_bytes(self, size) :
+        values = self.data[self.offset : self.offset + size]
+        self.offset += size
+        return values
+
+def index_fname(fname) :
+    for ext in (".csi", ".tbi") :
+        if os.path.isfile(fname + ext) : return fname + ext
+    raise PyVCFError("No tabix or CSI index found for : %s" %(fname))
+
+def read_names(reader) :
+    # tabix configuration, shared by tbi and csi aux field
+    reader.read("6i")
+    lnames = reader.read("i")
+    return [name.decode() for name in reader.read_bytes(lnames).split(b"\0") if name]
+
+def bin_start(binid, min_shift, depth) :
+    level, first = 0, 0
+    while level < depth and binid >= first + (1 << (3 * level)) :
+        first += 1 << (3 * level)
+        level += 1
+    return (binid - first) << (min_shift + 3 * (depth - level))
+
+def read_bins(reader, name, min_shift, depth, csi) :
+    pseudo = ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+    nrecords, start, end, vend = None, None, None, None
+    points, offsets = [], []
+
+    for _ in range(reader.read("i")) :
+        binid = reader.read("I")
+        loffset = reader.read("Q") if csi else None
+        chunks = [reader.read("QQ") for _ in range(reader.read("i"))]
+
+        if binid == pseudo :
+            start, end, vend = chunks[0][0] >> 16, chunks[0][1] >> 16, chunks[0][1]
+            nrecords = chunks[1][0]
+            continue
+
+        offsets.extend(offset >> 16 for chunk in chunks for offset in chunk)
+        loffset = chunks[0][0] if loffset is None else loffset
+        points.append((bin_start(binid, min_shift, depth), loffset >> 16))
+
+    if start is None and offsets :
+        start, end = min(offsets), max(offsets)
+
+    return name, nrecords, start, end, points, vend
+
+def make_contig(name, nrecords, start, end, points, vend=None) :
+    points = np.array(sorted(points) or [(0, start or 0)], dtype=np.int64).reshape(-1, 2)
+    points[:, 1] = np.maximum.accumulate(points[:, 1])
+    return ICNT(name, nrecords, start, end, points, vend)
+
+def read_tbi(reader) :
+    nref = reader.read("i")
+    names = read_names(reader)
+    contigs = {}
+
+    for name in names[:nref] :
+        name, nrecords, start, end, points, vend = read_bins(reader, name, TBI_SHIFT, 5, False)
+        ioffs = [reader.read("Q") for _ in range(reader.read("i"))]
+        points.extend((idx << TBI_SHIFT, ioff >> 16) for idx, ioff in enumerate(ioffs) if ioff)
+        contigs[name] = make_contig(name, nrecords, start, end, points, vend)
+
+    return contigs
+
+def read_csi(reader, contigs=None) :
+    min_shift, depth, laux = reader.read("3i")
+    aux = reader.read_bytes(laux)
+    names = read_names(IndexReader(aux)) if laux >= 28 else list(contigs or [])
+    nref = reader.read("i")
+
+    if len(names) < nref : raise PyVCFError("Unable to name CSI index references")
+
+    result = {}
+    for name in names[:nref] :
+        result[name] = make_contig(* read_bins(reader, name, min_shift, depth, True))
+
+    return result
+
+def read_index(fname, contigs=None) :
+
+    # Return a dict contig -> IndexContig
+    # contigs : header contig names, used when the csi index has no names (bcf)
+
+    with gzip.open(index_fname(fname)) as f :
+        reader = IndexReader(f.read())
+
+    magic = reader.read_bytes(4)
+    if magic == b"TBI\1" : return read_tbi(reader)
+    if magic == b"CSI\1" : return read_csi(reader, contigs)
+    raise PyVCFError("Unknown index format for : %s" %(fname))
+
+def split_contig(icontig, nparts, length=None) :
+
+    # Return nparts - 1 positions cutting the contig in parts
+    # with roughly the same amount of compressed data
+
+    if nparts < 2 : return []
+    points = icontig.points
+    first, last = points[0, 1], points[-1, 1]
+
+    if last > first :
+        targets = first + (last - first) * np.arange(1, nparts) / nparts
+        positions = points[np.searchsorted(points[:, 1], targets), 0]
+
+    else :
+        # all records in the same compressed block, cut evenly along the contig
+        length = length or int(points[-1, 0]) + (1 << TBI_SHIFT)
+        positions = np.arange(1, nparts) * length // nparts
+
+    return sorted(set(int(position) for position in positions if position > 0))
+
+def block_end(f, offset) :
+    # offset following the BGZF block starting at offset, from its BSIZE extra subfield
+    f.seek(offset)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04" : raise PyVCFError("No BGZF block found at offset %i" %(offset))
+
+    extra = IndexReader(f.read(struct.unpack_from("<H", header, 10)[0]))
+    while extra.offset + 4 <= len(extra.data) :
+        identifier, size = extra.read_bytes(2), extra.read("H")
+        if identifier == b"BC" : return offset + extra.read("H") + 1
+        extra.offset += size
+
+    raise PyVCFError("No BGZF block size found at offset %i" %(offset))
+
+def contig_fingerprint(fname, icontig, buffer=1 << 20) :
+
+    # Hash of the compressed data holding the records of a contig, from the block of its
+    # first record to the end of the block of its last one (end block when the records
+    # stop at its first byte)
+    # Any edit of the records of the contig modifies it, a change elsewhere in the file
+    # only does when it touches one of these blocks (e.g. first records of the next contig)
+
+    if icontig is None : return None
+    digest = hashlib.sha1()
+
+    with open(fname, "rb") as f :
+        boundary = icontig.vend is not None and icontig.vend & 0xFFFF == 0 and icontig.end > icontig.start
+        end = icontig.end if boundary else block_end(f, icontig.end)
+        f.seek(icontig.start)
+
+        remaining = end - icontig.start
+        while remaining > 0 :
+            data = f.read(min(buffer, remaining))
+            if not data : break
+            digest.update(data)
+            remaining -= len(data)
+
+    return digest.hexdigest()
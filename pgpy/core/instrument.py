@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 17:25:09
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 17:25:09
+
+from time import perf_counter
+
+# Counters filled by VCFIterator fetch, fetch_sites and fetch_matrix when vcf.stats is set
+# or when a progress callback is used, times are in seconds :
+#   decode : pysam reading and decoding (or cache loading)
+#   modifier : modifiers calls
+#   consumer : time spent by the caller between two yielded values
+#   wall : total time of the fetch calls
+#   bytes : compressed bytes read, approximated from the file offsets after the first record
+
+class FetchStats() :
+
+    FIELDS = ("sites", "samples", "bytes", "decode", "modifier", "consumer", "wall")
+
+    def __init__(self, label=None) :
+        self.label = label
+        for field in FetchStats.FIELDS :
+            setattr(self, field, 0)
+
+    def __repr__(self) :
+        return "FetchStats(%s)" %(", ".join("%s=%s" %(key, value) for key, value in self.as_dict().items()))
+
+    def __add__(self, other) :
+        stats = FetchStats(self.label)
+        stats.merge(self)
+        stats.merge(other)
+        return stats
+
+    def merge(self, other) :
+        for field in FetchStats.FIELDS :
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    @property
+    def sites_per_sec(self) :
+        return self.sites / self.wall if self.wall else 0.
+
+    def as_dict(self) :
+        values = {field : getattr(self, field) for field in FetchStats.FIELDS}
+        values["sites_per_sec"] = self.sites_per_sec
+        if self.label is not None : values["label"] = self.label
+        return values
+
+    @staticmethod
+    def total(stats) :
+        result = FetchStats("total")
+        for value in stats : result.merge(value)
+        return result
+
+def print_progress(stats, contig, position) :
+    # default progress callback, used with VCFIterator.SHOWMODE
+    print (contig, position, "%i sites" %(stats.sites), "%.0f sites/s" %(stats.sites_per_sec))
+
+class Progress() :
+
+    # Call the callback each time a new contig or a new block
+    # of step positions is reached
+
+    def __init__(self, callback, step) :
+        self.callback = callback
+        self.step = step
+        self.last = None
+
+    def update(self, stats, contig, position) :
+        current = (contig, position // self.step)
+        if current != self.last :
+            self.last = current
+            self.callback(stats, contig, position)
+
+class Timer() :
+
+    def __init__(self) :
+        self.last = perf_counter()
+
+    def lap(self) :
+        now = perf_counter()
+        elapsed, self.last = now - self.last, now
+        return elapsed
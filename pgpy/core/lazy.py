@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:48:05
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:48:05
+
+import importlib
+
+# Deferred imports, to keep import pgpy fast for scripts and workers
+# which do not need every heavy dependency
+
+class LazyModule() :
+
+    # Stand-in for a module imported on first attribute access
+    # np = LazyModule("numpy") then np.array(...) works as with import numpy as np
+
+    def __init__(self, name) :
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def load(self) :
+        if self._module is None : self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr) :
+        return getattr(self.load(), attr)
+
+    def __dir__(self) :
+        return dir(self.load())
+
+    def __repr__(self) :
+        return "<lazy module '%s'%s>" %(self._name, "" if self._module is None else " (loaded)")
+
+def lazy_attributes(namespace, package, modules) :
+
+    # Module __getattr__ and __dir__ (PEP 562) loading the submodules of package
+    # on first access to one of their names, loaded names are cached in namespace
+    # modules : dict submodule -> names exported, names which are not listed are
+    # looked up in every submodule (as a wildcard import would do)
+
+    owners = {name : module for module, names in modules.items() for name in names}
+
+    def load(module) :
+        module = importlib.import_module("%s.%s" %(package, module))
+        names = [name for name in vars(module) if not name.startswith("_")]
+        # submodule import sets package.<submodule>, names of the submodule take precedence
+        namespace.update({name : getattr(module, name) for name in names})
+        return module
+
+    def __getattr__(name) :
+        if name in owners :
+            load(owners[name])
+            return namespace[name]
+
+        if not name.startswith("_") :
+            for module in modules : load(module)
+            if name in namespace : return namespace[name]
+
+        raise AttributeError("module '%s' has no attribute '%s'" %(package, name))
+
+    def __dir__() :
+        return sorted(set(namespace) | set(owners))
+
+    return __getattr__, __dir__
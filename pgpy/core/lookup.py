@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 23:58:12
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 23:58:12
+
+import gzip
+from bisect import bisect_left, bisect_right
+
+from pgpy.core.vcf import PyVCFError
+
+# Batch lookup of known positions or regions, used by VCFIterator.search_positions
+# Queries are read in order and nearby queries of a contig are grouped into a single
+# region scan, instead of one index seek per query as with VCFIterator.search_pos
+# A query is (contig, position) with 1-based positions, or (contig, start, end) as
+# a BED interval (0-based start, end excluded)
+
+def read_bed(fname) :
+    # (contig, start, end) of each BED line, header lines are skipped
+    opener = gzip.open if fname.endswith(".gz") else open
+
+    with opener(fname, "rt") as f :
+        for line in f :
+            if not line.strip() or line.startswith(("#", "track", "browser")) : continue
+
+            values = line.split("\t")
+            if len(values) < 3 : raise PyVCFError("Invalid BED line : %s" %(line.strip()))
+            yield values[0], int(values[1]), int(values[2])
+
+def query_interval(query) :
+    # (contig, start, end, is a position)
+    if len(query) == 2 : return query[0], query[1] - 1, query[1], True
+    if len(query) == 3 : return query[0], query[1], query[2], False
+    raise PyVCFError("Queries must be (contig, position) or (contig, start, end) : %s" %(str(query)))
+
+def query_groups(queries, maxgap) :
+
+    # Yield (contig, start, end, queries) regions to scan
+    # Queries are grouped as long as they are on the same contig, in increasing order
+    # and less than maxgap positions after the end of the region
+
+    group, contig, start, end = [], None, None, None
+
+    for query in queries :
+        qcontig, qstart, qend, point = query_interval(query)
+
+        if group and (qcontig != contig or qstart < group[-1][1] or qstart - end > maxgap) :
+            yield contig, start, end, group
+            group = []
+
+        if not group : contig, start, end = qcontig, qstart, qend
+        end = max(end, qend)
+        group.append((qcontig, qstart, qend, point))
+
+    if group : yield contig, start, end, group
+
+def covered(intervals) :
+    # union of sorted intervals, as sorted and disjoint (start, end)
+    result = []
+
+    for contig, start, end, point in intervals :
+        if result and start <= result[-1][1] : result[-1][1] = max(result[-1][1], end)
+        else : result.append([start, end])
+
+    return result
+
+def scan_group(fetch, contig, start, end, group) :
+
+    # Yield (contig, position, record) for each query of group, from a single fetch call
+    # record is the first record starting at the position, None if there is none
+    # BED intervals yield the records starting within them
+
+    union = covered(group)
+    records, positions, uidx = [], [], 0
+
+    for record in fetch(contig=contig, start=start, stop=end) :
+        # records starting before the region but overlapping it are skipped
+        pos = record.pos - 1
+        while uidx < len(union) and union[uidx][1] <= pos : uidx += 1
+        if uidx == len(union) : break
+
+        if pos >= union[uidx][0] :
+            records.append(record)
+            positions.append(pos)
+
+    for qcontig, qstart, qend, point in group :
+        lidx, ridx = bisect_left(positions, qstart), bisect_right(positions, qend - 1)
+
+        if point : yield qcontig, qend, records[lidx] if lidx < ridx else None
+        else :
+            for idx in range(lidx, ridx) :
+                yield qcontig, records[idx].pos, records[idx]
+
+def lookup(vfile, queries, maxgap=10000) :
+
+    # Yield (contig, position, record) for queries, see scan_group
+    # vfile : pysam VariantFile or core.multivcf.MultiVariantFile
+    # queries : iterable of queries or BED file name, preferably sorted
+    # maxgap : maximum distance between two queries scanned together
+
+    if isinstance(queries, str) : queries = read_bed(queries)
+    contigs = set(vfile.header.contigs)
+
+    for contig, start, end, group in query_groups(queries, maxgap) :
+        if contig in contigs :
+            yield from scan_group(vfile.fetch, contig, start, end, group)
+
+        else :
+            for qcontig, qstart, qend, point in group :
+                if point : yield qcontig, qend, None
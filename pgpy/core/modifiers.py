@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 15:20:12
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 15:20:12
+
+import numpy as np
+
+from Bio.Data.IUPACData import ambiguous_dna_values
+
+from pgpy.core.vcf import PyVCFError, GTChunk, GT_MISSING, GT_PADDING
+from pgpy.core.cache import modifier_id
+
+# Chunk modifiers : array versions of the VCFIterator modifiers
+# They receive a GTChunk and return a new one, the input chunk is never modified
+# (it can be a read only memory map, see core.cache)
+
+# ---------------------------------------------------
+
+BASES = {"A" : 1, "C" : 2, "G" : 4, "T" : 8}
+
+def load_iupac_masks() :
+    # bases bitmask -> iupac code, unknown letters are considered as N
+    letters = np.full(16, "N", dtype=object)
+    for code, bases in ambiguous_dna_values.items() :
+        mask = 0
+        for base in bases : mask |= BASES.get(base, 15)
+        letters[mask] = code
+
+    return letters
+
+IUPAC_MASKS = load_iupac_masks()
+
+# ---------------------------------------------------
+
+def apply_lut(chunk, lut) :
+    # lut : (sites, alleles + 2) new index of each allele index,
+    # last two columns are used for padding (-2) and missing (-1) values
+    return lut[np.arange(chunk.nsites)[:, None, None], chunk.gts]
+
+def make_lut(chunk) :
+    nalleles = chunk.alts.shape[1] + 1
+    lut = np.empty((chunk.nsites, nalleles + 2), dtype=np.int8)
+    lut[:, :nalleles] = np.arange(nalleles)
+    lut[:, -2] = GT_PADDING
+    lut[:, -1] = GT_MISSING
+    return lut
+
+def alts_table(alts) :
+    table = np.full((len(alts), max((len(values) for values in alts), default=0)), None, dtype=object)
+    for idx, values in enumerate(alts) :
+        table[idx, :len(values)] = values
+    return table
+
+def recode(chunk, values) :
+
+    # values : object (sites, alleles) new value of each allele
+    # Identical values of a site are merged under the same allele index
+
+    lut = make_lut(chunk)
+    refs, alts = np.empty(chunk.nsites, dtype=object), []
+
+    for sidx, alleles in enumerate(values) :
+        known = {}
+        for aidx, allele in enumerate(alleles) :
+            if allele is None : continue
+            lut[sidx, aidx] = known.setdefault(allele, len(known))
+
+        known = list(known)
+        refs[sidx] = known[0]
+        alts.append(known[1:])
+
+    return GTChunk(chunk.contig, chunk.positions, refs, alts_table(alts), apply_lut(chunk, lut))
+
+def mask_alleles(chunk, keep) :
+
+    # keep : bool (sites, alleles), alleles not kept are set as missing
+
+    lut = make_lut(chunk)
+    lut[:, :keep.shape[1]][~ keep] = GT_MISSING
+    return chunk._replace(gts=apply_lut(chunk, lut))
+
+def allele_lengths(chunk) :
+    alleles = chunk.alleles
+    return np.vectorize(lambda allele : -1 if allele is None else len(allele), otypes=[np.int64])(alleles)
+
+# ---------------------------------------------------
+# Built in modifiers
+
+def fill_values(chunk) :
+    return chunk._replace(gts=np.where(chunk.gts == GT_MISSING, 0, chunk.gts).astype(np.int8))
+
+def no_indel_modifier(chunk) :
+    values = np.vectorize(lambda allele : None if allele is None else allele[0], otypes=[object])(chunk.alleles)
+    return recode(chunk, values)
+
+def only_variable_modifier(chunk) :
+    keep = np.ones(chunk.alleles.shape, dtype=bool)
+    keep[:, 0] = False
+    return mask_alleles(chunk, keep)
+
+def only_indel_modifier(chunk) :
+    lengths = allele_lengths(chunk)
+    return mask_alleles(chunk, (lengths >= 0) & (lengths != lengths[:, :1]))
+
+def iupac_modifier(chunk) :
+
+    # Heterozygous genotypes are merged into one iupac code (first base of each allele)
+    # Missing values and GATK '*' are replaced by the reference, output is haploid
+
+    if chunk.gts.shape[2] == 1 : return chunk
+
+    bases = np.vectorize(lambda allele : 0 if allele is None else BASES.get(allele[0], 15), otypes=[np.int64])(chunk.alleles)
+    refmasks = bases[:, 0]
+
+    star = chunk.alleles == "*"
+    bases[star] = np.broadcast_to(refmasks[:, None], bases.shape)[star]
+
+    # padding (-2) and missing (-1) columns
+    codes = np.column_stack((bases, np.zeros(chunk.nsites, dtype=np.int64), refmasks))
+    masks = np.bitwise_or.reduce(apply_lut(chunk, codes), axis=2)
+
+    # new allele indices : reference code first, then others codes found
+    rows = np.arange(chunk.nsites)
+    present = np.zeros((chunk.nsites, 16), dtype=bool)
+    present[rows[:, None], masks] = True
+    present[rows, refmasks] = False
+    present[:, 0] = False
+
+    ranks = np.cumsum(present, axis=1)
+    gts = ranks[rows[:, None], masks]
+    gts[masks == refmasks[:, None]] = 0
+    gts[masks == 0] = GT_MISSING
+
+    refs = IUPAC_MASKS[refmasks]
+    alts = [list(IUPAC_MASKS[np.flatnonzero(values)]) for values in present]
+    return GTChunk(chunk.contig, chunk.positions, refs, alts_table(alts), gts[:, :, None].astype(np.int8))
+
+def string_equivalents() :
+    # modifier_id of the VCFIterator string modifiers -> chunk modifier
+    return {"pgpy.core.vcf.VCFIterator.%s" %(function.__name__) : function for function in
+        (fill_values, no_indel_modifier, only_variable_modifier, only_indel_modifier, iupac_modifier)}
+
+def has_equivalent(modifier) :
+    # True when string_equivalent does not raise
+    return modifier is None or modifier_id(modifier) in string_equivalents()
+
+def string_equivalent(modifier) :
+
+    # Chunk modifier doing what a VCFIterator string modifier does, for code working on
+    # genotypes matrices (core.scan, matrix recipes), None when no modifier is given
+    # Other string modifiers only work with fetch and raise PyVCFError
+
+    if modifier is None : return None
+
+    equivalent = string_equivalents().get(modifier_id(modifier))
+    if equivalent is None : raise PyVCFError("Genotypes matrices do not support this string modifier : %s" %(modifier))
+    return equivalent
+
+# ---------------------------------------------------
+
+class ModifierPipeline() :
+
+    # Apply several chunk modifiers in order, can be pickled
+    # if all modifiers are module level functions
+
+    def __init__(self, * modifiers) :
+        self.modifiers = modifiers
+
+    @property
+    def identity(self) :
+        identities = [modifier_id(modifier) for modifier in self.modifiers]
+        if any(identity is None for identity in identities) : return None
+        return "ModifierPipeline(%s)" %(", ".join(identities))
+
+    def __call__(self, chunk) :
+        for modifier in self.modifiers :
+            chunk = modifier(chunk)
+        return chunk
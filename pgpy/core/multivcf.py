@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:31:52
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:31:52
+
+import heapq
+from bisect import bisect_right
+from itertools import accumulate, chain, groupby
+
+import numpy as np
+
+from pysam import VariantFile
+
+from pgpy import PyVCFError
+from pgpy.core.index import ICNT, read_index, contig_fingerprint
+
+# Several indexed vcf files read as a single one, used by VCFIterator when fname is a list
+# MultiVariantFile mimics the parts of pysam.VariantFile used by PgPy (header, fetch, tell, subset_samples)
+# Files with the same samples are a batch : each contig is read from the files of the batch which
+# have records for it (from the index), e.g. one file per chromosome
+# Batches with different samples (e.g. one file per group of samples) are joined by position,
+# records of a site found in several batches are merged into a MultiRecord
+
+def region_contig(region) :
+    return region.rsplit(":", 1)[0] if ":" in region else region
+
+def has_records(icontig) :
+    return icontig.start is not None and icontig.nrecords != 0
+
+def tagged(bidx, records) :
+    for record in records :
+        yield bidx, record
+
+class MissingSample() :
+
+    # Sample of a batch without record at this site
+
+    __slots__ = ("name", "ploidy")
+
+    def __init__(self, name, ploidy) :
+        self.name = name
+        self.ploidy = ploidy
+
+    @property
+    def alleles(self) :
+        return (None, ) * self.ploidy
+
+    @property
+    def allele_indices(self) :
+        return (None, ) * self.ploidy
+
+    phased = False
+
+    def __getitem__(self, key) :
+        return self.allele_indices if key == "GT" else None
+
+    def get(self, key, default=None) :
+        return self[key] if key == "GT" else default
+
+    def keys(self) :
+        return []
+
+class RemappedSample() :
+
+    # Sample of a batch whose alternative alleles are not the ones of the merged record
+    # remap : tuple, allele index in the batch record -> allele index in the merged record
+    # Number=A and Number=R FORMAT values are reordered, Number=G values are left as they are
+
+    __slots__ = ("sample", "remap", "nalleles", "formats")
+
+    def __init__(self, sample, remap, nalleles, formats) :
+        self.sample = sample
+        self.remap = remap
+        self.nalleles = nalleles
+        self.formats = formats
+
+    @property
+    def name(self) :
+        return self.sample.name
+
+    @property
+    def phased(self) :
+        return self.sample.phased
+
+    @property
+    def alleles(self) :
+        return self.sample.alleles
+
+    @property
+    def allele_indices(self) :
+        return tuple(None if idx is None else self.remap[idx] for idx in self.sample.allele_indices)
+
+    def __getitem__(self, key) :
+        if key == "GT" : return self.allele_indices
+
+        values = self.sample[key]
+        number = self.formats[key].number if key in self.formats else None
+        if number not in ("A", "R") or values is None : return values
+
+        shift = 1 if number == "A" else 0
+        remapped = [None] * (self.nalleles - shift)
+        for idx, value in enumerate(values) :
+            remapped[self.remap[idx + shift] - shift] = value
+
+        return tuple(remapped)
+
+    def get(self, key, default=None) :
+        return self[key] if key in self.sample.keys() else default
+
+    def keys(self) :
+        return self.sample.keys()
+
+class MultiSamples() :
+
+    # Samples of a MultiRecord, behaves as pysam VariantRecordSamples (values are read only)
+
+    __slots__ = ("record", )
+
+    def __init__(self, record) :
+        self.record = record
+
+    def __len__(self) :
+        return len(self.record.vfile.samples)
+
+    def __iter__(self) :
+        return iter(self.record.vfile.samples)
+
+    def __contains__(self, sample) :
+        return sample in self.record.vfile.sidx
+
+    def batch_values(self, bidx) :
+        record, vfile = self.record, self.record.vfile
+        batch = record.records.get(bidx)
+
+        if batch is None :
+            ploidy = record.ploidy
+            return [MissingSample(name, ploidy) for name in vfile.batch_samples[bidx]]
+
+        remap = record.remaps[bidx]
+        if remap is None : return batch.samples.values()
+        return [RemappedSample(sample, remap, len(record.alleles), vfile.header.formats) for sample in batch.samples.values()]
+
+    def sample(self, bidx, idx) :
+        record = self.record
+        batch = record.records.get(bidx)
+
+        if batch is None : return MissingSample(record.vfile.batch_samples[bidx][idx], record.ploidy)
+        if record.remaps[bidx] is None : return batch.samples[idx]
+        return RemappedSample(batch.samples[idx], record.remaps[bidx], len(record.alleles), record.vfile.header.formats)
+
+    def __getitem__(self, key) :
+        vfile = self.record.vfile
+
+        if isinstance(key, int) :
+            if not - len(self) <= key < len(self) : raise IndexError("invalid sample index")
+            key = key % len(self)
+            bidx = bisect_right(vfile.offsets, key) - 1
+            return self.sample(bidx, key - vfile.offsets[bidx])
+
+        if key not in vfile.sidx : raise KeyError("invalid sample name")
+        return self.sample(* vfile.sidx[key])
+
+    def get(self, key, default=None) :
+        return self[key] if key in self else default
+
+    def keys(self) :
+        return list(self.record.vfile.samples)
+
+    def values(self) :
+        return chain.from_iterable(self.batch_values(bidx) for bidx in range(len(self.record.vfile.batches)))
+
+    def items(self) :
+        return zip(self.keys(), self.values())
+
+class MultiRecord() :
+
+    # Site found in one or several batches
+    # records : dict batch index -> pysam record, alternative alleles are merged in batch order
+    # Other attributes (id, qual, filter, info ...) are the ones of the first batch record
+
+    __slots__ = ("vfile", "records", "alleles", "remaps")
+
+    def __init__(self, vfile, records) :
+        self.vfile = vfile
+        self.records = records
+
+        first = records[min(records)]
+        alleles = list(first.alleles)
+        for bidx in sorted(records) :
+            alleles.extend(allele for allele in records[bidx].alleles[1:] if allele not in alleles)
+
+        self.alleles = tuple(alleles)
+        self.remaps = {bidx : None if record.alleles == self.alleles else tuple(self.alleles.index(allele) for allele in record.alleles)
+            for bidx, record in records.items()}
+
+    def __getattr__(self, name) :
+        if name in MultiRecord.__slots__ : raise AttributeError(name)
+        return getattr(self.records[min(self.records)], name)
+
+    def __repr__(self) :
+        return "MultiRecord(%s, %i, %s, %s)" %(self.contig, self.pos, self.ref, ",".join(self.alts or ()))
+
+    @property
+    def ref(self) :
+        return self.alleles[0]
+
+    @property
+    def alts(self) :
+        return self.alleles[1:] or None
+
+    @property
+    def samples(self) :
+        return MultiSamples(self)
+
+    @property
+    def ploidy(self) :
+        # ploidy of the samples of batches without record
+        for record in self.records.values() :
+            for sample in record.samples.values() :
+                return len(sample.allele_indices)
+        return 1
+
+class MultiHeader() :
+
+    # samples : samples of all batches, contigs : contigs of all the files in order of appearance
+    # Other attributes are the ones of the first file header
+
+    def __init__(self, vfile) :
+        self.vfile = vfile
+
+        contigs = {}
+        for vf in vfile.files :
+            for contig, record in vf.header.contigs.items() :
+                contigs.setdefault(contig, record)
+        self.contigs = contigs
+
+    def __getattr__(self, name) :
+        if name in ("vfile", "contigs") : raise AttributeError(name)
+        return getattr(self.vfile.files[0].header, name)
+
+    @property
+    def samples(self) :
+        return list(self.vfile.samples)
+
+class MultiVariantFile() :
+
+    def __init__(self, fnames) :
+        if not fnames : raise PyVCFError("At least one vcf file is required")
+
+        self.fnames = list(fnames)
+        self.files = [VariantFile(fname) for fname in self.fnames]
+
+        # batches : files indices grouped by samples
+        samples = {}
+        for fidx, vf in enumerate(self.files) :
+            samples.setdefault(tuple(vf.header.samples), []).append(fidx)
+        self.batches = list(samples.values())
+
+        names = [sample for batch in samples for sample in batch]
+        duplicated = sorted(set(sample for sample in names if names.count(sample) > 1))
+        if duplicated : raise PyVCFError("Samples found in several batches of files : %s" %(", ".join(duplicated)))
+
+        self.header = MultiHeader(self)
+        self.indexes = [read_index(fname, list(vf.header.contigs)) for fname, vf in zip(self.fnames, self.files)]
+        self.update_samples()
+
+    def update_samples(self) :
+        # batch_samples : samples of each batch, sidx : sample -> (batch index, index in batch)
+        self.batch_samples = [list(self.files[batch[0]].header.samples) for batch in self.batches]
+        self.samples = [sample for samples in self.batch_samples for sample in samples]
+        self.offsets = list(accumulate((len(samples) for samples in self.batch_samples), initial=0))[:-1]
+        self.sidx = {sample : (bidx, idx) for bidx, samples in enumerate(self.batch_samples) for idx, sample in enumerate(samples)}
+
+    def subset_samples(self, samples) :
+        samples = set(samples)
+        for vf in self.files :
+            vf.subset_samples([sample for sample in vf.header.samples if sample in samples])
+        self.update_samples()
+
+    def close(self) :
+        for vf in self.files :
+            vf.close()
+
+    def tell(self) :
+        # sum of the compressed offsets, only differences between two calls make sense
+        return sum(vf.tell() >> 16 for vf in self.files) << 16
+
+    def routes(self, contig) :
+        # files of each batch with records for contig
+        return [[fidx for fidx in batch if contig in self.indexes[fidx] and has_records(self.indexes[fidx][contig])]
+            for batch in self.batches]
+
+    def fetch(self, contig=None, start=None, stop=None, region=None, reopen=False, end=None, reference=None) :
+        contig = contig or reference or (region_contig(region) if region else None)
+        if contig is not None and contig not in self.header.contigs : raise ValueError("invalid contig `%s`" %(contig))
+
+        contigs = [contig] if contig is not None else list(self.header.contigs)
+        kwargs = {"start" : start, "stop" : stop, "region" : region, "reopen" : reopen, "end" : end}
+
+        for contig in contigs :
+            kwargs["contig"] = None if region else contig
+            yield from self.fetch_contig(contig, kwargs)
+
+    def fetch_contig(self, contig, kwargs) :
+        streams = []
+
+        for fidxs in self.routes(contig) :
+            fetchs = [self.files[fidx].fetch(** kwargs) for fidx in fidxs]
+            streams.append(fetchs[0] if len(fetchs) == 1 else heapq.merge(* fetchs, key=lambda record : record.pos))
+
+        if len(streams) == 1 :
+            yield from streams[0]
+            return
+
+        streams = [tagged(bidx, stream) for bidx, stream in enumerate(streams)]
+        merged = heapq.merge(* streams, key=lambda item : item[1].pos)
+
+        for position, items in groupby(merged, key=lambda item : item[1].pos) :
+            # records of the same site share the same reference, each batch once
+            sites = []
+
+            for bidx, record in items :
+                for ref, records in sites :
+                    if ref == record.ref and bidx not in records :
+                        records[bidx] = record
+                        break
+                else :
+                    sites.append((record.ref, {bidx : record}))
+
+            for ref, records in sites :
+                yield MultiRecord(self, records)
+
+    def fingerprints(self, contigs) :
+        # contig -> hashes of the files holding its records, see core.index.contig_fingerprint
+        return {contig : tuple(contig_fingerprint(self.fnames[fidx], self.indexes[fidx][contig])
+            for fidxs in self.routes(contig) for fidx in fidxs) for contig in contigs}
+
+    def read_index(self) :
+
+        # contig -> IndexContig combining the files indexes, see core.index
+        # nrecords is the highest number of records of a batch, points offsets are
+        # the sum of the compressed data read in all the files before each position
+
+        result = {}
+        for contig in self.header.contigs :
+            routes = self.routes(contig)
+            icontigs = [self.indexes[fidx][contig] for fidxs in routes for fidx in fidxs]
+            if not icontigs : continue
+
+            counts = [[self.indexes[fidx][contig].nrecords for fidx in fidxs] for fidxs in routes]
+            known = all(count is not None for batch in counts for count in batch)
+            nrecords = max(sum(batch) for batch in counts) if known else None
+
+            positions = np.unique(np.concatenate([icontig.points[:, 0] for icontig in icontigs]))
+            offsets = np.zeros(len(positions), dtype=np.int64)
+            for icontig in icontigs :
+                idx = np.maximum(np.searchsorted(icontig.points[:, 0], positions, "right") - 1, 0)
+                offsets += np.maximum(icontig.points[idx, 1] - icontig.start, 0)
+
+            total = sum(icontig.end - icontig.start for icontig in icontigs)
+            result[contig] = ICNT(contig, nrecords, 0, total, np.column_stack((positions, offsets)))
+
+        return result
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:03:44
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:03:44
+
+from queue import Queue, Full
+from threading import Thread, Event
+
+# Background iteration used by VCFIterator.prefetch : a thread reads upcoming
+# values into a bounded queue while the caller works on the current one
+# pysam releases the GIL while reading and decompressing BGZF blocks
+
+DONE = object()
+
+class ProducerError() :
+
+    def __init__(self, error) :
+        self.error = error
+
+def produce(iterator, queue, stop, batch) :
+
+    # Fill the queue with lists of batch values until the end of iterator or until stop is set
+
+    def put(value) :
+        while not stop.is_set() :
+            try :
+                queue.put(value, timeout=.1)
+                return True
+            except Full :
+                continue
+        return False
+
+    values = []
+
+    try :
+        for value in iterator :
+            values.append(value)
+            if len(values) < batch : continue
+            if not put(values) : return
+            values = []
+
+        if values and not put(values) : return
+        put(DONE)
+
+    except BaseException as error :
+        put(ProducerError(error))
+
+    finally :
+        close = getattr(iterator, "close", None)
+        if close : close()
+
+def prefetched(iterable, depth=4, batch=1) :
+
+    # Yield the values of iterable, read by a background thread
+    # depth : maximum number of batches waiting in the queue
+    # Exceptions of the thread are raised here, closing this generator stops the thread
+
+    queue, stop = Queue(depth), Event()
+    thread = Thread(target=produce, args=(iter(iterable), queue, stop, batch), daemon=True)
+    thread.start()
+
+    try :
+        while True :
+            values = queue.get()
+            if values is DONE : return
+            if isinstance(values, ProducerError) : raise values.error
+            yield from values
+
+    finally :
+        stop.set()
+        thread.join()
@@ -4,14 +4,19 @@
 # @Last modified by:   jsgounot
 # @Last Modified time: 2019-05-24 16:24:05
 
-import sys
 from collections import namedtuple
-import multiprocessing
 
 from pgpy import PyVCFError
-from pgpy import VCFIterator as VI
+from pgpy.core.vcf import as_iterator
+from pgpy.core.index import split_contig
+from pgpy.core.instrument import FetchStats
+from pgpy.core.executor import Executor, get_executor
 
 FKNT = namedtuple("FKwargs", ["contig", "start", "end"])
+FKwargs = FKNT # pickle lookup
+
+# function -> merger, see register_merge
+MERGERS = {}
 
 def fkwargs2nt(fkwarg) :
     # convert fetch kwargs to namedtuple
@@ -19,40 +24,196 @@ def fkwargs2nt(fkwarg) :
 
     return FKNT(fkwarg.get("contig", None), fkwarg.get("start", None), fkwarg.get("end", None))
 
-def wrapper_process(vcf, fkwargs, fun, args, kwargs) :
-    return fkwargs, fun(vcf.copy(), * args, ** kwargs)
+def nt2fkwargs(region) :
+    return {key : value for key, value in region._asdict().items() if value is not None}
+
+def wrapper_process(vcf, fkwargs, fun, args, kwargs, instrument=False) :
+    vcf = vcf.copy()
+    if instrument : vcf.stats = FetchStats(fkwargs2nt(fkwargs))
+    return fkwargs, fun(vcf, * args, ** kwargs), vcf.stats
+
+def wrapper_shard(vcf, shard, fun, args, kwargs, instrument=False) :
+    results = []
+
+    for region in shard :
+        rvcf = vcf.copy()
+        rvcf.shard = region
+        if instrument : rvcf.stats = FetchStats(region)
+        results.append((region, fun(rvcf, * args, ** nt2fkwargs(region), ** kwargs), rvcf.stats))
+
+    return results
+
+def run_pool(wrapper, args, ncore, executor=None) :
+
+    # Yield wrapper results as soon as they are completed, exceptions of the tasks are raised here
+    # executor : see core.executor.get_executor, executors given as instances are not closed
+
+    owned = not isinstance(executor, Executor)
+    executor = get_executor(executor, ncore)
+
+    try :
+        yield from executor.imap(wrapper, args)
+
+    finally :
+        if owned : executor.close()
+
+def cached_results(vcf, fun, regions, args, kwargs, result_cache) :
+
+    # Split regions between results found in result_cache (see core.cache.ResultCache)
+    # and cache keys of regions to compute
+
+    if result_cache is None : return {}, {}
+    results, keys = {}, {}
 
-def apply_mp(vcf, fun, fetch_kwargs, * args, ncore=4, ** kwargs) :
+    # contigs data is read once for all their regions
+    whole = any(region.contig is None for region in regions)
+    fingerprints = vcf.fingerprints(vcf.contigs if whole else set(region.contig for region in regions))
+
+    for region in regions :
+        fingerprint = fingerprints[region.contig] if region.contig is not None else tuple(fingerprints[contig] for contig in vcf.contigs)
+        key = result_cache.key(vcf, fun, args, kwargs, region, fingerprint)
+        if key is None : continue
+
+        found, result = result_cache.load(key)
+        if found : results[region] = result
+        else : keys[region] = key
+
+    return results, keys
+
+def apply_mp(vcf, fun, fetch_kwargs, * args, ncore=4, fetch_stats=None, result_cache=None, executor=None, ** kwargs) :
     
+    # fetch_stats : dict filled with the FetchStats of each region (see core.instrument)
+    # result_cache : core.cache.ResultCache, only regions not found in the cache are computed
+    # executor : 'serial', 'thread', 'process' or a core.executor.Executor instance (e.g. PoolExecutor)
+
     fkwargs = fetch_kwargs
     for fkwarg in fkwargs :
         if set(fkwarg) - set(("contig", "start", "end")) :
             raise PyVCFError("fetch_kwargs can only contain contig, start and end keys")
 
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf
-    args = [(vcf, fkwarg, fun, args, {** fkwarg, ** kwargs}) for fkwarg in fkwargs]
+    vcf = as_iterator(vcf)
+    regions = [fkwargs2nt(fkwarg) for fkwarg in fkwargs]
+    cached, keys = cached_results(vcf, fun, regions, args, kwargs, result_cache)
+
+    instrument = fetch_stats is not None
+    args = [(vcf, fkwarg, fun, args, {** fkwarg, ** kwargs}, instrument) for fkwarg in fkwargs if fkwargs2nt(fkwarg) not in cached]
 
-    if ncore == 1 :
-        return {fkwargs2nt(fkwarg) : result for fkwarg, result in 
-                (wrapper_process(* arg) for arg in args)}
+    results = {}
+    for fkwarg, result, stats in run_pool(wrapper_process, args, ncore, executor) :
+        region = fkwargs2nt(fkwarg)
+        results[region] = result
+        if instrument : fetch_stats[region] = stats
+        if region in keys : result_cache.store(keys[region], result)
 
-    try : 
-        with multiprocessing.Pool(processes=ncore) as pool:
-            return {fkwargs2nt(fkwarg) : result for fkwarg, result in 
-            pool.starmap(wrapper_process, args)}
+    return {region : cached[region] if region in cached else results[region] for region in regions}
+
+def apply_mp_contig(vcf, fun, * args, ncore=4, fetch_stats=None, ** kwargs) :
     
-    except KeyboardInterrupt :
-        print ("Interrupt childs process")
-        pool.terminate()
-        sys.exit()
+    # kwargs are also given to apply_mp (e.g. result_cache, executor)
+
+    vcf = as_iterator(vcf)
+    fetch_kwargs = [{"contig" : contig} for contig in vcf.contigs]
     
-    except Exception as e :
-        print ("Error : An exception was raised in a process : %s" %(e.__class__.__name__ + " : " + str(e)))
-        sys.exit()
+    rstats = {} if fetch_stats is not None else None
+    results = apply_mp(vcf, fun, fetch_kwargs, * args, ncore=ncore, fetch_stats=rstats, ** kwargs)
+    if rstats : fetch_stats.update({region.contig : stats for region, stats in rstats.items()})
+
+    return {fkwarg.contig : result for fkwarg, result in results.items()}
+
+# -------------------
+# Sharding
+# -------------------
+
+def register_merge(fun, merger) :
+    # merger receives a {FKNT : result} dict of partial results
+    # ordered as the genome and returns the combined result
+    MERGERS[fun] = merger
 
-def apply_mp_contig(vcf, fun, * args, ncore=4, ** kwargs) :
+def plan_shards(vcf, nshards, by="variants") :
+
+    # Cut the genome into nshards lists of regions with roughly the same weight
+    # by : 'variants' (records count) or 'bytes' (compressed size) from the vcf index
+    # Large contigs are split, small contigs are grouped together
+
+    if by not in ("variants", "bytes") : raise PyVCFError("by must be 'variants' or 'bytes'")
+
+    vcf = as_iterator(vcf)
+    index = vcf.read_index()
     
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf
-    fetch_kwargs = [{"contig" : contig} for contig in vcf.contigs]
-    return {fkwarg.contig : result for fkwarg, result 
-            in apply_mp(vcf, fun, fetch_kwargs, * args, ncore=ncore, ** kwargs).items()}
\ No newline at end of file
+    weights = {}
+    for contig in vcf.contigs :
+        icontig = index.get(contig)
+        if icontig is None : weights[contig] = 0
+        elif by == "variants" and icontig.nrecords is not None : weights[contig] = icontig.nrecords
+        else : weights[contig] = icontig.end - icontig.start
+
+    target = max(sum(weights.values()) / max(nshards, 1), 1)
+    shards, current, cweight = [], [], 0
+
+    for contig in vcf.contigs :
+        weight = weights[contig]
+        nparts = int(round(weight / target))
+
+        if nparts < 2 :
+            current.append(FKNT(contig, None, None))
+            cweight += weight
+
+            if cweight >= target :
+                shards.append(current)
+                current, cweight = [], 0
+
+            continue
+
+        length = vcf.vcf.header.contigs[contig].length
+        bounds = [None] + split_contig(index[contig], nparts, length) + [None]
+        shards.extend([FKNT(contig, start, end)] for start, end in zip(bounds[:-1], bounds[1:]))
+
+    if current : shards.append(current)
+    return shards
+
+def iter_mp_shards(vcf, fun, * args, nshards=None, by="variants", ncore=4, instrument=False, result_cache=None, executor=None, ** kwargs) :
+
+    # Run fun over variants balanced shards and yield (region, result, stats) in genome order,
+    # each region as soon as it and all the previous ones are done
+    # stats is None for regions found in result_cache or when instrument is False
+
+    vcf = as_iterator(vcf)
+    shards = plan_shards(vcf, nshards or ncore * 4, by)
+    regions = [region for shard in shards for region in shard]
+
+    cached, keys = cached_results(vcf, fun, regions, args, kwargs, result_cache)
+    shards = [[region for region in shard if region not in cached] for shard in shards]
+    args = [(vcf, shard, fun, args, kwargs, instrument) for shard in shards if shard]
+
+    done = {region : (result, None) for region, result in cached.items()}
+    position = 0
+
+    for shard in run_pool(wrapper_shard, args, ncore, executor) :
+        for region, result, stats in shard :
+            done[region] = result, stats
+            if region in keys : result_cache.store(keys[region], result)
+
+        while position < len(regions) and regions[position] in done :
+            yield (regions[position], ) + done.pop(regions[position])
+            position += 1
+
+    for region in regions[position:] :
+        yield (region, ) + done.pop(region)
+
+def apply_mp_shards(vcf, fun, * args, nshards=None, by="variants", merge=True, ncore=4, fetch_stats=None, result_cache=None, executor=None, ** kwargs) :
+    
+    # Run fun over variants balanced shards, fun is called once per region with contig, start and end
+    # Sites overlapping two regions are only seen by the first one
+    # Results are combined with the merger registered for fun, if any and merge is True
+    # fetch_stats : dict filled with the FetchStats of each region (see core.instrument)
+    # result_cache, executor : see apply_mp
+
+    results = {}
+    for region, result, stats in iter_mp_shards(vcf, fun, * args, nshards=nshards, by=by, ncore=ncore,
+        instrument=fetch_stats is not None, result_cache=result_cache, executor=executor, ** kwargs) :
+
+        results[region] = result
+        if stats is not None : fetch_stats[region] = stats
+
+    merger = MERGERS.get(fun) if merge else None
+    return merger(results) if merger else results
\ No newline at end of file
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 18:40:51
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 18:40:51
+
+import abc
+from copy import deepcopy
+
+from pgpy import PyVCFError
+from pgpy.core.vcf import as_iterator
+from pgpy.core.cache import modifier_id
+from pgpy.core.modifiers import string_equivalent, has_equivalent
+from pgpy.core.processing import iter_mp_shards, register_merge
+
+# Fused scan : several statistics computed from a single fetch_matrix stream
+# Each statistic is an Accumulator, see recipes (maf, divergence, heterozygosity)
+# for the built in ones
+# Genotypes matrices only support the built in VCFIterator string modifiers (see
+# core.modifiers.string_equivalent), with other string modifiers the sites are read
+# with fetch and given to the accumulators implementing update_site
+
+class Accumulator(abc.ABC) :
+
+    # chunk_modifier : view of the data used by this accumulator, applied on each raw chunk
+    # Chunks given to update are shared between accumulators and must not be modified
+    # update, merge and result must be implemented, update_site is optional
+
+    chunk_modifier = None
+
+    def setup(self, vcf) :
+        # called once per region before the first update
+        pass
+
+    @abc.abstractmethod
+    def update(self, chunk) :
+        pass
+
+    def update_site(self, contig, position, ref, variants) :
+        # fetch based update, used with string modifiers without chunk equivalent
+        raise NotImplementedError
+
+    def fetch_based(self) :
+        # True when update_site is implemented
+        return type(self).update_site is not Accumulator.update_site
+
+    @abc.abstractmethod
+    def merge(self, other) :
+        # add the partial result of another region and return self
+        pass
+
+    @abc.abstractmethod
+    def result(self) :
+        pass
+
+def scan_region(vcf, accumulators, contig=None, start=None, end=None, chunk_size=10000, ** kwargs) :
+
+    # accumulators : dict name -> Accumulator, used as templates (not modified)
+    # kwargs are given to fetch_matrix
+    # the vcf string modifier is applied as its chunk equivalent before the accumulators views
+
+    accumulators = {name : deepcopy(accumulator) for name, accumulator in accumulators.items()}
+    for accumulator in accumulators.values() :
+        accumulator.setup(vcf)
+
+    if not has_equivalent(vcf.modifier) :
+        return fetch_region(vcf, accumulators, contig, start, end, ** kwargs)
+
+    vmodifier = string_equivalent(vcf.modifier)
+
+    for chunk in vcf.fetch_matrix(contig, start, end, chunk_size=chunk_size, ** kwargs) :
+        if vmodifier : chunk = vmodifier(chunk)
+
+        # accumulators with the same modifier share the same view
+        views = {}
+        for accumulator in accumulators.values() :
+            modifier = accumulator.chunk_modifier
+            key = modifier_id(modifier) or id(modifier)
+            if key not in views : views[key] = modifier(chunk) if modifier else chunk
+            accumulator.update(views[key])
+
+    return accumulators
+
+def check_fetch_based(vcf, accumulators) :
+    if has_equivalent(vcf.modifier) : return
+
+    names = [name for name, accumulator in accumulators.items() if not accumulator.fetch_based()]
+    if names : raise PyVCFError("Accumulators %s only support the built in VCFIterator string modifiers, not %s" %(", ".join(names), vcf.modifier))
+
+def fetch_region(vcf, accumulators, contig=None, start=None, end=None, ploidy=None, ** kwargs) :
+
+    # scan_region for string modifiers without chunk equivalent, alleles
+    # are given by fetch and chunk modifiers are not used
+
+    check_fetch_based(vcf, accumulators)
+
+    for site in vcf.fetch(contig=contig, start=start, stop=end, ** kwargs) :
+        for accumulator in accumulators.values() :
+            accumulator.update_site(* site)
+
+    return accumulators
+
+def merge_accumulators(merged, accumulators) :
+    if merged is None : return accumulators
+    for name, accumulator in accumulators.items() :
+        merged[name].merge(accumulator)
+    return merged
+
+def merge_scans(results) :
+    merged = None
+    for accumulators in results.values() :
+        merged = merge_accumulators(merged, accumulators)
+    return merged
+
+register_merge(scan_region, merge_scans)
+
+def fused_scan(vcf, accumulators, contig=None, start=None, end=None, ncore=1, nshards=None, executor=None, ** kwargs) :
+
+    # Feed all accumulators from one fetch_matrix stream per shard
+    # Return a dict name -> accumulator result
+    # With ncore > 1 or nshards, the genome is split with iter_mp_shards and partial
+    # accumulators are merged in genome order as soon as they are available
+    # executor : see core.processing.apply_mp
+    # with a string modifier without chunk equivalent, all accumulators must implement update_site
+
+    if not accumulators : raise PyVCFError("No accumulator given")
+    vcf = as_iterator(vcf)
+    check_fetch_based(vcf, accumulators)
+
+    if ncore == 1 and not nshards :
+        accumulators = scan_region(vcf, accumulators, contig, start, end, ** kwargs)
+
+    else :
+        if contig is not None : raise PyVCFError("Regions cannot be given with a parallel scan")
+        merged = None
+        for region, partial, stats in iter_mp_shards(vcf, scan_region, accumulators, nshards=nshards, ncore=ncore, executor=executor, ** kwargs) :
+            merged = merge_accumulators(merged, partial)
+        accumulators = merged
+
+    return {name : accumulator.result() for name, accumulator in accumulators.items()}
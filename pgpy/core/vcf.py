@@ -2,16 +2,27 @@
 # @Author: jsgounot
 # @Date:   2018-11-21 10:04:35
 # @Last modified by:   jsgounot
-# @Last Modified time: 2019-05-24 16:23:17
+# @Last Modified time: 2026-10-18 21:48:05
 
 from copy import deepcopy
-from collections import Counter
+from collections import Counter, namedtuple
 from itertools import chain, permutations
 
 from Bio.Data.IUPACData import ambiguous_dna_values
 
 from pysam import VariantFile
 
+from pgpy.core.lazy import LazyModule
+from pgpy.core.instrument import FetchStats, Progress, Timer, print_progress
+from pgpy.core.prefetch import prefetched
+
+# numpy is only needed by fetch_matrix and GTChunk
+np = LazyModule("numpy")
+
+# allele index values used in genotype matrices
+GT_MISSING = -1
+GT_PADDING = -2 # ploidy slot not used by a sample (e.g. haploid call in a diploid matrix)
+
 # ---------------------------------------------------
 
 def load_iupac() :
@@ -25,32 +36,259 @@ class PyVCFError(Exception) :
 
     pass
 
+class GTChunk(namedtuple("GTChunk", ["contig", "positions", "refs", "alts", "gts"])) :
+
+    # Block of consecutive sites from a single contig
+    # positions : int64 (sites, ) - 1-based positions
+    # refs : object (sites, ) - reference alleles
+    # alts : object (sites, max alts) - alternative alleles, padded with None
+    # gts : int8 (sites, samples, ploidy) - allele indices, GT_MISSING for missing calls
+
+    __slots__ = ()
+
+    @property
+    def nsites(self) :
+        return len(self.positions)
+
+    @property
+    def alleles(self) :
+        # allele table where the column index matches the allele index of gts
+        return np.column_stack((self.refs, self.alts))
+
+    def allele_counts(self, groups=None) :
+        # number of called alleles, (sites, alleles) or (sites, groups, alleles)
+        # when groups, a list of samples indices lists, is given
+
+        nalleles = self.alts.shape[1] + 1
+        if groups is None : return np.stack([(self.gts == allele).sum(axis=(1, 2)) for allele in range(nalleles)], axis=1)
+
+        counts = np.zeros((self.nsites, len(groups), nalleles), dtype=np.int64)
+        for gidx, indices in enumerate(groups) :
+            sub = self.gts[:, indices]
+            for allele in range(nalleles) :
+                counts[:, gidx, allele] = (sub == allele).sum(axis=(1, 2))
+
+        return counts
+
+class Site() :
+
+    # Variant site yielded by VCFIterator.fetch_sites
+    # Keeps the pysam record and decodes samples only when they are accessed
+    # index : dict sample -> sample index, shared by all the sites of a fetch
+    # modifier : string modifier of the VCFIterator, applied by alleles and variants
+    # gtfilter : core.gtfilter.GenotypeFilter of the VCFIterator, failing genotypes are missing
+
+    __slots__ = ("record", "index", "modifier", "gtfilter", "failed")
+
+    def __init__(self, record, index, modifier=None, gtfilter=None) :
+        self.record = record
+        self.index = index
+        self.modifier = modifier
+        self.gtfilter = gtfilter
+        self.failed = None
+
+    def __repr__(self) :
+        return "Site(%s, %i, %s, %s)" %(self.contig, self.pos, self.ref, ",".join(self.alts))
+
+    def __iter__(self) :
+        # contig, pos, ref, variants = site, as with fetch
+        return iter(self.as_tuple())
+
+    @property
+    def contig(self) :
+        return self.record.contig
+
+    @property
+    def pos(self) :
+        return self.record.pos
+
+    @property
+    def ref(self) :
+        return self.record.ref
+
+    @property
+    def alts(self) :
+        return self.record.alts or ()
+
+    @property
+    def samples(self) :
+        return list(self.index)
+
+    def sample_index(self, sample) :
+        if isinstance(sample, int) : return sample
+        try : return self.index[sample]
+        except KeyError : raise PyVCFError("Sample not found : %s" %(sample)) from None
+
+    def failing(self) :
+        # indices of the samples whose genotype fails gtfilter
+        if self.gtfilter is None : return ()
+        if self.failed is None : self.failed = self.gtfilter.failing(self.record)
+        return self.failed
+
+    def alleles(self, sample) :
+        # alleles of a sample (name or index) after the modifier
+        idx = self.sample_index(sample)
+        alts = self.record.samples[idx].alleles
+
+        if self.gtfilter is not None :
+            # a single sample is evaluated unless all the samples already were
+            passed = idx not in self.failed if self.failed is not None else self.gtfilter.sample_pass(self.record, idx)
+            if not passed : alts = (None, ) * len(alts)
+
+        return self.modifier(alts, self.record) if self.modifier else alts
+
+    def variants(self) :
+        # dict sample -> alleles as given by fetch, samples without alleles are removed
+        failing, data = self.failing(), {}
+
+        for idx, (sample, alleles) in enumerate(self.record.samples.items()) :
+            alts = alleles.alleles
+            if idx in failing : alts = (None, ) * len(alts)
+            if self.modifier : alts = self.modifier(alts, self.record)
+            if alts : data[sample] = alts
+
+        return data
+
+    def as_tuple(self) :
+        return self.contig, self.pos, self.ref, self.variants()
+
+    def allele_indices(self, ploidy=None) :
+        # int8 array (samples, ploidy) as a GTChunk.gts row, modifier is not applied
+        gts = [sample.allele_indices for sample in self.record.samples.values()]
+        for idx in self.failing() : gts[idx] = (None, ) * len(gts[idx])
+
+        ploidy = ploidy or max((len(indices) for indices in gts), default=1)
+        return VCFIterator.gt_array([gts], len(gts), ploidy)[0]
+
+    def allele_counts(self) :
+        # number of called copies of each allele, reference first
+        failing = self.failing()
+        indices = [idx for sidx, sample in enumerate(self.record.samples.values()) if sidx not in failing
+            for idx in sample.allele_indices if idx is not None]
+        return np.bincount(indices, minlength=len(self.alts) + 1)
+
 class VCFIterator() :
 
     iupac_code = load_iupac()
     
+    # print progress with fetch (see print_progress), for all instances
     SHOWMODE = False
     SHOWPOSI = 100000
     show_last = None
 
-    def __init__(self, fname, modifier=None) :
+    # number of sites sent at once by the prefetch thread of fetch
+    PREFETCH_BATCH = 256
+
+    def __init__(self, fname, modifier=None, cache=None, chunk_modifier=None, samples=None, exclude=None, gtfilter=None) :
+
+        # fname : vcf file or list of indexed vcf files read as a single one (see core.multivcf)
+        # cache : optional core.cache.GTCache used by fetch_matrix
+        # chunk_modifier : modifier applied by fetch_matrix on each GTChunk, see core.modifiers
+        # samples, exclude : samples to keep or to remove, others samples genotypes are not decoded
+        # gtfilter : genotypes filter conditions (e.g. "DP>=10 & GQ>=20") or core.gtfilter.GenotypeFilter,
+        # failing genotypes are set as missing before modifiers
+
+        if not isinstance(fname, str) :
+            if not isinstance(fname, (list, tuple)) or not all(isinstance(value, str) for value in fname) :
+                raise PyVCFError("fname must be a string or a list of strings")
+            fname = fname[0] if len(fname) == 1 else tuple(fname)
 
-        if not isinstance(fname, str) : raise PyVCFError("fname must be a string")
         self.fname = fname
-        self.vcf = VariantFile(fname)
+        self.include = list(samples) if samples is not None else None
+        self.exclude = list(exclude) if exclude else None
+        self.vcf = self.open()
         self.modifier = modifier
+        self.chunk_modifier = chunk_modifier
+        self.cache = cache
+        self.shard = None
+        self.gtfilter = None
+
+        if gtfilter is not None :
+            from pgpy.core.gtfilter import make_gtfilter
+            self.gtfilter = make_gtfilter(gtfilter)
+            self.gtfilter.check(self.vcf.header)
+
+        # instrumentation, see core.instrument
+        # stats : FetchStats filled by fetch and fetch_matrix
+        # progress : callback(stats, contig, position) called every progress_step positions
+        self.stats = None
+        self.progress = None
+        self.progress_step = 100000
+
+        # prefetch : queue depth of the background thread reading and decoding
+        # upcoming sites (fetch) or chunks (fetch_matrix), 0 to disable
+        self.prefetch = 0
+
+    def __getstate__(self) :
+        # pysam handles cannot be pickled, we reopen the file instead
+        state = self.__dict__.copy()
+        del state["vcf"], state["metadata"]
+        return state
+
+    def __setstate__(self, state) :
+        self.__dict__.update(state)
+        self.vcf = self.open()
+
+    def open(self) :
+        # metadata : values read from the header of the opened file (see samples, ploidies)
+        self.metadata = {}
+
+        if isinstance(self.fname, str) : vcf = VariantFile(self.fname)
+        else :
+            from pgpy.core.multivcf import MultiVariantFile
+            vcf = MultiVariantFile(self.fname)
+
+        if self.include is None and self.exclude is None : return vcf
+
+        samples = list(vcf.header.samples)
+        unknown = set(self.include or []) - set(samples)
+        if unknown : raise PyVCFError("Samples not found in the vcf : %s" %(", ".join(sorted(unknown))))
+
+        include = samples if self.include is None else set(self.include)
+        exclude = set(self.exclude or [])
+        vcf.subset_samples([sample for sample in samples if sample in include and sample not in exclude])
+        return vcf
+
+    def read_index(self) :
+        # contig -> core.index.IndexContig
+        from pgpy.core.index import read_index
+        return read_index(self.fname, self.contigs) if isinstance(self.fname, str) else self.vcf.read_index()
+
+    def fingerprints(self, contigs) :
+        # contig -> hash of the compressed data holding its records, see core.index.contig_fingerprint
+        from pgpy.core.index import contig_fingerprint
+        if not isinstance(self.fname, str) : return self.vcf.fingerprints(contigs)
+
+        index = self.read_index()
+        return {contig : contig_fingerprint(self.fname, index.get(contig)) for contig in contigs}
+
+    def subset(self, samples=None, exclude=None) :
+        # copy restricted to samples and / or without exclude samples
+        # samples not found in the vcf are ignored for exclude
+        
+        vcf = self.copy()
+        if samples is not None : vcf.include = list(samples) if vcf.include is None else [sample for sample in vcf.include if sample in samples]
+        if exclude : vcf.exclude = (vcf.exclude or []) + list(exclude)
+        vcf.vcf = vcf.open()
+        return vcf
 
     @property
     def samples(self):
-        return list(self.vcf.header.samples)
+        if "samples" not in self.metadata : self.metadata["samples"] = list(self.vcf.header.samples)
+        return list(self.metadata["samples"])
 
     @property
     def contigs(self):
-        return list(self.vcf.header.contigs)
+        if "contigs" not in self.metadata : self.metadata["contigs"] = list(self.vcf.header.contigs)
+        return list(self.metadata["contigs"])
 
     @property
-    def ploidies(self):      
-        return {sample : len(alts) for sample, alts in self.fetch_first()[3].items()}
+    def ploidies(self):
+        # from the first site, read once for each modifier, genotypes filter and shard
+        key = ("ploidies", self.modifier, self.gtfilter, self.shard)
+        if key not in self.metadata :
+            self.metadata[key] = {sample : len(alts) for sample, alts in self.fetch_first()[3].items()}
+        return dict(self.metadata[key])
 
     def seqcount(self, wo_mod=False, addRef=False) :
         if wo_mod : 
@@ -64,10 +302,35 @@ class VCFIterator() :
         return values
 
     def copy(self) :
-        vcf = VCFIterator(self.fname)
-        vcf.modifier = self.modifier
+        vcf = VCFIterator(self.fname, self.modifier, self.cache, self.chunk_modifier, self.include, self.exclude, self.gtfilter)
+        vcf.shard = self.shard
+        vcf.progress = self.progress
+        vcf.progress_step = self.progress_step
+        vcf.prefetch = self.prefetch
         return vcf
 
+    def background(self) :
+        # copy with its own file handle for the prefetch thread
+        if self.prefetch < 0 : raise PyVCFError("prefetch must be a positive integer or 0")
+        vcf = self.copy()
+        vcf.prefetch = 0
+        vcf.stats = self.stats
+        return vcf
+
+    @property
+    def instrumented(self) :
+        return self.stats is not None or self.progress is not None or VCFIterator.SHOWMODE
+
+    def tracker(self) :
+        stats = self.stats if self.stats is not None else FetchStats()
+        callback = self.progress or (print_progress if VCFIterator.SHOWMODE else None)
+        step = self.progress_step if self.progress else VCFIterator.SHOWPOSI
+        return stats, Progress(callback, step) if callback else None
+
+    def owned(self, site) :
+        # With sharded runs, a site overlapping two shards is only reported by the first one
+        return self.shard is None or not self.shard.start or site.start >= self.shard.start
+
     def add_modifier(self) :
         self.modifier = modifier
 
@@ -76,40 +339,221 @@ class VCFIterator() :
         if not result : raise PyVCFError("Variant not found at : %s %i" %(contig, position))
         return VCFIterator.dict_alts(result[0], self.modifier) if alts else result[0]
 
+    def search_positions(self, queries, alts=False, maxgap=10000) :
+
+        # Batch search_pos : yield (contig, position, result) for each query
+        # queries : sorted (contig, position) or BED file, BED intervals yield each variant they contain
+        # nearby queries are read with a single region scan (see core.lookup)
+        # result is the record, or the samples alleles as given by fetch with alts, None without variant
+
+        from pgpy.core.lookup import lookup
+        index = {sample : idx for idx, sample in enumerate(self.samples)}
+
+        for contig, position, record in lookup(self.vcf, queries, maxgap) :
+            if alts and record is not None : record = Site(record, index, self.modifier, self.gtfilter).variants()
+            yield contig, position, record
+
     def fetch_raw(self, * args, ** kwargs) :
         for variant in self.vcf.fetch(* args, ** kwargs) :
             yield variant
 
     def fetch(self, * args, ** kwargs) :
-        show_last_posi = None
-        show_last_contig = None
 
-        for site in self.vcf.fetch(* args, ** kwargs) :
+        if self.prefetch :
+            yield from prefetched(self.background().fetch(* args, ** kwargs), self.prefetch, VCFIterator.PREFETCH_BATCH)
+            return
 
-            if VCFIterator.SHOWMODE :
-                if site.contig != show_last_contig :
-                    show_last_contig = site.contig
-                    show_last_posi = site.pos // VCFIterator.SHOWPOSI
-                    print (site.contig, site.pos)
+        if self.instrumented :
+            yield from self.fetch_instrumented(* args, ** kwargs)
+            return
 
-                elif site.pos // VCFIterator.SHOWPOSI != show_last_posi :
-                    show_last_posi = site.pos // VCFIterator.SHOWPOSI
-                    print (site.contig, site.pos)
+        for site in self.vcf.fetch(* args, ** kwargs) :
+
+            if not self.owned(site) : continue
 
             data = {}
-            for sample, alleles in site.samples.items() :
+            failing = self.gtfilter.failing(site) if self.gtfilter else ()
+
+            for idx, (sample, alleles) in enumerate(site.samples.items()) :
                 
                 alts = alleles.alleles
+                if idx in failing : alts = (None, ) * len(alts)
                 if self.modifier : alts = self.modifier(alts, site)
                 if alts : data[sample] = alts
 
             if not data : continue
             yield site.contig, site.pos, site.ref, data
 
+    def fetch_instrumented(self, * args, ** kwargs) :
+        
+        # same as fetch, with counters and progress callback
+        
+        stats, progress = self.tracker()
+        timer = Timer()
+        start, wall, first = timer.last, stats.wall, None
+
+        try :
+            for site in self.vcf.fetch(* args, ** kwargs) :
+                stats.decode += timer.lap()
+
+                if not self.owned(site) : continue
+                if first is None : first = self.vcf.tell()
+
+                samples = [(sample, alleles.alleles) for sample, alleles in site.samples.items()]
+                if self.gtfilter :
+                    failing = self.gtfilter.failing(site)
+                    samples = [(sample, (None, ) * len(alts) if idx in failing else alts) for idx, (sample, alts) in enumerate(samples)]
+                stats.decode += timer.lap()
+
+                data = {}
+                for sample, alts in samples :
+                    if self.modifier : alts = self.modifier(alts, site)
+                    if alts : data[sample] = alts
+
+                stats.modifier += timer.lap()
+                stats.sites += 1
+                stats.samples += len(samples)
+                stats.wall = wall + timer.last - start
+
+                if progress : progress.update(stats, site.contig, site.pos)
+                if not data : continue
+
+                yield site.contig, site.pos, site.ref, data
+                stats.consumer += timer.lap()
+
+        finally :
+            if first is not None : stats.bytes += (self.vcf.tell() >> 16) - (first >> 16)
+            stats.wall = wall + Timer().last - start
+
+    def fetch_sites(self, * args, ** kwargs) :
+
+        # Same sites as fetch, as Site objects decoding samples on demand
+        # Unlike fetch, sites where the modifier removes all samples are yielded
+
+        if self.prefetch :
+            yield from prefetched(self.background().fetch_sites(* args, ** kwargs), self.prefetch, VCFIterator.PREFETCH_BATCH)
+            return
+
+        index = {sample : idx for idx, sample in enumerate(self.samples)}
+        stats, progress = self.tracker() if self.instrumented else (None, None)
+
+        if stats is not None :
+            yield from self.instrument_sites(index, stats, progress, * args, ** kwargs)
+            return
+
+        for record in self.vcf.fetch(* args, ** kwargs) :
+            if self.owned(record) : yield Site(record, index, self.modifier, self.gtfilter)
+
+    def instrument_sites(self, index, stats, progress, * args, ** kwargs) :
+
+        # fetch_sites counters, samples decoding is part of the consumer time
+
+        timer = Timer()
+        start, wall, first = timer.last, stats.wall, None
+
+        try :
+            for record in self.vcf.fetch(* args, ** kwargs) :
+                stats.decode += timer.lap()
+
+                if not self.owned(record) : continue
+                if first is None : first = self.vcf.tell()
+
+                stats.sites += 1
+                stats.samples += len(index)
+                stats.wall = wall + timer.last - start
+                if progress : progress.update(stats, record.contig, record.pos)
+
+                yield Site(record, index, self.modifier, self.gtfilter)
+                stats.consumer += timer.lap()
+
+        finally :
+            if first is not None : stats.bytes += (self.vcf.tell() >> 16) - (first >> 16)
+            stats.wall = wall + Timer().last - start
+
     def fetch_first(self, * args, ** kwargs) :
 
         return next(self.fetch(* args, ** kwargs))
 
+    def fetch_matrix(self, contig=None, start=None, stop=None, chunk_size=10000, ploidy=None, ** kwargs) :
+        # Yield GTChunk of at most chunk_size sites, chunks never overlap two contigs
+        # Only chunk_modifier is applied here, string modifiers work with fetch
+
+        if chunk_size < 1 : raise PyVCFError("chunk_size must be a positive integer")
+
+        if self.prefetch :
+            yield from prefetched(self.background().fetch_matrix(contig, start, stop, chunk_size, ploidy, ** kwargs), self.prefetch)
+            return
+
+        stats, progress = self.tracker() if self.instrumented else (None, None)
+
+        if self.cache is not None and not kwargs :
+            chunks = self.cache.fetch_matrix(self, contig, start, stop, chunk_size, ploidy, self.chunk_modifier)
+            modifier = None
+
+        else :
+            chunks = self.decode_matrix(contig, start, stop, chunk_size, ploidy, stats, ** kwargs)
+            modifier = self.chunk_modifier
+
+        if stats is not None :
+            yield from self.instrument_chunks(chunks, modifier, stats, progress)
+            return
+
+        for chunk in chunks :
+            yield modifier(chunk) if modifier else chunk
+
+    def instrument_chunks(self, chunks, modifier, stats, progress) :
+
+        # fetch_matrix counters, cache loading is counted as decoding
+
+        timer = Timer()
+        start, wall = timer.last, stats.wall
+
+        try :
+            for chunk in chunks :
+                stats.decode += timer.lap()
+
+                if modifier : chunk = modifier(chunk)
+                stats.modifier += timer.lap()
+
+                stats.sites += chunk.nsites
+                stats.samples += chunk.nsites * chunk.gts.shape[1]
+                stats.wall = wall + timer.last - start
+                if progress and chunk.nsites : progress.update(stats, chunk.contig, int(chunk.positions[-1]))
+
+                yield chunk
+                stats.consumer += timer.lap()
+
+        finally :
+            stats.wall = wall + Timer().last - start
+
+    def decode_matrix(self, contig=None, start=None, stop=None, chunk_size=10000, ploidy=None, stats=None, ** kwargs) :
+        # fetch_matrix without cache nor modifier, gtfilter is applied on each chunk
+        # stats : FetchStats receiving the number of bytes read
+        
+        nsamples = len(self.samples)
+        current, sites, first = None, [], None
+        gtfilter, values = self.gtfilter, []
+
+        for site in self.vcf.fetch(contig=contig, start=start, stop=stop, ** kwargs) :
+
+            if not self.owned(site) : continue
+            if stats is not None and first is None : first = self.vcf.tell()
+
+            if sites and (site.contig != current or len(sites) == chunk_size) :
+                yield VCFIterator.filter_chunk(current, sites, nsamples, ploidy, gtfilter, values)
+                sites, values = [], []
+
+            if ploidy is None :
+                ploidy = max(len(sample.allele_indices) for sample in site.samples.values())
+
+            current = site.contig
+            sites.append((site.pos, site.ref, site.alts or (),
+                [sample.allele_indices for sample in site.samples.values()]))
+            if gtfilter : values.append(gtfilter.record_values(site))
+
+        if sites : yield VCFIterator.filter_chunk(current, sites, nsamples, ploidy, gtfilter, values)
+        if first is not None : stats.bytes += (self.vcf.tell() >> 16) - (first >> 16)
+
     # Custom modifier
 
     @staticmethod
@@ -150,8 +594,57 @@ class VCFIterator() :
 
         return data
 
+    @staticmethod
+    def filter_chunk(contig, sites, nsamples, ploidy, gtfilter, values) :
+        # make_chunk with the genotypes failing gtfilter set as missing, evaluated at once for the chunk
+        chunk = VCFIterator.make_chunk(contig, sites, nsamples, ploidy)
+        return gtfilter.mask_chunk(chunk, gtfilter.evaluate(values, nsamples)) if gtfilter else chunk
+
+    @staticmethod
+    def make_chunk(contig, sites, nsamples, ploidy) :
+        positions, refs, alts, gts = zip(* sites)
+
+        positions = np.array(positions, dtype=np.int64)
+        refs = np.array(refs, dtype=object)
+
+        nalts = max(len(alleles) for alleles in alts)
+        alts_table = np.full((len(alts), nalts), None, dtype=object)
+        for idx, alleles in enumerate(alts) :
+            alts_table[idx, :len(alleles)] = alleles
+
+        return GTChunk(contig, positions, refs, alts_table, VCFIterator.gt_array(gts, nsamples, ploidy))
+
+    @staticmethod
+    def gt_array(gts, nsamples, ploidy) :
+        # Convert a list of per site allele indices (with None for missing)
+        # into an int8 array of shape (sites, samples, ploidy)
+
+        array = np.array(gts, dtype=object)
+
+        if array.shape != (len(gts), nsamples, ploidy) :
+            # mixed ploidy, we fill the unused slots
+            array = np.full((len(gts), nsamples, ploidy), GT_PADDING, dtype=object)
+            for sidx, site in enumerate(gts) :
+                for idx, indices in enumerate(site) :
+                    if len(indices) > ploidy : raise PyVCFError("Ploidy higher than expected (%i) : %s" %(ploidy, str(indices)))
+                    array[sidx, idx, :len(indices)] = indices
+
+        array[np.equal(array, None)] = GT_MISSING
+        array = array.astype(np.int16)
+
+        # int8 would silently wrap higher indices into other alleles or missing values
+        if array.size and array.max() > np.iinfo(np.int8).max :
+            raise PyVCFError("Allele index higher than %i, not supported by genotypes matrices" %(np.iinfo(np.int8).max))
+
+        return array.astype(np.int8)
+
     @staticmethod
     def acount(variants, freq=False) :
         c = Counter(chain(variants.values()))
         if freq : c = {variant : count / sum(c.values()) for variant, count in c.items()}
-        return c   
\ No newline at end of file
+        return c   
+
+def as_iterator(vcf, * args, ** kwargs) :
+    # VCFIterator from a vcf file or a list of vcf files, other values are returned as they are
+    # args and kwargs are given to VCFIterator for files only
+    return VCFIterator(vcf, * args, ** kwargs) if isinstance(vcf, (str, list, tuple)) else vcf
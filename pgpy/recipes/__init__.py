@@ -2,7 +2,23 @@
 # @Author: jsgounot
 # @Date:   2018-11-21 11:13:09
 # @Last modified by:   jsgounot
-# @Last Modified time: 2018-11-28 11:33:05
+# @Last Modified time: 2026-10-18 21:48:05
 
-from pgpy.recipes.maf import *
-from pgpy.recipes.divergence import *
\ No newline at end of file
+from pgpy.core.lazy import lazy_attributes
+
+# Recipes are imported on first access to one of their names (they need pandas)
+# pgpy.recipes.maf is the maf function, as with the previous wildcard imports
+
+RECIPES = {
+    "maf" : ["maf_snp_modifier", "SFSAccumulator", "maf_frame", "merge_maf", "maf", "project_sfs", "fold_sfs", "sfs"],
+    "divergence" : ["ref_div_modifier", "ref_strict_div", "ref_clean_diff", "ref_divergence", "merge_ref_divergence",
+        "ref_divergence_wg", "pw_div_modifier", "pairwise_strict_div", "pairwise_clean_diff", "pairwise_masks",
+        "pairwise_block_div", "pairwise_matrix_div", "pairwise_divergence", "pairwise_dict_div",
+        "RefDivAccumulator", "PairwiseDivAccumulator"],
+    "popstats" : ["harmonic", "pairs_divergence", "tajima_d", "WindowStatsAccumulator", "window_stats"],
+    "ld" : ["snp_dosages", "ld_r2", "minor_frequencies", "population_groups", "ld_blocks", "ld_pairs",
+        "ld_decay_region", "merge_ld_decay", "ld_decay"],
+}
+
+__all__ = [name for names in RECIPES.values() for name in names]
+__getattr__, __dir__ = lazy_attributes(globals(), __name__, RECIPES)
@@ -6,11 +6,14 @@
 
 from itertools import combinations
 
+import numpy as np
 import pandas as pd
 
-from pgpy import VCFIterator as VI
+from pgpy.core.vcf import as_iterator
 from pgpy import PyVCFError
-from pgpy.core.processing import apply_mp_contig
+from pgpy.core.modifiers import string_equivalent
+from pgpy.core.processing import apply_mp_contig, apply_mp_shards, register_merge
+from pgpy.core.scan import Accumulator
 
 def ref_div_modifier(alts, site, snps=True, modifier=None) :
 
@@ -45,7 +48,7 @@ def ref_divergence(vcf, * args, snps=True, strict=True, ** kwargs) :
 
     # Faster than pairwise divergence
 
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf
+    vcf = as_iterator(vcf)
     previous = vcf.modifier
     vcf.modifier = lambda * args : ref_div_modifier(* args, snps, previous)
 
@@ -64,9 +67,25 @@ def ref_divergence(vcf, * args, snps=True, strict=True, ** kwargs) :
     data = ({"sample" : sample, "diff" : count} for sample, count in data.items())
     return pd.DataFrame(data).sort_values(by="sample")
 
-def ref_divergence_wg(vcf, * args, ncore=4, ** kwargs) :
+def merge_ref_divergence(results) :
 
-    results = apply_mp_contig(vcf, ref_divergence, * args, ncore=ncore, ** kwargs)
+    # sum partial results per contig
+    merged = {}
+
+    for region, result in results.items() :
+        result = result.set_index("sample")["diff"]
+        merged[region.contig] = merged[region.contig] + result if region.contig in merged else result
+
+    return {contig : result.rename("diff").reset_index() for contig, result in merged.items()}
+
+register_merge(ref_divergence, merge_ref_divergence)
+
+def ref_divergence_wg(vcf, * args, ncore=4, nshards=None, ** kwargs) :
+
+    # nshards : split the genome into variants balanced shards instead of one task per contig
+
+    if nshards : results = apply_mp_shards(vcf, ref_divergence, * args, nshards=nshards, ncore=ncore, ** kwargs)
+    else : results = apply_mp_contig(vcf, ref_divergence, * args, ncore=ncore, ** kwargs)
 
     mpres = []
     for contig, result in results.items() :
@@ -108,9 +127,106 @@ def pairwise_clean_diff(variants, combinations, data) :
 
     pass
 
-def pairwise_divergence(vcf, * args, snps=True, strict=True, addRef=True, ** kwargs) :
+def pairwise_masks(chunk, snps=True) :
+
+    # Encode each sample genotype as a bitmask of the alleles it carries
+    # Alleles are compared as pw_div_modifier does : first base with snps,
+    # missing values replaced by the reference
+
+    nsites, nalleles = chunk.nsites, chunk.alts.shape[1] + 1
+
+    # two extra columns for padding (-2) and missing (-1) allele indices
+    codes = np.zeros((nsites, nalleles + 2), dtype=np.int64)
+
+    for sidx, alleles in enumerate(chunk.alleles) :
+        known = {}
+
+        for aidx, allele in enumerate(alleles) :
+            if allele is None : continue
+            allele = allele[0] if snps else allele
+            codes[sidx, aidx] = 1 << known.setdefault(allele, len(known))
+
+        codes[sidx, -1] = 1 << known.setdefault(alleles[0], len(known))
+
+    if codes.max() >= 1 << 62 : raise PyVCFError("Too many alleles for the matrix backend")
+
+    masks = codes[np.arange(nsites)[:, None, None], chunk.gts]
+    return np.bitwise_or.reduce(masks, axis=2)
+
+def pairwise_block_div(masks) :
+
+    # Count differences between all pairs of samples for a block of sites
+    # Sites with two values use a single indicator column, since the pair differs
+    # when exactly one sample carries it, other sites use a one-hot encoding
+
+    nsamples = masks.shape[1]
+    smasks = np.sort(masks, axis=1)
+    nvalues = 1 + (np.diff(smasks, axis=1) != 0).sum(axis=1)
+
+    biallelic = nvalues == 2
+    indicator = (masks[biallelic] == smasks[biallelic, :1]).astype(np.float32)
+    counts = indicator.sum(axis=0)
+    dmat = counts[:, None] + counts[None, :] - 2 * (indicator.T @ indicator)
+
+    multi = masks[nvalues > 2]
+    if len(multi) :
+        _, values = np.unique(multi, return_inverse=True)
+        keys = np.arange(len(multi))[:, None] * (values.max() + 1) + values.reshape(multi.shape)
+        _, columns = np.unique(keys, return_inverse=True)
+
+        onehot = np.zeros((nsamples, columns.max() + 1), dtype=np.float32)
+        onehot[np.arange(nsamples)[None, :], columns.reshape(multi.shape)] = 1
+        dmat += len(multi) - onehot @ onehot.T
+
+    return np.rint(dmat).astype(np.int64)
+
+def pairwise_matrix_div(vcf, * args, snps=True, block=2048, ** kwargs) :
+
+    modifier = string_equivalent(vcf.modifier)
+    nsamples = len(vcf.samples)
+    dmat = np.zeros((nsamples, nsamples), dtype=np.int64)
+
+    for chunk in vcf.fetch_matrix(* args, ** kwargs) :
+        if modifier : chunk = modifier(chunk)
+        masks = pairwise_masks(chunk, snps)
+        for idx in range(0, len(masks), block) :
+            dmat += pairwise_block_div(masks[idx:idx+block])
+
+    return dmat
+
+def pairwise_divergence(vcf, * args, snps=True, strict=True, addRef=True, matrix=False, squared=False, ** kwargs) :
+
+    # matrix : use the vectorized backend working on genotype matrices
+    # squared : also return a square distance matrix ordered as vcf.samples
+
+    vcf = as_iterator(vcf)
+    samples = vcf.samples
+
+    if matrix :
+        if not strict : raise PyVCFError("Matrix backend only supports strict divergence")
+        dmat = pairwise_matrix_div(vcf, * args, snps=snps, ** kwargs)
+        sidx = {sample : idx for idx, sample in enumerate(samples)}
+        data = {(s1, s2) : dmat[sidx[s1], sidx[s2]] for s1, s2 in combinations(samples, 2)}
+
+    else :
+        data = pairwise_dict_div(vcf, * args, snps=snps, strict=strict, addRef=addRef, ** kwargs)
+        dmat = None
+
+    df = ({"sample1" : pair[0], "sample2" : pair[1], "diff" : count} for pair, count in data.items())
+    df = pd.DataFrame(df).sort_values(by=["sample1", "sample2"])
+    
+    if not squared : return df
+
+    if dmat is None :
+        sidx = {sample : idx for idx, sample in enumerate(samples)}
+        dmat = np.zeros((len(samples), len(samples)), dtype=np.int64)
+        for (s1, s2), count in data.items() :
+            dmat[sidx[s1], sidx[s2]] = dmat[sidx[s2], sidx[s1]] = count
+
+    return df, dmat
+
+def pairwise_dict_div(vcf, * args, snps=True, strict=True, addRef=True, ** kwargs) :
 
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf
     previous = vcf.modifier
     vcf.modifier = lambda * args : pw_div_modifier(* args, snps, previous)
 
@@ -131,5 +247,73 @@ def pairwise_divergence(vcf, * args, snps=True, strict=True, addRef=True, ** kwa
 
         fun(variants, poss, data, haploid)
 
-    data = ({"sample1" : pair[0], "sample2" : pair[1], "diff" : count} for pair, count in data.items())
-    return pd.DataFrame(data).sort_values(by=["sample1", "sample2"])
\ No newline at end of file
+    return data
+
+# -------------------
+# Fused scan accumulators (see core.scan)
+# -------------------
+
+class RefDivAccumulator(Accumulator) :
+
+    # Same counts as ref_divergence with strict mode : a sample differs when one of its
+    # called alleles (first base with snps) is not the reference, missing samples are ignored
+
+    def __init__(self, snps=True) :
+        self.snps = snps
+        self.samples = None
+        self.counts = None
+
+    def setup(self, vcf) :
+        self.samples = list(vcf.samples)
+        self.counts = np.zeros(len(self.samples), dtype=np.int64)
+
+    def update(self, chunk) :
+        alleles = chunk.alleles
+        if self.snps : alleles = np.vectorize(lambda allele : allele and allele[0], otypes=[object])(alleles)
+
+        # padding (-2) and missing (-1) columns are neutral
+        same = np.ones((chunk.nsites, alleles.shape[1] + 2), dtype=bool)
+        same[:, :-2] = alleles == chunk.refs[:, None]
+
+        same = same[np.arange(chunk.nsites)[:, None, None], chunk.gts].all(axis=2)
+        called = (chunk.gts >= 0).any(axis=2)
+        self.counts += (called & ~ same).sum(axis=0)
+
+    def merge(self, other) :
+        self.counts += other.counts
+        return self
+
+    def result(self) :
+        data = ({"sample" : sample, "diff" : count} for sample, count in zip(self.samples, self.counts))
+        return pd.DataFrame(data).sort_values(by="sample")
+
+class PairwiseDivAccumulator(Accumulator) :
+
+    # Same counts as pairwise_divergence with the matrix backend
+    # squared : result is (df, dmat) instead of df
+
+    def __init__(self, snps=True, block=2048, squared=False) :
+        self.snps = snps
+        self.block = block
+        self.squared = squared
+        self.samples = None
+        self.dmat = None
+
+    def setup(self, vcf) :
+        self.samples = list(vcf.samples)
+        self.dmat = np.zeros((len(self.samples), len(self.samples)), dtype=np.int64)
+
+    def update(self, chunk) :
+        masks = pairwise_masks(chunk, self.snps)
+        for idx in range(0, len(masks), self.block) :
+            self.dmat += pairwise_block_div(masks[idx:idx+self.block])
+
+    def merge(self, other) :
+        self.dmat += other.dmat
+        return self
+
+    def result(self) :
+        sidx = {sample : idx for idx, sample in enumerate(self.samples)}
+        df = ({"sample1" : s1, "sample2" : s2, "diff" : self.dmat[sidx[s1], sidx[s2]]} for s1, s2 in combinations(self.samples, 2))
+        df = pd.DataFrame(df).sort_values(by=["sample1", "sample2"])
+        return (df, self.dmat) if self.squared else df
@@ -4,38 +4,153 @@
 # @Last modified by:   jsgounot
 # @Last Modified time: 2019-06-18 18:15:05
 
-from pgpy import VCFIterator as VI
-from collections import defaultdict
+from pgpy.core.vcf import as_iterator
+from pgpy.core.vcf import GT_MISSING, GT_PADDING
+from pgpy.core.modifiers import no_indel_modifier
+from pgpy.core.scan import Accumulator, scan_region
+from pgpy.core.processing import apply_mp_contig
+from functools import reduce
+import numpy as np
 import pandas as pd
 
 def snp_modifier_ref(alts, site) :
     return tuple(alt[0] if alt else site.ref[0] for alt in alts)
 
-def homhet_window(vcf, wsize=10000, snp_modifier=True) :
-    
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf
-    data = defaultdict(lambda : defaultdict(lambda : defaultdict(lambda : defaultdict(int))))
-        
-    if snp_modifier :
-        vcf.modifier = snp_modifier_ref
-
-    for contig, position, ref, variants in vcf.fetch() :
-        window = position // wsize * wsize
-            
-        for sample, variant in variants.items() :
-            lvariants = len(set(variant))
-            if lvariants  == 1 : data[sample][contig][window]["hom"] += 1
-            elif lvariants > 1 : data[sample][contig][window]["het"] += 1
-            else : raise Exception("Category error : %s" %(str(variant)))
-    
-    data = [{"sample" : sample, "contig" : contig, "window" : window, ** values}
-           for sample, contigs in data.items() for contig, windows in contigs.items()
-           for window, values in windows.items()]
-    
-    df = pd.DataFrame(data)
-    df["hom"] = df["hom"].fillna(0).astype(int)
-
-    if "het" in df.columns : df["het"] = df["het"].fillna(0).astype(int)
-    else : df["het"] = 0
-
-    return df
\ No newline at end of file
+class HomHetAccumulator(Accumulator) :
+
+    # Windowed homozygous / heterozygous counts, genotypes without any called allele are counted as missing
+    # Counts are stored per contig as int32 (samples, windows, [hom, het, missing]) arrays,
+    # only covering the windows seen (shards only hold the windows they read)
+    # Custom string modifiers are applied with fetch, see update_site
+
+    CATEGORIES = ("hom", "het", "missing")
+
+    def __init__(self, wsize=10000, snp_modifier=True) :
+        self.wsize = wsize
+        self.snps = snp_modifier
+        self.chunk_modifier = no_indel_modifier if snp_modifier else None
+        self.samples = None
+        self.sindex = None
+        self.called = False
+        self.counts = {}
+        self.bounds = {}
+
+    def setup(self, vcf) :
+        # string modifiers drop missing alleles, only called alleles are compared as fetch would
+        self.called = vcf.modifier is not None
+        self.samples = list(vcf.samples)
+        self.sindex = {sample : idx for idx, sample in enumerate(self.samples)}
+
+    def categories(self, gts) :
+        # (sites, samples) category index of each genotype
+        missing = (gts < 0).all(axis=2)
+
+        gts = gts.copy()
+        if self.snps : gts[gts == GT_MISSING] = 0
+
+        # padding slots get the value of the first slot, missing ones the value
+        # of a called allele when they are dropped (see setup)
+        if self.called : empty, fill = gts < 0, gts.max(axis=2, keepdims=True)
+        else : empty, fill = gts == GT_PADDING, gts[:, :, :1]
+        gts[empty] = np.broadcast_to(fill, gts.shape)[empty]
+
+        categories = (np.diff(np.sort(gts, axis=2), axis=2) != 0).any(axis=2).astype(np.int64)
+        categories[missing] = 2
+        return categories
+
+    def __getstate__(self) :
+        # partial results sent back by workers only hold the windows seen
+        state = self.__dict__.copy()
+        state["counts"] = {contig : self.windows(contig)[0] for contig in self.counts}
+        return state
+
+    def windows(self, contig) :
+        # counts of the windows seen and the index of the first one
+        first, end = self.bounds[contig]
+        return self.counts[contig][:, :end - first], first
+
+    def grow(self, contig, low, high) :
+        # counts array covering windows low to high (excluded) and the index of its first window
+        # capacity is doubled to avoid a copy for each chunk, bounds : (first, last + 1) windows seen
+
+        counts = self.counts.get(contig)
+        if counts is None :
+            counts, first, end = np.zeros((len(self.samples), high - low, 3), dtype=np.int32), low, high
+
+        else :
+            first, end = self.bounds[contig]
+            if low < first :
+                counts = np.pad(counts, ((0, 0), (first - low, 0), (0, 0)))
+                first = low
+            if counts.shape[1] < high - first :
+                size = max(high - first, counts.shape[1] * 2)
+                counts = np.pad(counts, ((0, 0), (0, size - counts.shape[1]), (0, 0)))
+
+        self.counts[contig] = counts
+        self.bounds[contig] = (first, max(end, high))
+        return counts, first
+
+    def update(self, chunk) :
+        categories = self.categories(chunk.gts)
+        onehot = np.zeros(categories.shape + (3, ), dtype=np.int32)
+        np.put_along_axis(onehot, categories[:, :, None], 1, axis=2)
+
+        # sites are sorted, one sum per window
+        windows = chunk.positions // self.wsize
+        starts = np.flatnonzero(np.r_[True, np.diff(windows) != 0])
+        sums = np.add.reduceat(onehot, starts, axis=0)
+
+        counts, first = self.grow(chunk.contig, windows[0], windows[-1] + 1)
+        counts[:, windows[starts] - first] += sums.transpose(1, 0, 2)
+
+    def update_site(self, contig, position, ref, variants) :
+        # same categories from the alleles given by fetch, samples removed by the modifier are not counted
+        window = position // self.wsize
+        counts, first = self.grow(contig, window, window + 1)
+
+        for sample, alts in variants.items() :
+            missing = all(alt is None for alt in alts)
+            if self.snps : alts = tuple(alt[0] if alt else ref[0] for alt in alts)
+            category = 2 if missing else int(len(set(alts)) > 1)
+            counts[self.sindex[sample], window - first, category] += 1
+
+    def merge(self, other) :
+        for contig in other.counts :
+            ocounts, ofirst = other.windows(contig)
+            counts, first = self.grow(contig, ofirst, ofirst + ocounts.shape[1])
+            counts[:, ofirst - first : ofirst - first + ocounts.shape[1]] += ocounts
+        return self
+
+    def result(self) :
+        dfs = []
+
+        for contig in self.counts :
+            counts, first = self.windows(contig)
+            sidx, widx = np.nonzero(counts.sum(axis=2))
+            df = pd.DataFrame({"sidx" : sidx, "contig" : contig, "window" : (widx + first) * self.wsize})
+            for idx, category in enumerate(HomHetAccumulator.CATEGORIES) : df[category] = counts[sidx, widx, idx].astype(np.int64)
+            dfs.append(df)
+
+        columns = ["sample", "contig", "window"] + list(HomHetAccumulator.CATEGORIES)
+        if not dfs : return pd.DataFrame(columns=columns)
+
+        # samples order first, as homhet_window
+        df = pd.concat(dfs, ignore_index=True).sort_values("sidx", kind="stable")
+        df["sample"] = np.array(self.samples, dtype=object)[df["sidx"].values]
+        return df[columns].reset_index(drop=True)
+
+def homhet_counts(vcf, wsize=10000, snp_modifier=True, ** kwargs) :
+    return scan_region(vcf, {"homhet" : HomHetAccumulator(wsize, snp_modifier)}, ** kwargs)["homhet"]
+
+def homhet_window(vcf, wsize=10000, snp_modifier=True, ncore=1) :
+
+    # Number of homozygous, heterozygous and missing genotypes per sample and window
+    # snp_modifier : alleles are compared on their first base and partially missing genotypes
+    # use the reference for their missing alleles
+
+    vcf = as_iterator(vcf)
+
+    if ncore == 1 : accumulator = homhet_counts(vcf, wsize, snp_modifier)
+    else : accumulator = reduce(HomHetAccumulator.merge, apply_mp_contig(vcf, homhet_counts, wsize, snp_modifier, ncore=ncore).values())
+
+    return accumulator.result()
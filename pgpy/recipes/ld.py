@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 23:12:40
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 23:12:40
+
+import numpy as np
+import pandas as pd
+
+from pgpy.core.vcf import as_iterator
+from pgpy import PyVCFError
+from pgpy.core.vcf import GT_MISSING
+from pgpy.core.modifiers import string_equivalent
+from pgpy.core.processing import apply_mp_shards, register_merge
+
+# Linkage disequilibrium (r2) between biallelic snps within maxdist positions
+# Genotypes are used as alternative allele dosages, r2 is the squared Pearson correlation
+# of the dosages over the samples called at both sites, computed for blocks of sites with
+# matrix products against the previous sites still within maxdist (memory depends on maxdist only)
+# A pair is reported by the region owning its right site, sharded runs read maxdist positions
+# before their start as context
+
+def snp_dosages(chunk) :
+
+    # positions, dosages and called alleles (sites, samples) of the biallelic snps of a chunk
+    # samples with a missing allele have 0 called alleles
+
+    alts = chunk.alts
+    if alts.shape[1] == 0 : return chunk.positions[:0], np.zeros((0, chunk.gts.shape[1])), np.zeros((0, chunk.gts.shape[1]))
+
+    snps = np.array([len(ref) == 1 and alt is not None and len(alt) == 1 and alt != "*"
+        for ref, alt in zip(chunk.refs, alts[:, 0])], dtype=bool)
+    if alts.shape[1] > 1 : snps &= np.equal(alts[:, 1:], None).all(axis=1)
+
+    gts = chunk.gts[snps]
+    missing = (gts == GT_MISSING).any(axis=2)
+    dosages = np.where(missing, 0, (gts == 1).sum(axis=2)).astype(np.float64)
+    called = np.where(missing, 0, (gts >= 0).sum(axis=2)).astype(np.float64)
+    return chunk.positions[snps], dosages, called
+
+def ld_r2(xa, na, xb, nb) :
+
+    # r2 between the sites of a (rows) and b (columns), from their dosages x and called alleles n
+    # nan when less than two samples are called at both sites or when one site is monomorphic
+
+    ma, mb = (na > 0).astype(np.float64), (nb > 0).astype(np.float64)
+
+    n = ma @ mb.T
+    sa, sb = xa @ mb.T, ma @ xb.T
+
+    with np.errstate(divide="ignore", invalid="ignore") :
+        cov = xa @ xb.T - sa * sb / n
+        va = (xa ** 2) @ mb.T - sa ** 2 / n
+        vb = ma @ (xb ** 2).T - sb ** 2 / n
+        r2 = np.minimum(cov ** 2 / (va * vb), 1)
+
+    # dosages are integers, a non zero sum of squared deviations is at least 1 / 2
+    return np.where((n > 1) & (va > 1e-6) & (vb > 1e-6), r2, np.nan)
+
+def minor_frequencies(dosages, called) :
+    total = called.sum(axis=1)
+    freqs = np.divide(dosages.sum(axis=1), total, out=np.zeros(len(total)), where=total > 0)
+    return np.minimum(freqs, 1 - freqs)
+
+def population_groups(vcf, populations=None) :
+    populations = populations or {"all" : vcf.samples}
+    sidx = {sample : idx for idx, sample in enumerate(vcf.samples)}
+
+    unknown = [sample for samples in populations.values() for sample in samples if sample not in sidx]
+    if unknown : raise PyVCFError("Samples not found in vcf : %s" %(", ".join(unknown)))
+
+    return {name : [sidx[sample] for sample in samples] for name, samples in populations.items()}
+
+def ld_blocks(vcf, groups, maxdist=10000, contig=None, start=None, end=None, min_maf=0., block=512, chunk_size=10000) :
+
+    # Yield (contig, positions, nrows, r2s) for each block of sites
+    # r2s : dict group -> (nrows, len(positions)) array, r2 between the last nrows sites of
+    # positions and all of them, nan for pairs which are not reported
+    # groups : dict name -> samples indices
+    # start, end : sites starting before start are only used as context for the next ones
+
+    if maxdist < 1 : raise PyVCFError("maxdist must be a positive integer")
+
+    # context sites are not owned by the shard
+    vcf = vcf.copy()
+    vcf.shard = None
+    fstart = None if start is None else max(start - maxdist, 0)
+
+    nsamples = len(vcf.samples)
+    current, bpos, bx, bn = None, None, None, None
+    modifier = string_equivalent(vcf.modifier)
+
+    for chunk in vcf.fetch_matrix(contig, fstart, end, chunk_size=chunk_size) :
+        if modifier : chunk = modifier(chunk)
+        positions, dosages, called = snp_dosages(chunk)
+
+        if chunk.contig != current :
+            current = chunk.contig
+            bpos, bx, bn = np.zeros(0, dtype=np.int64), np.zeros((0, nsamples)), np.zeros((0, nsamples))
+
+        for idx in range(0, len(positions), block) :
+            npos = positions[idx:idx+block]
+
+            # previous sites within maxdist of the block
+            keep = bpos >= npos[0] - maxdist
+            bpos = np.concatenate((bpos[keep], npos))
+            bx = np.concatenate((bx[keep], dosages[idx:idx+block]))
+            bn = np.concatenate((bn[keep], called[idx:idx+block]))
+            nrows = len(npos)
+
+            # positions are sorted, a positive distance means a previous site
+            distances = npos[:, None] - bpos[None, :]
+            valid = (distances > 0) & (distances <= maxdist)
+            if start is not None : valid &= (npos - 1 >= start)[:, None]
+            if not valid.any() : continue
+
+            r2s = {}
+            for name, indices in groups.items() :
+                x, n = bx[:, indices], bn[:, indices]
+                r2 = ld_r2(x[-nrows:], n[-nrows:], x, n)
+
+                if min_maf > 0 :
+                    common = minor_frequencies(x, n) >= min_maf
+                    r2[:, ~ common] = np.nan
+                    r2[~ common[-nrows:]] = np.nan
+
+                r2[~ valid] = np.nan
+                r2s[name] = r2
+
+            yield current, bpos, nrows, r2s
+
+def ld_pairs(vcf, contig=None, start=None, end=None, samples=None, maxdist=10000, min_maf=0., block=512, chunk_size=10000) :
+
+    # Table of the r2 between biallelic snps of a region within maxdist positions
+    # samples : samples used, all when None
+
+    vcf = as_iterator(vcf)
+    groups = population_groups(vcf, {"samples" : samples} if samples is not None else None)
+    dfs = []
+
+    for current, positions, nrows, r2s in ld_blocks(vcf, groups, maxdist, contig, start, end, min_maf, block, chunk_size) :
+        r2 = next(iter(r2s.values()))
+        rows, columns = np.nonzero(~ np.isnan(r2))
+        pos2 = positions[-nrows:][rows]
+        pos1 = positions[columns]
+        dfs.append(pd.DataFrame({"contig" : current, "pos1" : pos1, "pos2" : pos2, "distance" : pos2 - pos1, "r2" : r2[rows, columns]}))
+
+    columns = ["contig", "pos1", "pos2", "distance", "r2"]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=columns)
+
+def ld_decay_region(vcf, populations=None, maxdist=10000, binsize=100, min_maf=0., block=512, contig=None, start=None, end=None, chunk_size=10000) :
+
+    # Number of pairs and sum of r2 per distance bin for each population
+    # returns dict population -> (pairs, sums), arrays of ceil(maxdist / binsize) bins
+
+    vcf = as_iterator(vcf)
+    if binsize < 1 : raise PyVCFError("binsize must be a positive integer")
+
+    groups = population_groups(vcf, populations)
+    nbins = - (- maxdist // binsize)
+    data = {name : (np.zeros(nbins, dtype=np.int64), np.zeros(nbins)) for name in groups}
+
+    for current, positions, nrows, r2s in ld_blocks(vcf, groups, maxdist, contig, start, end, min_maf, block, chunk_size) :
+        bins = (positions[-nrows:][:, None] - positions[None, :] - 1) // binsize
+
+        for name, r2 in r2s.items() :
+            valid = ~ np.isnan(r2)
+            pairs, sums = data[name]
+            pairs += np.bincount(bins[valid], minlength=nbins)
+            sums += np.bincount(bins[valid], weights=r2[valid], minlength=nbins)
+
+    return data
+
+def merge_ld_decay(results) :
+
+    # sum partial results of all regions
+    merged = {}
+
+    for region, result in results.items() :
+        for name, (pairs, sums) in result.items() :
+            mpairs, msums = merged.setdefault(name, (np.zeros_like(pairs), np.zeros_like(sums)))
+            mpairs += pairs
+            msums += sums
+
+    return merged
+
+register_merge(ld_decay_region, merge_ld_decay)
+
+# apply_mp_shards arguments, not used by a serial run
+SHARDS_KWARGS = ("executor", "result_cache", "fetch_stats", "by", "merge")
+
+def ld_decay(vcf, populations=None, maxdist=10000, binsize=100, min_maf=0., block=512, ncore=1, nshards=None, ** kwargs) :
+
+    # LD decay curves : mean r2 between biallelic snps per distance bin and population
+    # Bins are distances ranges (start, end] of binsize positions, up to maxdist
+    # populations : dict name -> samples, all samples are used as one population when None
+    # min_maf : minimum minor allele frequency of both sites within the population
+    # block : number of sites whose r2 are computed at once
+    # ncore, nshards : run on variants balanced shards with core.processing.apply_mp_shards,
+    # other kwargs are given to apply_mp_shards (e.g. executor, result_cache)
+
+    vcf = as_iterator(vcf)
+
+    if ncore > 1 or nshards :
+        data = apply_mp_shards(vcf, ld_decay_region, populations, maxdist, binsize, min_maf, block, nshards=nshards, ncore=ncore, ** kwargs)
+
+    else :
+        kwargs = {key : value for key, value in kwargs.items() if key not in SHARDS_KWARGS}
+        data = ld_decay_region(vcf, populations, maxdist, binsize, min_maf, block, ** kwargs)
+
+    dfs = []
+    for name, (pairs, sums) in data.items() :
+        starts = np.arange(len(pairs)) * binsize
+        r2 = np.divide(sums, pairs, out=np.full(len(pairs), np.nan), where=pairs > 0)
+        dfs.append(pd.DataFrame({"population" : name, "start" : starts, "end" : np.minimum(starts + binsize, maxdist), "pairs" : pairs, "r2" : r2}))
+
+    columns = ["population", "start", "end", "pairs", "r2"]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=columns)
@@ -4,50 +4,162 @@
 # @Last modified by:   jsgounot
 # @Last Modified time: 2019-05-28 11:51:39
 
-from collections import defaultdict
+from math import comb
+from collections import Counter
 
+import numpy as np
 import pandas as pd
 
-from pgpy import VCFIterator as VI
+from pgpy.core.vcf import as_iterator
 from pgpy import PyVCFError
-from pgpy.core.processing import apply_mp_contig
+from pgpy.core.processing import apply_mp_contig, apply_mp_shards, register_merge
+from pgpy.core.modifiers import no_indel_modifier
+from pgpy.core.scan import Accumulator, scan_region, fused_scan
+
+# Allele counts are computed per site from genotype matrices, missing alleles are not counted
+# Sites are grouped by integer bins (called alleles, non reference alleles, rarest allele count)
+# so that partial results of contigs or shards are merged exactly
 
 def maf_snp_modifier(alts, site) :
     return tuple(alt[0] if alt else site.ref[0] for alt in alts)
 
-def _maf(vcf, * args, addRef=False, snps=True, ** kwargs) :
+class SFSAccumulator(Accumulator) :
+
+    # Site frequency table for fused_scan : number of sites for each
+    # (SampleSize, NonRefCount, MinorCount) bin
+    # snps : alleles are compared on their first base
+    # addRef : the reference is counted as an additional haploid sample
+    # Custom string modifiers are applied with fetch, see update_site
+
+    COLUMNS = ["SampleSize", "NonRefCount", "MinorCount", "Sites"]
+
+    def __init__(self, snps=True, addRef=False) :
+        self.chunk_modifier = no_indel_modifier if snps else None
+        self.snps = snps
+        self.addRef = addRef
+        self.counts = Counter()
+
+    def update(self, chunk) :
+        counts = chunk.allele_counts()
+        if self.addRef : counts[:, 0] += 1
+
+        ncalled = counts.sum(axis=1)
+        nonref = ncalled - counts[:, 0]
+
+        # rarest allele among the observed ones, 0 for monomorphic sites
+        present = counts > 0
+        minor = np.where(present, counts, ncalled.max() + 1).min(axis=1)
+        minor[present.sum(axis=1) < 2] = 0
+
+        keys, counts = np.unique(np.column_stack((ncalled, nonref, minor)), axis=0, return_counts=True)
+        self.counts.update({tuple(int(value) for value in key) : int(count) for key, count in zip(keys, counts)})
 
-    vcf = VI(vcf) if isinstance(vcf, str) else vcf 
-    if snps : vcf.modifier = maf_snp_modifier
-    data = defaultdict(int)
+    def update_site(self, contig, position, ref, variants) :
+        # same bins from the alleles given by fetch
+        alleles = [allele for alts in variants.values() for allele in alts if allele is not None]
+        if self.snps : alleles, ref = [allele[0] for allele in alleles], ref[0]
 
-    # Check that ref is not a sample name
-    if "Reference" in vcf.samples and addRef : 
-        raise PyVCFError("Reference already found in sample")
+        counts = Counter(alleles)
+        if self.addRef : counts[ref] += 1
 
-    for contig, position, ref, variants in vcf.fetch( * args, ** kwargs) :
+        ncalled = sum(counts.values())
+        minor = min(counts.values()) if len(counts) > 1 else 0
+        self.counts[(ncalled, ncalled - counts[ref], minor)] += 1
 
-        if addRef : variants["Reference"] = (ref, )
-        acount = VI.acount(variants, freq=True)
-        data[min(acount.values())] += 1
+    def merge(self, other) :
+        self.counts.update(other.counts)
+        return self
 
-    # sometimes we can get a freq of 1 -> Case of indels and all variants are actually the reference
-    data = {freq : count for freq, count in data.items() if freq <= .5}
-    vcount = sum(len(alts) for alts in variants.values())
-    
-    df = pd.Series(data).to_frame().reset_index()
-    df.columns = ["SampleFreq", "AlleleCount"]
-    df["SampleCount"] = df["SampleFreq"] * vcount
+    def result(self) :
+        data = sorted(key + (count, ) for key, count in self.counts.items())
+        return pd.DataFrame(data, columns=SFSAccumulator.COLUMNS)
+
+# -------------------
+# Minor allele frequency
+# -------------------
+
+def maf_frame(df) :
+
+    # Group sites by minor allele count and sample size
+    # AlleleCount : number of sites, AlleleFreq : percentage of sites
+    # SampleCount : rarest allele count, SampleFreq : SampleCount / SampleSize
+
+    columns = ["AlleleCount", "AlleleFreq", "SampleCount", "SampleFreq", "SampleSize"]
+    if df.empty : return pd.DataFrame(columns=columns)
+
+    df = df.groupby(["SampleSize", "SampleCount"])["AlleleCount"].sum().reset_index()
+    df["SampleFreq"] = df["SampleCount"] / df["SampleSize"]
     df["AlleleFreq"] = df["AlleleCount"] * 100 / df["AlleleCount"].sum()
+    return df[columns]
+
+def _maf(vcf, * args, addRef=False, snps=True, ** kwargs) :
+
+    # Monomorphic sites are not reported
+
+    vcf = as_iterator(vcf)
+    table = scan_region(vcf, {"sfs" : SFSAccumulator(snps, addRef)}, * args, ** kwargs)["sfs"].result()
 
-    return df[sorted(df.columns)]
+    table = table[table["MinorCount"] > 0]
+    table = table.rename(columns={"MinorCount" : "SampleCount", "Sites" : "AlleleCount"})
+    return maf_frame(table)
 
-def maf(vcf, * args, ncore=1, ** kwargs) :
+def merge_maf(results) :
+    dfs = [df for df in results.values() if not df.empty]
+    return maf_frame(pd.concat(dfs) if dfs else pd.DataFrame())
+
+register_merge(_maf, merge_maf)
+
+def maf(vcf, * args, ncore=1, nshards=None, ** kwargs) :
+
+    # nshards : split the genome into variants balanced shards instead of one task per contig
+
+    if nshards : return apply_mp_shards(vcf, _maf, * args, nshards=nshards, ncore=ncore, ** kwargs)
     if ncore == 1 : return _maf(vcf, * args, ** kwargs)
+    return merge_maf(apply_mp_contig(vcf, _maf, * args, ncore=ncore, ** kwargs))
 
-    df = apply_mp_contig(vcf, _maf, * args, ncore=ncore, ** kwargs)
-    df = pd.concat(list(df.values()))
-    df = df.groupby(["SampleCount", "SampleFreq"])["AlleleCount"].sum()
-    df = df.rename("AlleleCount").reset_index()
-    df["AlleleFreq"] = df["AlleleCount"] * 100 / df["AlleleCount"].sum()
-    return df
\ No newline at end of file
+# -------------------
+# Site frequency spectrum
+# -------------------
+
+def project_sfs(table, size) :
+
+    # Unfolded spectrum of sample size from a SFSAccumulator table
+    # Sites with more called alleles are projected with an hypergeometric
+    # sampling, sites with less called alleles are not used
+
+    spectrum = np.zeros(size + 1)
+    table = table[table["SampleSize"] >= size].groupby(["SampleSize", "NonRefCount"])["Sites"].sum()
+
+    for (ncalled, nonref), sites in table.items() :
+        if ncalled == size :
+            spectrum[nonref] += sites
+            continue
+
+        total = comb(ncalled, size)
+        for count in range(max(0, size - ncalled + nonref), min(size, nonref) + 1) :
+            spectrum[count] += sites * comb(nonref, count) * comb(ncalled - nonref, size - count) / total
+
+    return spectrum
+
+def fold_sfs(spectrum) :
+    size = len(spectrum) - 1
+    folded = spectrum[:size // 2 + 1].copy()
+    folded[:(size + 1) // 2] += spectrum[::-1][:(size + 1) // 2]
+    return folded
+
+def sfs(vcf, folded=False, size=None, snps=True, addRef=False, ncore=1, nshards=None, ** kwargs) :
+
+    # Site frequency spectrum, unfolded spectrum is polarized against the reference
+    # (non reference alleles count), folded spectrum merges counts k and size - k
+    # size : sample size (number of alleles) of the spectrum, the highest number of called alleles
+    # by default, use a lower value to project sites with missing data instead of removing them
+    # ncore, nshards : see core.scan.fused_scan
+
+    table = fused_scan(vcf, {"sfs" : SFSAccumulator(snps, addRef)}, ncore=ncore, nshards=nshards, ** kwargs)["sfs"]
+    if table.empty : raise PyVCFError("No site found")
+
+    size = table["SampleSize"].max() if size is None else size
+    spectrum = project_sfs(table, size)
+    if folded : spectrum = fold_sfs(spectrum)
+
+    return pd.DataFrame({"Count" : np.arange(len(spectrum)), "Sites" : spectrum})
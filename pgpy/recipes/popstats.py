@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 19:12:37
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 19:12:37
+
+from math import gcd
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from pgpy import PyVCFError
+from pgpy.core.modifiers import no_indel_modifier
+from pgpy.core.scan import Accumulator, fused_scan
+
+# Windowed population genetics statistics computed from allele counts :
+# nucleotide diversity (pi), Watterson's theta, Tajima's D for each population,
+# dxy and Hudson's Fst for each pair of populations
+# Per site values are summed into bins of gcd(size, step) positions, bins are merged
+# exactly between shards and windows are made of consecutive bins
+
+def harmonic(nmax, power=1) :
+    # values[n] = sum 1 / i ** power for i in 1 .. n - 1
+    return np.concatenate(([0., 0.], np.cumsum(1. / np.arange(1, max(nmax, 1)) ** power)))
+
+def pairs_divergence(counts, n) :
+    # counts : (sites, 2, alleles), probability that two alleles of each population differ
+    shared = (counts[:, 0] * counts[:, 1]).sum(axis=1)
+    total = n[:, 0] * n[:, 1]
+    return np.divide(total - shared, total, out=np.zeros(len(total)), where=total > 0)
+
+def tajima_d(pi, segregating, n) :
+
+    # Tajima's D from windows sums, n is the highest number of called alleles
+
+    n = np.maximum(n, 2)
+    a1 = harmonic(n.max() + 1)[n]
+    a2 = harmonic(n.max() + 1, 2)[n]
+
+    b1 = (n + 1) / (3 * (n - 1))
+    b2 = 2 * (n ** 2 + n + 3) / (9 * n * (n - 1))
+    c1 = b1 - 1 / a1
+    c2 = b2 - (n + 2) / (a1 * n) + a2 / a1 ** 2
+    e1, e2 = c1 / a1, c2 / (a1 ** 2 + a2)
+
+    variance = e1 * segregating + e2 * segregating * (segregating - 1)
+    with np.errstate(divide="ignore", invalid="ignore") :
+        values = (pi - segregating / a1) / np.sqrt(variance)
+
+    # undefined without segregating sites or with only two alleles
+    return np.where((segregating > 0) & (variance > 0), values, np.nan)
+
+class WindowStatsAccumulator(Accumulator) :
+
+    # populations : dict name -> samples, all samples are used as one population when None
+    # size, step : windows size and step, tiled windows when step is None
+    # snps : alleles are compared on their first base
+    # normalize : pi, theta and dxy are given per position instead of per window
+
+    def __init__(self, populations=None, size=10000, step=None, snps=True, normalize=True) :
+        if size <= 0 or (step is not None and step <= 0) : raise PyVCFError("size and step must be positive")
+
+        self.populations = populations
+        self.size = size
+        self.step = step or size
+        self.binsize = gcd(self.size, self.step)
+        self.normalize = normalize
+        self.chunk_modifier = no_indel_modifier if snps else None
+
+        self.names = None
+        self.groups = None
+        self.lengths = None
+        self.bins = {}
+
+    def setup(self, vcf) :
+        populations = self.populations or {"all" : vcf.samples}
+        sidx = {sample : idx for idx, sample in enumerate(vcf.samples)}
+
+        unknown = [sample for samples in populations.values() for sample in samples if sample not in sidx]
+        if unknown : raise PyVCFError("Samples not found in vcf : %s" %(", ".join(unknown)))
+
+        self.names = list(populations)
+        self.groups = [[sidx[sample] for sample in samples] for samples in populations.values()]
+        self.lengths = {contig : record.length for contig, record in vcf.vcf.header.contigs.items()}
+
+    @property
+    def pairs(self) :
+        return list(combinations(range(len(self.names)), 2))
+
+    @property
+    def nfeatures(self) :
+        # variants, (pi, segregating, theta) per population, (dxy, fst numerator, fst denominator) per pair
+        return 1 + 3 * len(self.names) + 3 * len(self.pairs)
+
+    def grow(self, contig, nbins) :
+        values, nmax = self.bins.get(contig, (np.zeros((0, self.nfeatures)), np.zeros((0, len(self.names)), dtype=np.int64)))
+
+        if len(values) < nbins :
+            values = np.pad(values, ((0, nbins - len(values)), (0, 0)))
+            nmax = np.pad(nmax, ((0, nbins - len(nmax)), (0, 0)))
+
+        self.bins[contig] = values, nmax
+        return values, nmax
+
+    def update(self, chunk) :
+        counts = chunk.allele_counts(self.groups)
+        n = counts.sum(axis=2)
+        npops = len(self.names)
+
+        values = np.zeros((chunk.nsites, self.nfeatures))
+        values[:, 0] = 1
+
+        pairs = n * (n - 1)
+        pi = np.divide(n ** 2 - (counts ** 2).sum(axis=2), pairs, out=np.zeros(n.shape), where=pairs > 0)
+        segregating = (counts > 0).sum(axis=2) > 1
+
+        values[:, 1:1+npops] = pi
+        values[:, 1+npops:1+2*npops] = segregating
+        values[:, 1+2*npops:1+3*npops] = np.where(segregating, 1 / harmonic(max(n.max(), 2) + 1)[np.maximum(n, 2)], 0)
+
+        for idx, (p1, p2) in enumerate(self.pairs) :
+            column = 1 + 3 * npops + 3 * idx
+            dxy = pairs_divergence(counts[:, [p1, p2]], n[:, [p1, p2]])
+            valid = (n[:, p1] > 1) & (n[:, p2] > 1)
+            values[:, column] = dxy
+            values[:, column+1] = np.where(valid, dxy - (pi[:, p1] + pi[:, p2]) / 2, 0)
+            values[:, column+2] = np.where(valid, dxy, 0)
+
+        # sites are sorted, one sum per bin (1-based positions, 0-based windows)
+        bins = (chunk.positions - 1) // self.binsize
+        starts = np.flatnonzero(np.r_[True, np.diff(bins) != 0])
+
+        data, nmax = self.grow(chunk.contig, bins[-1] + 1)
+        data[bins[starts]] += np.add.reduceat(values, starts, axis=0)
+        nmax[bins[starts]] = np.maximum(nmax[bins[starts]], np.maximum.reduceat(n, starts, axis=0))
+
+    def merge(self, other) :
+        for contig, (values, nmax) in other.bins.items() :
+            data, cnmax = self.grow(contig, len(values))
+            data[:len(values)] += values
+            cnmax[:len(nmax)] = np.maximum(cnmax[:len(nmax)], nmax)
+        return self
+
+    def windows(self, contig, values, nmax) :
+        # sum bins of each window, up to the contig length when it is known
+        extent = self.lengths.get(contig) or len(values) * self.binsize
+        starts = np.arange(0, extent, self.step)
+        ends = np.minimum(starts + self.size, extent)
+
+        # bins are only grown up to the last site, windows can go past it up to the contig length
+        width = self.size // self.binsize
+        lows = starts // self.binsize
+        nbins = - (- extent // self.binsize) + width
+        values = np.pad(values[:nbins], ((0, nbins - min(len(values), nbins)), (0, 0)))
+        nmax = np.pad(nmax[:nbins], ((0, nbins - min(len(nmax), nbins)), (0, 0)))
+
+        cumsum = np.vstack((np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)))
+        sums = cumsum[lows + width] - cumsum[lows]
+        nmax = np.lib.stride_tricks.sliding_window_view(nmax, width, axis=0)[lows].max(axis=2)
+        return starts, ends, sums, nmax
+
+    def result(self) :
+        npops, dfs = len(self.names), []
+
+        for contig, (values, nmax) in self.bins.items() :
+            starts, ends, sums, nmax = self.windows(contig, values, nmax)
+            scale = ends - starts if self.normalize else 1
+            df = pd.DataFrame({"contig" : contig, "start" : starts, "end" : ends, "variants" : sums[:, 0].astype(np.int64)})
+
+            pi = sums[:, 1:1+npops]
+            segregating = sums[:, 1+npops:1+2*npops]
+            theta = sums[:, 1+2*npops:1+3*npops]
+            tajima = tajima_d(pi, segregating, nmax)
+
+            for idx, name in enumerate(self.names) :
+                df["pi_%s" %(name)] = pi[:, idx] / scale
+                df["theta_%s" %(name)] = theta[:, idx] / scale
+                df["segregating_%s" %(name)] = segregating[:, idx].astype(np.int64)
+                df["tajima_d_%s" %(name)] = tajima[:, idx]
+
+            for idx, (p1, p2) in enumerate(self.pairs) :
+                column, name = 1 + 3 * npops + 3 * idx, "%s_%s" %(self.names[p1], self.names[p2])
+                dxy, num, den = sums[:, column], sums[:, column+1], sums[:, column+2]
+                df["dxy_%s" %(name)] = dxy / scale
+                df["fst_%s" %(name)] = np.divide(num, den, out=np.full(len(num), np.nan), where=den > 0)
+
+            dfs.append(df)
+
+        return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=["contig", "start", "end", "variants"])
+
+def window_stats(vcf, populations=None, size=10000, step=None, snps=True, normalize=True, ncore=1, nshards=None, ** kwargs) :
+
+    # Windowed pi, theta, Tajima's D (per population), dxy and Fst (per pair of populations)
+    # Windows start at 0 and are spaced by step, a site at the 1-based position p is in bin (p - 1) // gcd(size, step)
+    # ncore, nshards : see core.scan.fused_scan
+
+    accumulator = WindowStatsAccumulator(populations, size, step, snps, normalize)
+    return fused_scan(vcf, {"stats" : accumulator}, ncore=ncore, nshards=nshards, ** kwargs)["stats"]
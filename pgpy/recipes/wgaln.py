@@ -4,19 +4,115 @@
 # @Last modified by:   jsgounot
 # @Last Modified time: 2018-11-28 17:07:41
 
+import os
 import operator
+import tempfile
 from functools import reduce
 
-from pgpy import VCFIterator as VI
-from pgpy.core.processing import apply_mp_contig
-from pgpy.core.aln import snps_aln
+import numpy as np
 
-def aln_wholegenome(vcf, fasta, ncore=4) :
+from pgpy.core.vcf import as_iterator
+from pgpy.core.processing import FKNT, apply_mp_contig, apply_mp_shards, plan_shards, register_merge
+from pgpy.core.aln import AlnException, snps_aln, get_reference
 
-	aln = apply_mp_contig(vcf, snps_aln, fasta, ncore=ncore)
-	aln = reduce(operator.add, aln.values())
+def merge_aln(results) :
+	# regions are ordered along the genome
+	return reduce(operator.add, results.values())
+
+register_merge(snps_aln, merge_aln)
+
+def aln_wholegenome(vcf, fasta, ncore=4, nshards=None, outfile=None, fmt="fasta", tmpdir=None) :
+
+	# nshards : split the genome into variants balanced shards instead of one task per contig
+	# outfile : stream the alignment to this file (fasta or phylip) instead of returning it
+
+	if outfile : return aln_wholegenome_file(vcf, fasta, outfile, ncore, nshards, fmt, tmpdir)
+
+	if nshards : aln = apply_mp_shards(vcf, snps_aln, fasta, nshards=nshards, ncore=ncore)
+	else : aln = merge_aln(apply_mp_contig(vcf, snps_aln, fasta, ncore=ncore))
 
 	for record in aln :
 		record.description = ""
 
-	return aln
\ No newline at end of file
+	return aln
+
+# -------------------
+# Streaming output
+# -------------------
+
+# Each worker writes its region columns into a preallocated memory mapped
+# uint8 matrix (sequences x genome length) and the final file is written
+# from this matrix row by row, so no process holds more than one region
+
+def aln_block(vcf, fasta, matrix, shape, offsets, contig=None, start=None, end=None) :
+
+	region = FKNT(contig, start, end)
+	aln = snps_aln(vcf, fasta, contig=contig, start=start, end=end)
+	offset, length = offsets[region]
+
+	if aln.get_alignment_length() != length :
+		raise AlnException("Unexpected alignment length for region : %s" %(str(region)))
+
+	data = np.memmap(matrix, dtype=np.uint8, mode="r+", shape=shape)
+	for idx, record in enumerate(aln) :
+		data[idx, offset:offset+length] = np.frombuffer(str(record.seq).encode(), dtype=np.uint8)
+
+	data.flush()
+	return [record.id for record in aln]
+
+def write_matrix(data, ids, outfile, fmt, buffer=1 << 20) :
+	
+	if fmt not in ("fasta", "phylip") : raise AlnException("Unknown format : %s" %(fmt))
+
+	with open(outfile, "w") as f :
+		if fmt == "phylip" : f.write(" %i %i\n" %(data.shape[0], data.shape[1]))
+
+		for idx, sid in enumerate(ids) :
+			f.write(">%s\n" %(sid) if fmt == "fasta" else "%s  " %(sid))
+			
+			for column in range(0, data.shape[1], buffer) :
+				f.write(data[idx, column:column+buffer].tobytes().decode())
+			
+			f.write("\n")
+
+def aln_wholegenome_file(vcf, fasta, outfile, ncore=4, nshards=None, fmt="fasta", tmpdir=None) :
+
+	vcf = as_iterator(vcf)
+	reference = get_reference(fasta)
+	lengths = dict(zip(reference.references, reference.lengths))
+
+	if nshards : regions = [region for shard in plan_shards(vcf, nshards) for region in shard]
+	else : regions = [FKNT(contig, None, None) for contig in vcf.contigs]
+
+	offsets, total = {}, 0
+	for region in regions :
+		if region.contig not in lengths :
+			raise AlnException("Contig not found in the reference sequence : %s" %(region.contig))
+		
+		length = (region.end or lengths[region.contig]) - (region.start or 0)
+		offsets[region] = (total, length)
+		total += length
+
+	ids = sorted("%s_%i" %(sample, idx) for sample, ploidy in vcf.ploidies.items()
+		for idx in range(1, ploidy + 1))
+	shape = (len(ids), total)
+
+	fd, matrix = tempfile.mkstemp(suffix=".aln", dir=tmpdir)
+	os.close(fd)
+
+	try :
+		np.memmap(matrix, dtype=np.uint8, mode="w+", shape=shape).flush()
+		args = (fasta, matrix, shape, offsets)
+
+		if nshards : results = apply_mp_shards(vcf, aln_block, * args, nshards=nshards, ncore=ncore).values()
+		else : results = apply_mp_contig(vcf, aln_block, * args, ncore=ncore).values()
+
+		if any(result != ids for result in results) :
+			raise AlnException("Sequences differ between regions")
+
+		write_matrix(np.memmap(matrix, dtype=np.uint8, mode="r", shape=shape), ids, outfile, fmt)
+
+	finally :
+		os.remove(matrix)
+
+	return outfile
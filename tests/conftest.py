@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:14:05
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:14:05
+
+import pysam
+import pytest
+
+# Small hand written vcf files, bgzipped and tabix indexed
+
+HEADER = """##fileformat=VCFv4.2
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+"""
+
+def write_vcf(path, contigs, samples, records, header="", fmt="GT") :
+    # contigs : dict name -> length, records : (contig, pos, ref, alts, genotypes strings[, qual, filter])
+    # header : additional header lines, fmt : FORMAT column of all records
+    with open(path, "w") as f :
+        f.write(HEADER + header)
+        for contig, length in contigs.items() : f.write("##contig=<ID=%s,length=%i>\n" %(contig, length))
+        f.write("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + samples) + "\n")
+        for contig, pos, ref, alts, gts, * site in records :
+            qual, filters = site or ("50", "PASS")
+            f.write("\t".join([contig, str(pos), ".", ref, alts, qual, filters, ".", fmt] + gts) + "\n")
+
+    pysam.tabix_compress(path, path + ".gz", force=True)
+    pysam.tabix_index(path + ".gz", preset="vcf", force=True)
+    return path + ".gz"
+
+@pytest.fixture
+def make_vcf(tmp_path) :
+    def make(name, contigs, samples, records, ** kwargs) :
+        return write_vcf(str(tmp_path / name), contigs, samples, records, ** kwargs)
+    return make
+
+# partially missing genotypes, an insertion and a multiallelic site
+MIXED_RECORDS = [
+    ("c1", 10, "A", "C", ["0/1", "1/1", "0/0", "./1"]),
+    ("c1", 20, "A", "AT", ["0/1", "1/1", "0/0", "0/0"]),
+    ("c1", 30, "G", "T,C", ["1/2", "0/2", "./.", "1/1"]),
+    ("c1", 40, "T", "G", ["0/0", "0/0", "0/1", "./."]),
+]
+
+@pytest.fixture
+def mixed_vcf(make_vcf) :
+    return make_vcf("mixed.vcf", {"c1" : 100}, ["A", "B", "C", "D"], MIXED_RECORDS)
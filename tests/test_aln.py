@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:38:12
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:38:12
+
+import gzip
+
+import pysam
+
+from pgpy.core import aln as alnmod
+from pgpy.core.aln import aln_maker, snpmatrix_maker, SeqIOReference
+
+SEQUENCE = "CAGATTTTCATATTATGCAGAAAATCTACTTCGCCTGATACG"
+
+# two insertions at the same position (split multiallelic), SNP on the last base of TT>TAT
+RECORDS = [
+    ("c1", 20, "G", "GGG", ["1/1", "1/1"]),
+    ("c1", 20, "G", "GT", ["1/1", "0/0"]),
+    ("c1", 30, "TT", "TAT", ["1/1", "0/0"]),
+    ("c1", 31, "T", "A", ["1/1", "1/1"]),
+]
+
+def make_fasta(tmp_path) :
+    fasta = str(tmp_path / "ref.fa")
+    with open(fasta, "w") as f : f.write(">c1\n%s\n" %(SEQUENCE))
+    pysam.faidx(fasta)
+    return fasta
+
+def test_indels_overlapping_events(make_vcf, tmp_path) :
+    fasta = make_fasta(tmp_path)
+
+    vcf = make_vcf("indels.vcf", {"c1" : len(SEQUENCE)}, ["A", "B"], RECORDS)
+    aln = {record.id : str(record.seq) for record in aln_maker(vcf, fasta, "c1", indels=True)}
+
+    # A as built by the previous builder (string concatenation at each event)
+    assert aln["A_1"] == aln["A_2"] == "CAGATTTTCATATTATGCAGGGTAAAATCTACTAACGCCTGATACG"
+    assert aln["B_1"] == aln["B_2"] == "CAGATTTTCATATTATGCAGGG-AAAATCTACTA-CGCCTGATACG"
+
+def test_snpmatrix_invariant_counts(make_vcf, tmp_path, monkeypatch) :
+    # reference bases are counted by blocks
+    monkeypatch.setattr(alnmod, "REFERENCE_BLOCK", 5)
+    fasta = make_fasta(tmp_path)
+
+    records = [("c1", 4, "A", "C", ["0/1", "0/0"]), ("c1", 17, "G", "T", ["1/1", "0/0"])]
+    vcf = make_vcf("snps.vcf", {"c1" : len(SEQUENCE)}, ["A", "B"], records)
+
+    aln, positions, counts = snpmatrix_maker(vcf, reference=fasta, index=True)
+    assert positions == [("c1", 4), ("c1", 17)]
+    assert counts == {base : SEQUENCE.count(base) - (base in "AG") for base in "ACGT"}
+
+    aln, positions, counts = snpmatrix_maker(vcf, "c1", 10, 30, reference=fasta, index=True)
+    assert counts == {base : SEQUENCE[10:30].count(base) - (base == "G") for base in "ACGT"}
+
+def test_snpmatrix_seqio_reference(make_vcf, tmp_path) :
+    # fallback reader gives the same counts as the indexed fasta
+    fasta = make_fasta(tmp_path)
+
+    records = [("c1", 4, "A", "C", ["0/1", "0/0"]), ("c1", 17, "G", "T", ["1/1", "0/0"])]
+    vcf = make_vcf("snps.vcf", {"c1" : len(SEQUENCE)}, ["A", "B"], records)
+
+    expected = snpmatrix_maker(vcf, reference=fasta, index=True)[2]
+    assert snpmatrix_maker(vcf, reference=SeqIOReference(fasta), index=True)[2] == expected
+
+def test_gzip_reference(make_vcf, tmp_path) :
+    # gzip (not bgzip) fasta, read with SeqIOReference
+    fasta = str(tmp_path / "ref.fa.gz")
+    with gzip.open(fasta, "wt") as f : f.write(">c1\n%s\n" %(SEQUENCE))
+
+    vcf = make_vcf("indels.vcf", {"c1" : len(SEQUENCE)}, ["A", "B"], RECORDS)
+    aln = {record.id : str(record.seq) for record in aln_maker(vcf, fasta, "c1", indels=True)}
+    expected = {record.id : str(record.seq) for record in aln_maker(vcf, make_fasta(tmp_path), "c1", indels=True)}
+    assert aln == expected
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:44:26
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:44:26
+
+import os
+
+from pgpy import VCFIterator
+from pgpy.core.cache import ResultCache, GTCache, AlleleColumns
+from pgpy.core.processing import apply_mp_contig
+from pgpy.recipes.divergence import ref_divergence
+
+# contigs over several compressed blocks, the last records of c1 share a block with c2
+CONTIGS = {"c1" : 100000, "c2" : 100000, "c3" : 100000}
+
+def records(gt) :
+    return [(contig, pos, "A", "C", [gt if (contig, pos) == ("c1", 99990) else "0/0", "1/1"])
+        for contig in CONTIGS for pos in range(10, 100000, 10)]
+
+def test_result_cache_edited_record(make_vcf, tmp_path) :
+    cache = ResultCache(str(tmp_path / "results"))
+
+    vcf = make_vcf("edit.vcf", CONTIGS, ["A", "B"], records("0/0"))
+    first = apply_mp_contig(vcf, ref_divergence, ncore=1, result_cache=cache)
+    assert first["c1"].set_index("sample")["diff"].to_dict() == {"A" : 0, "B" : 9999}
+
+    # one genotype called again, the offsets of the c1 index entries do not change
+    vcf = make_vcf("edit.vcf", CONTIGS, ["A", "B"], records("0/1"))
+    second = apply_mp_contig(vcf, ref_divergence, ncore=1, result_cache=cache)
+    assert second["c1"].set_index("sample")["diff"].to_dict() == {"A" : 1, "B" : 9999}
+    assert second["c3"].equals(first["c3"])
+
+    # c3 is found in the cache, c1 and c2 (shared block) are stored again
+    assert len(os.listdir(cache.directory)) == 5
+
+def chunks_values(chunks) :
+    return [(chunk.contig, chunk.positions.tolist(), list(chunk.refs), [[alt for alt in alts if alt is not None] for alts in chunk.alts],
+        chunk.gts.tolist()) for chunk in chunks]
+
+def test_gtcache_regions(make_vcf, tmp_path, monkeypatch) :
+    # a long deletion overlaps the region start, selected sites are not consecutive
+    records = [("c1", pos, "A", "C,G" if pos % 3 else "T", [["0/1", "1/1"], ["0/2", "./."]][pos % 2]) for pos in range(10, 2000, 10)]
+    records[5] = ("c1", 60, "A" * 500, "A", ["0/1", "0/0"])
+    vcf = make_vcf("gtcache.vcf", {"c1" : 2000}, ["A", "B"], records)
+
+    reads = []
+    read = AlleleColumns.read
+    monkeypatch.setattr(AlleleColumns, "read", lambda self, f, first, last : reads.append(last - first) or read(self, f, first, last))
+
+    plain, cached = VCFIterator(vcf), VCFIterator(vcf, cache=GTCache(str(tmp_path / "gts")))
+    for region, chunk_size in (((), 7), (("c1", 300, 700), 16), (("c1", 300, 700), 3)) :
+        expected = chunks_values(plain.fetch_matrix(* region, chunk_size=chunk_size))
+        reads.clear()
+        assert chunks_values(cached.fetch_matrix(* region, chunk_size=chunk_size)) == expected
+
+        # only the selected sites are decoded
+        assert sum(reads) == sum(len(positions) for contig, positions, refs, alts, gts in expected)
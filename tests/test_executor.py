@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:31:08
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:31:08
+
+import numpy as np
+import pytest
+
+from pgpy import PyVCFError
+from pgpy.core.executor import Executor, PoolExecutor, get_executor
+from pgpy.core.processing import apply_mp_contig
+from pgpy.recipes.divergence import ref_divergence
+
+def square(value) :
+    return value, {"array" : np.full((400, 400), value, dtype=np.float64)}
+
+def fail(value) :
+    if value == 3 : raise ValueError("task %i" %(value))
+    return value
+
+@pytest.mark.parametrize("name", ["serial", "thread", "process", "pool"])
+def test_executors(name) :
+    # results in any order, large arrays are sent back through shared memory
+    executor = PoolExecutor(2) if name == "pool" else get_executor(name, 2)
+
+    with executor :
+        results = dict(executor.imap(square, [(value, ) for value in range(5)]))
+        assert sorted(results) == list(range(5))
+        assert all((result["array"] == value).all() for value, result in results.items())
+
+        with pytest.raises(ValueError, match="task 3") :
+            list(executor.imap(fail, [(value, ) for value in range(5)]))
+
+def test_executor_results(mixed_vcf) :
+    expected = apply_mp_contig(mixed_vcf, ref_divergence, ncore=1)
+
+    with PoolExecutor(2) as pool :
+        for executor in ("thread", "process", pool) :
+            results = apply_mp_contig(mixed_vcf, ref_divergence, ncore=2, executor=executor)
+            assert results.keys() == expected.keys()
+            assert all(results[contig].equals(expected[contig]) for contig in expected)
+
+def test_executor_interface() :
+    with pytest.raises(PyVCFError) : get_executor("mpi")
+
+    class NoImap(Executor) :
+        pass
+
+    # missing methods are found when the executor is created, not when it is used
+    with pytest.raises(TypeError, match="imap") : NoImap()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:02:51
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:02:51
+
+import pickle
+
+import pytest
+
+from pgpy import VCFIterator, PyVCFError
+from pgpy.core.gtfilter import GenotypeFilter, Condition, parse_condition
+
+HEADER = """##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">
+##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">
+##FILTER=<ID=LowQual,Description="Low quality">
+"""
+
+RECORDS = [
+    ("c1", 10, "A", "C", ["0/1:12:6,6", "1/1:4:0,4", "0/0:.:."]),
+    ("c1", 20, "G", "T", ["0/1:30:28,2", "0/0:25:25,0", "1/1:9:0,9"], "10", "PASS"),
+    ("c1", 30, "T", "A", ["1/1:40:0,40", "0/1:40:20,20", "0/0:40:40,0"], "60", "LowQual"),
+]
+
+@pytest.fixture
+def depth_vcf(make_vcf) :
+    return make_vcf("depth.vcf", {"c1" : 100}, ["A", "B", "C"], RECORDS, header=HEADER, fmt="GT:DP:AD")
+
+def test_parse_condition() :
+    assert parse_condition("FMT/AD[1] >= 3") == Condition("FORMAT", "AD", 1, ">=", 3.)
+    assert parse_condition("INFO/MQ<40") == Condition("INFO", "MQ", None, "<", 40.)
+    assert parse_condition("FILTER=PASS") == Condition("FILTER", "FILTER", None, "==", "PASS")
+    assert parse_condition("QUAL>30").scope == "QUAL"
+
+    for text in ("DP>=", "FILTER>1", "GQ>=high") :
+        with pytest.raises(PyVCFError) : parse_condition(text)
+
+def test_unknown_field(depth_vcf) :
+    # a typo would mask every genotype
+    with pytest.raises(PyVCFError, match="GQ") : VCFIterator(depth_vcf, gtfilter="GQ>=10")
+    with pytest.raises(PyVCFError, match="MQ") : VCFIterator(depth_vcf, gtfilter=["DP>=10", "INFO/MQ>=10"])
+
+def test_format_and_site_conditions(depth_vcf) :
+    # DP and AD per genotype, QUAL and FILTER mask whole sites
+    vcf = VCFIterator(depth_vcf, gtfilter="DP>=10 & AD[1]>=2")
+    gts = next(vcf.fetch_matrix()).gts[:, :, 0].tolist()
+    assert gts == [[0, -1, -1], [0, -1, -1], [1, 0, -1]]
+
+    vcf = VCFIterator(depth_vcf, gtfilter=GenotypeFilter("QUAL>=20", "FILTER=PASS", missing=True))
+    assert next(vcf.fetch_matrix()).gts[:, :, 0].tolist() == [[0, 1, 0], [-1, -1, -1], [-1, -1, -1]]
+    assert [position for contig, position, ref, variants in vcf.fetch() if any(alt for alts in variants.values() for alt in alts)] == [10]
+
+def test_fetch_paths_and_pickle(depth_vcf) :
+    vcf = VCFIterator(depth_vcf, gtfilter="DP>=10")
+    fetched = [variants for contig, position, ref, variants in vcf.fetch()]
+    sites = [site.variants() for site in vcf.fetch_sites()]
+    assert fetched == sites and fetched[0]["B"] == (None, None)
+
+    copy = pickle.loads(pickle.dumps(vcf))
+    assert repr(copy.gtfilter) == repr(vcf.gtfilter) == "GenotypeFilter(DP>=10.0, missing=False)"
+    assert [variants for contig, position, ref, variants in copy.fetch()] == fetched
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:53:02
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:53:02
+
+import numpy as np
+
+from pgpy import VCFIterator
+from pgpy.core.scan import fused_scan, scan_region
+from pgpy.recipes.heterozygosity import homhet_window, HomHetAccumulator
+
+def test_homhet_string_modifier(mixed_vcf) :
+    df = homhet_window(VCFIterator(mixed_vcf, VCFIterator.no_indel_modifier), snp_modifier=False).set_index("sample")
+
+    # missing alleles are dropped as fetch does, ./1 is homozygous
+    assert df.loc["D", "hom"] == 3 and df.loc["D", "het"] == 0 and df.loc["D", "missing"] == 1
+    # AT is compared on its first base
+    assert df.loc["A", "het"] == 2 and df.loc["A", "hom"] == 2
+
+def test_homhet_custom_modifier(mixed_vcf) :
+    # read with fetch, samples without alleles after the modifier are not counted
+    vcf = VCFIterator(mixed_vcf, lambda alts, site : tuple(alt for alt in alts if alt != "C"))
+    df = homhet_window(vcf, snp_modifier=False).set_index("sample")
+
+    assert df[["hom", "het", "missing"]].values.tolist() == [[3, 1, 0], [3, 0, 0], [2, 1, 1], [2, 0, 2]]
+    # AT is compared on its first base
+    assert homhet_window(vcf).set_index("sample")[["hom", "het", "missing"]].values.tolist() == [[4, 0, 0], [3, 0, 0], [2, 1, 1], [2, 0, 2]]
+
+def test_homhet_shards(make_vcf) :
+    records = [("c1", pos, "A", "C", [["0/1", "1/1"], ["0/0", "./."], ["1/1", "0/1"]][pos % 3]) for pos in range(100, 90000, 997)]
+    vcf = make_vcf("shards.vcf", {"c1" : 10 ** 8}, ["A", "B"], records)
+
+    # counts only cover the windows seen, not the contig length
+    accumulator = scan_region(VCFIterator(vcf), {"homhet" : HomHetAccumulator(1000)}, "c1", 50000)["homhet"]
+    assert accumulator.bounds["c1"] == (50, 90)
+    assert accumulator.counts["c1"].dtype == np.int32
+
+    key = ["sample", "window"]
+    serial = homhet_window(vcf, wsize=1000).sort_values(key).reset_index(drop=True)
+    sharded = fused_scan(vcf, {"homhet" : HomHetAccumulator(1000)}, nshards=4)["homhet"]
+    assert sharded.sort_values(key).reset_index(drop=True).equals(serial)
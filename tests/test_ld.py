@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:14:37
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:14:37
+
+import random
+
+import numpy as np
+import pytest
+
+from pgpy.core.cache import ResultCache
+from pgpy.recipes.ld import ld_pairs, ld_decay
+
+GENOTYPES = ["0/0", "0/1", "1/1", "./."]
+SAMPLES = ["S%i" %(idx) for idx in range(12)]
+
+@pytest.fixture
+def snps_vcf(make_vcf) :
+    # biallelic snps with missing genotypes, one multiallelic site and one indel
+    rng = random.Random(7)
+    records = []
+
+    for contig in ("c1", "c2") :
+        for pos in sorted(rng.sample(range(1, 5000), 120)) :
+            gts = rng.choices(GENOTYPES, weights=[5, 3, 2, 1], k=len(SAMPLES))
+            records.append((contig, pos, "A", "C", gts))
+
+    records[10] = records[10][:3] + ("C,G", ) + records[10][4:]
+    records[20] = records[20][:3] + ("AT", ) + records[20][4:]
+    return make_vcf("snps.vcf", {"c1" : 5000, "c2" : 5000}, SAMPLES, records), records
+
+def brute_force(records, maxdist) :
+    # r2 of each pair of biallelic snps from np.corrcoef over the samples called at both sites
+    snps = [(contig, pos, gts) for contig, pos, ref, alts, gts in records if alts == "C"]
+    result = {}
+
+    for idx, (contig, pos2, gts2) in enumerate(snps) :
+        for contig1, pos1, gts1 in snps[:idx] :
+            if contig1 != contig or not 0 < pos2 - pos1 <= maxdist : continue
+
+            called = [(gt1.count("1"), gt2.count("1")) for gt1, gt2 in zip(gts1, gts2) if "." not in gt1 + gt2]
+            if len(called) < 2 : continue
+
+            x, y = np.array(called, dtype=float).T
+            if x.var() == 0 or y.var() == 0 : continue
+            result[(contig, pos1, pos2)] = np.corrcoef(x, y)[0, 1] ** 2
+
+    return result
+
+def test_ld_pairs_brute_force(snps_vcf) :
+    vcf, records = snps_vcf
+    expected = brute_force(records, 500)
+
+    df = ld_pairs(vcf, maxdist=500, block=16)
+    result = {(row.contig, row.pos1, row.pos2) : row.r2 for row in df.itertuples()}
+
+    assert len(expected) > 100 and set(result) == set(expected)
+    assert np.allclose([result[key] for key in expected], list(expected.values()))
+
+def test_ld_decay_shards(snps_vcf, tmp_path) :
+    vcf, records = snps_vcf
+    serial = ld_decay(vcf, maxdist=1000, binsize=100)
+    sharded = ld_decay(vcf, maxdist=1000, binsize=100, nshards=5, ncore=1)
+
+    assert serial[["start", "end", "pairs"]].equals(sharded[["start", "end", "pairs"]])
+    assert np.allclose(serial.r2, sharded.r2, equal_nan=True)
+
+    # apply_mp_shards arguments are ignored by a serial run
+    cached = ld_decay(vcf, maxdist=1000, binsize=100, result_cache=ResultCache(str(tmp_path / "results")), executor="serial")
+    assert cached.equals(serial)
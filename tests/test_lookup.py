@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:46:19
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:46:19
+
+import pytest
+
+from pgpy import VCFIterator, PyVCFError
+from pgpy.core.lookup import lookup
+
+RECORDS = [("c1", pos, "A", "C", ["0/1", "1/1"]) for pos in range(100, 5000, 100)] + [
+    ("c1", 5000, "AAAAAAAAAA", "A", ["0/1", "0/0"]), # overlaps the following positions
+    ("c2", 50, "G", "T", ["./.", "0/1"]),
+]
+
+@pytest.fixture
+def lookup_vcf(make_vcf) :
+    return make_vcf("lookup.vcf", {"c1" : 6000, "c2" : 100}, ["A", "B"], RECORDS)
+
+class CountingFile() :
+
+    # VariantFile counting its fetch calls
+
+    def __init__(self, vfile) :
+        self.vfile, self.header, self.calls = vfile, vfile.header, 0
+
+    def fetch(self, * args, ** kwargs) :
+        self.calls += 1
+        return self.vfile.fetch(* args, ** kwargs)
+
+def positions(results) :
+    return [(contig, position, record.pos if record is not None else None) for contig, position, record in results]
+
+def test_lookup_positions(lookup_vcf) :
+    vcf = VCFIterator(lookup_vcf)
+    queries = [("c1", 100), ("c1", 150), ("c1", 300), ("c1", 4900), ("c1", 5003), ("c2", 50), ("c3", 10)]
+    expected = [("c1", 100, 100), ("c1", 150, None), ("c1", 300, 300), ("c1", 4900, 4900), ("c1", 5003, None), ("c2", 50, 50), ("c3", 10, None)]
+
+    # nearby queries share a single scan
+    for maxgap, calls in ((10000, 2), (100, 5)) :
+        vfile = CountingFile(vcf.vcf)
+        assert positions(lookup(vfile, queries, maxgap)) == expected
+        assert vfile.calls == calls
+
+    # same records as search_pos
+    for contig, position, record in vcf.search_positions([(contig, position) for contig, position, found in expected if found]) :
+        assert str(record) == str(vcf.search_pos(contig, position))
+
+    variants = [variants for contig, position, variants in vcf.search_positions([("c2", 50), ("c2", 60)], alts=True)]
+    assert variants == [{"A" : (None, None), "B" : ("G", "T")}, None]
+
+def test_lookup_bed(lookup_vcf, tmp_path) :
+    bed = tmp_path / "regions.bed"
+    bed.write_text("track name=test\nc1\t250\t500\nc1\t4999\t5010\nc2\t0\t10\n")
+
+    vcf = VCFIterator(lookup_vcf)
+    assert positions(vcf.search_positions(str(bed))) == [("c1", 300, 300), ("c1", 400, 400), ("c1", 500, 500), ("c1", 5000, 5000)]
+
+    with pytest.raises(PyVCFError) : list(vcf.search_positions([("c1", 1, 2, 3)]))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:51:30
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:51:30
+
+from collections import Counter
+
+import pytest
+
+from pgpy import VCFIterator
+from pgpy.recipes.maf import maf
+
+MODIFIERS = [VCFIterator.no_indel_modifier, VCFIterator.only_variable_modifier, VCFIterator.fill_values, VCFIterator.iupac_modifier]
+
+def fetch_maf(vcf) :
+    # (sample size, minor count) -> sites, from the alleles given by fetch
+    table = Counter()
+    for contig, position, ref, variants in vcf.fetch() :
+        counts = Counter(alt for alts in variants.values() for alt in alts if alt is not None)
+        if len(counts) > 1 : table[(sum(counts.values()), min(counts.values()))] += 1
+    return dict(table)
+
+@pytest.mark.parametrize("modifier", MODIFIERS)
+def test_maf_string_modifier(mixed_vcf, modifier) :
+    df = maf(VCFIterator(mixed_vcf, modifier), snps=False)
+    result = {(row.SampleSize, row.SampleCount) : row.AlleleCount for row in df.itertuples()}
+    assert result == fetch_maf(VCFIterator(mixed_vcf, modifier))
+
+def test_custom_string_modifier(mixed_vcf) :
+    # no chunk equivalent, sites are read with fetch
+    vcf = VCFIterator(mixed_vcf, lambda alts, site : tuple(alt for alt in alts if alt != "C"))
+    df = maf(vcf, snps=False)
+    result = {(row.SampleSize, row.SampleCount) : row.AlleleCount for row in df.itertuples()}
+    assert result == fetch_maf(vcf)
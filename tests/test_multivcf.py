@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:26:41
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:26:41
+
+import numpy as np
+
+from pgpy import VCFIterator
+from pgpy.core.processing import apply_mp_contig
+from pgpy.recipes.maf import maf
+from pgpy.recipes.divergence import ref_divergence_wg
+
+SAMPLES = ["A", "B", "C"]
+CONTIGS = {"c1" : 1000, "c2" : 1000}
+
+RECORDS = [(contig, pos, "A", "C", [["0/1", "1/1", "0/0"], ["0/0", "0/1", "1/1"]][pos % 2])
+    for contig in CONTIGS for pos in range(10, 500, 7)]
+
+def contig_sites(vcf, contig) :
+    return sum(1 for site in vcf.fetch(contig))
+
+def test_list_of_files(make_vcf) :
+    # one file per contig read as a single vcf
+    whole = make_vcf("all.vcf", CONTIGS, SAMPLES, RECORDS)
+    parts = [make_vcf("%s.vcf" %(contig), CONTIGS, SAMPLES, [record for record in RECORDS if record[0] == contig])
+        for contig in CONTIGS]
+
+    assert apply_mp_contig(parts, contig_sites) == apply_mp_contig(whole, contig_sites)
+    assert maf(parts).equals(maf(whole))
+
+    expected = ref_divergence_wg(whole, nshards=4)
+    result = ref_divergence_wg(parts, nshards=4)
+    assert np.allclose(np.asarray(result, dtype=float), np.asarray(expected, dtype=float))
+    assert len(list(VCFIterator(parts).fetch())) == len(RECORDS)
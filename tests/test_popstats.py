@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 20:14:05
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 20:14:05
+
+from pgpy.recipes.popstats import window_stats
+
+def test_windows_past_last_site(make_vcf) :
+    # contig length from the header goes well past the last site
+    records = [("c1", pos, "A", "C", ["0/1", "1/1", "0/0"]) for pos in (10, 12, 20, 30, 51)]
+    vcf = make_vcf("long.vcf", {"c1" : 100000}, ["A", "B", "C"], records)
+
+    df = window_stats(vcf, size=10000)
+    assert len(df) == 10 and df.end.max() == 100000
+    assert df.variants.tolist() == [5] + [0] * 9
+
+    df = window_stats(vcf, size=10000, step=3000)
+    assert df.start.max() == 99000 and df.variants.sum() == 5
+
+def test_windows_boundaries(make_vcf) :
+    # 1-based positions : the window [90, 100) holds positions 91 to 100
+    records = [("c1", pos, "A", "C", ["0/1", "1/1", "0/0"]) for pos in (10, 11, 90, 100)]
+    vcf = make_vcf("bounds.vcf", {"c1" : 100}, ["A", "B", "C"], records)
+
+    df = window_stats(vcf, size=10)
+    assert len(df) == 10 and df.end.max() == 100
+    assert df.variants.tolist() == [1, 1, 0, 0, 0, 0, 0, 0, 1, 1]
+
+    df = window_stats(vcf, size=20, step=10)
+    assert df.start.tolist() == list(range(0, 100, 10)) and df.end.tolist()[-2:] == [100, 100]
+    assert df.variants.tolist() == [2, 1, 0, 0, 0, 0, 0, 1, 2, 1]
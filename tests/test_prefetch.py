@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 22:37:52
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 22:37:52
+
+import threading
+
+import pytest
+
+from pgpy import VCFIterator
+from pgpy.core.prefetch import prefetched
+
+def chunks_values(chunks) :
+    return [(chunk.contig, chunk.positions.tolist(), chunk.gts.tolist()) for chunk in chunks]
+
+def test_prefetch_fetch(mixed_vcf, monkeypatch) :
+    # several batches, the last one incomplete
+    monkeypatch.setattr(VCFIterator, "PREFETCH_BATCH", 3)
+    plain, vcf = VCFIterator(mixed_vcf), VCFIterator(mixed_vcf)
+    vcf.prefetch = 2
+
+    assert list(vcf.fetch()) == list(plain.fetch())
+    assert [site.as_tuple() for site in vcf.fetch_sites("c1", 15, 100)] == [site.as_tuple() for site in plain.fetch_sites("c1", 15, 100)]
+    assert chunks_values(vcf.fetch_matrix(chunk_size=3)) == chunks_values(plain.fetch_matrix(chunk_size=3))
+
+def test_prefetched_errors_and_close() :
+    def values() :
+        yield from range(5)
+        raise ValueError("producer")
+
+    with pytest.raises(ValueError, match="producer") : list(prefetched(values(), depth=1, batch=2))
+
+    # an unfinished iteration stops the thread once closed
+    threads = threading.active_count()
+    iterator = prefetched(iter(range(10 ** 6)), depth=2, batch=10)
+    assert next(iterator) == 0
+    iterator.close()
+    assert threading.active_count() == threads
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:31:14
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:31:14
+
+import pytest
+
+from pgpy import VCFIterator, PyVCFError
+from pgpy.core.scan import Accumulator, scan_region, fused_scan
+from pgpy.recipes.maf import SFSAccumulator
+from pgpy.recipes.divergence import RefDivAccumulator, PairwiseDivAccumulator
+from pgpy.recipes.popstats import WindowStatsAccumulator
+
+class SitesAccumulator(Accumulator) :
+
+    # number of sites read by fetch_matrix and fetch
+
+    def __init__(self) :
+        self.chunks, self.sites = 0, []
+
+    def update(self, chunk) :
+        self.chunks += chunk.nsites
+
+    def update_site(self, contig, position, ref, variants) :
+        self.sites.append((position, variants))
+
+    def merge(self, other) :
+        self.chunks += other.chunks
+        self.sites += other.sites
+        return self
+
+    def result(self) :
+        return self.chunks, self.sites
+
+def test_fused_scan_shards(make_vcf) :
+    records = [(contig, pos, "A", "C,G", [["0/1", "1/1", "0/2"], ["0/0", "./.", "1/2"], ["2/2", "0/1", "0/0"]][pos % 3])
+        for contig in ("c1", "c2") for pos in range(10, 2000, 13)]
+    vcf = make_vcf("fused.vcf", {"c1" : 2000, "c2" : 2000}, ["A", "B", "C"], records)
+
+    accumulators = {"sfs" : SFSAccumulator(), "ref" : RefDivAccumulator(), "pairs" : PairwiseDivAccumulator(), "sites" : SitesAccumulator()}
+    serial = fused_scan(vcf, accumulators)
+    sharded = fused_scan(vcf, accumulators, nshards=5)
+
+    assert serial["sites"][0] == len(records)
+    for name in ("sfs", "ref", "pairs") :
+        assert serial[name].reset_index(drop=True).equals(sharded[name].reset_index(drop=True))
+
+def test_custom_string_modifier(mixed_vcf) :
+    # sites are read with fetch and update_site, chunk based accumulators are rejected
+    vcf = VCFIterator(mixed_vcf, lambda alts, site : tuple(alt for alt in alts if alt != "A"))
+
+    chunks, sites = scan_region(vcf, {"sites" : SitesAccumulator()})["sites"].result()
+    assert chunks == 0 and sites == [(position, variants) for contig, position, ref, variants in vcf.fetch()]
+    assert fused_scan(vcf, {"sites" : SitesAccumulator()}, nshards=2)["sites"][1] == sites
+
+    with pytest.raises(PyVCFError, match="stats") :
+        fused_scan(vcf, {"sites" : SitesAccumulator(), "stats" : WindowStatsAccumulator(size=10)})
+
+def test_accumulator_interface() :
+    class NoResult(Accumulator) :
+        def update(self, chunk) : pass
+        def merge(self, other) : return self
+
+    # update_site is optional
+    with pytest.raises(TypeError, match="result") : NoResult()
+    assert SitesAccumulator().fetch_based()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# @Author: jsgounot
+# @Date:   2026-10-18 21:05:47
+# @Last modified by:   jsgounot
+# @Last Modified time: 2026-10-18 21:05:47
+
+import pytest
+
+from pgpy import VCFIterator, PyVCFError
+
+def test_gt_array_allele_index() :
+    gts = VCFIterator.gt_array([[(0, 127), (None, 1)]], 2, 2)
+    assert gts.tolist() == [[[0, 127], [-1, 1]]]
+
+    # would be read as missing (-1) once cast to int8
+    with pytest.raises(PyVCFError) : VCFIterator.gt_array([[(0, 255), (0, 0)]], 2, 2)
+
+def test_fetch_sites(mixed_vcf) :
+    vcf = VCFIterator(mixed_vcf)
+    sites = list(vcf.fetch_sites())
+    assert [site.as_tuple() for site in sites] == list(vcf.fetch())
+    assert repr(sites[2]) == "Site(c1, 30, G, T,C)"
+
+    # samples by name or index, decoded on demand
+    site = sites[0]
+    assert site.alleles("D") == (None, "C") and site.alleles(0) == ("A", "C")
+    assert site.allele_counts().tolist() == [3, 4]
+    with pytest.raises(PyVCFError, match="E") : site.alleles("E")
+
+    # same genotypes as fetch_matrix
+    gts = next(vcf.fetch_matrix()).gts
+    assert all((site.allele_indices(ploidy=2) == row).all() for site, row in zip(sites, gts))
+
+def test_fetch_sites_modifier(mixed_vcf) :
+    # sites where the modifier removes every sample are skipped by fetch only
+    vcf = VCFIterator(mixed_vcf, modifier=lambda alts, site : () if site.pos == 40 else alts[:1])
+    sites = list(vcf.fetch_sites())
+
+    assert [site.pos for site in sites] == [10, 20, 30, 40] and sites[-1].variants() == {}
+    assert [site.as_tuple() for site in sites[:3]] == list(vcf.fetch())
+    assert sites[2].alleles("A") == ("T", )